@@ -1,4 +1,5 @@
 ''' A collection of classes for reading and writing FASTA files. '''
 
-from .reader import SingleBlockReader, MultipleBlockReader, MultipleBlockStreamingReader, FormatError
+from .reader import SingleBlockReader, MultipleBlockReader, BgzfMultipleBlockReader, MultipleBlockStreamingReader, FormatError, INDEX_SUFFIX, FAI_SUFFIX
 from .writer import SingleBlockWriter
+from .twobit import TwoBitReader, write_twobit, fasta_to_twobit
@@ -2,6 +2,7 @@ from optparse import OptionParser
 from sys import stdin
 
 from vfork.fasta.reader import MultipleBlockStreamingReader, FormatError
+from vfork.io.compression import open_input
 from vfork.util import exit, format_usage
 from vfork.util import ignore_broken_pipe
 
@@ -13,6 +14,8 @@ def main():
     Converts a FASTA file into a TSV file with two columns:
     1) label
     2) sequence
+
+    The input may be compressed with gzip, bgzip, bzip2, xz or zstd.
     '''))
 
     parser.add_option('-e', '--allow-empty', dest='allow_empty', default=False, action='store_true',
@@ -24,7 +27,7 @@ def main():
         exit('Unexpected argument number.')
 
     try:
-        for label, seq in MultipleBlockStreamingReader(stdin, join_lines=not options.multi):
+        for label, seq in MultipleBlockStreamingReader(open_input(stdin), join_lines=not options.multi):
             if options.multi:
                 seq = list(seq)
 
@@ -0,0 +1,34 @@
+from optparse import OptionParser
+from sys import stdin
+
+from vfork.fasta.reader import FormatError
+from vfork.fasta.twobit import fasta_to_twobit
+from vfork.io.compression import open_input
+from vfork.util import exit, format_usage, ignore_broken_pipe
+
+
+def main():
+    parser = OptionParser(usage=format_usage('''
+    Usage: %prog OUTPUT <FASTA
+
+    Converts a FASTA file into the UCSC .2bit format.
+
+    Symbols other than A, C, G, T and N are stored as N;
+    lower case runs are stored as soft-masked regions.
+
+    The input may be compressed with gzip, bgzip, bzip2, xz or zstd.
+    '''))
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        exit('Unexpected argument number.')
+
+    try:
+        fasta_to_twobit(open_input(stdin), args[0])
+    except FormatError as e:
+        exit('Malformed FASTA input: ' + e.args[0])
+    except ValueError as e:
+        exit('Cannot convert FASTA input: ' + str(e))
+
+
+if __name__ == '__main__':
+    ignore_broken_pipe(main)
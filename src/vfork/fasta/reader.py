@@ -1,8 +1,25 @@
-from io import StringIO
+from collections import OrderedDict
+from io import StringIO, RawIOBase, BufferedIOBase
 from mmap import mmap, ACCESS_READ
+from multiprocessing import Pool
 from os import fstat, SEEK_SET
-from ..sequence import make_sequence_filter
-from ..io.util import safe_rstrip
+from ..sequence import make_sequence_filter, make_bytes_sequence_filter, reverse_complement
+from ..io.bgzf import BgzfReader, GZI_SUFFIX
+from ..io.compression import open_input
+from ..io.util import safe_rstrip, write_atomically
+
+
+#: Suffix appended to the path of a FASTA file to obtain the path of its block index.
+INDEX_SUFFIX = '.vfi'
+_INDEX_MAGIC = '#vfork-fasta-index'
+_INDEX_VERSION = 2
+#: Suffix identifying indexes in the samtools faidx format.
+FAI_SUFFIX = '.fai'
+
+_CHUNKS_PER_PROCESS = 4
+_COUNT_CHUNK_SIZE = 16 * 1024 * 1024
+_SMALL_BLOCK_SIZE = 1024
+_STREAM_CHUNK_SIZE = 4 * 1024 * 1024
 
 
 class RandomAccessSequence(object):
@@ -63,11 +80,11 @@ class RandomAccessSequence(object):
 		    @return: the converted (start, stop) range.
 		'''
 		content_per_line = line_len - newline_len
-		rows = start / content_per_line
+		rows = start // content_per_line
 		excess = start % content_per_line
 		fasta_start = rows * line_len + excess
 
-		rows = stop / content_per_line
+		rows = stop // content_per_line
 		excess = stop % content_per_line
 		fasta_stop = rows * line_len + excess
 
@@ -158,20 +175,80 @@ class SingleBlockReader(RandomAccessSequence):
 		return (row_num * (self.line_len - self.newline_len)) + max(excess - self.newline_len, 0)
 
 class MultipleBlockReader(RandomAccessSequence):
-	def __init__(self, filename, force_lower=False, index=None):
+	''' Random access reader for files containing multiple blocks.
+
+	    Locating the blocks requires a full scan of the file. To avoid
+	    repeating it every time, the reader saves the result in a sidecar
+	    index (by default, the path of the FASTA file followed by
+	    L{INDEX_SUFFIX}) and reuses it as long as the size and the
+	    modification time of the FASTA file don't change.
+
+	    Indexes whose path ends with L{FAI_SUFFIX} are read and written
+	    in the samtools faidx format instead. In this case, as samtools
+	    does, blocks are labelled by the first word of their header.
+	    Moreover, since faidx indexes don't record the state of the FASTA
+	    file, they are considered out of date only if older than the
+	    FASTA file itself.
+
+	    Blocks sliced repeatedly may be kept in memory, with line
+	    terminators already removed. The cache is disabled by default;
+	    when enabled, a block is loaded the second time it is sliced and
+	    the least recently used blocks are evicted to stay within the
+	    configured budget. The B{block_cache_hits} and
+	    B{block_cache_misses} properties count the slices served with and
+	    without the cache, respectively.
+	'''
+
+	def __init__(self, filename, force_lower=False, index=None, save_index=True, block_cache_size=0, index_processes=1):
+		''' Object constructor.
+
+		    @param filename: the path of the file to read.
+		    @param force_lower: wheter to force all symbols to lower case.
+		    @param index: the path of the block index. If B{None}, the
+		                  FASTA path followed by L{INDEX_SUFFIX} is used.
+		                  Paths ending with L{FAI_SUFFIX} refer to faidx
+		                  indexes.
+		    @param save_index: whether to write the index when it is missing
+		                       or out of date.
+		    @param block_cache_size: the maximum number of sequence symbols
+		                             kept in the block cache (0 disables it).
+		    @param index_processes: the number of processes used to build
+		                            the index, when needed.
+		    @raises ValueError: if the FASTA file or the index are malformed.
+		'''
 		self.filename = filename
+		self.index_processes = index_processes
 		self.sequence_filter = make_sequence_filter(force_lower, True)
+		self._forward_filter = make_bytes_sequence_filter(force_lower, True)
+		self._reverse_filter = make_bytes_sequence_filter(force_lower, True, reverse=True)
+
+		self.block_cache_size = block_cache_size
+		self.block_cache_hits = 0
+		self.block_cache_misses = 0
+		self._block_cache = OrderedDict()
+		self._block_cache_used = 0
+		self._block_uses = {}
 
 		self.fd = None
 		self.mf = None
+		self._map_view = None
 		self._open_map()
 		try:
-			if index:
-				self._load_index(index)
+			if isinstance(self.mf, mmap):
+				self._map_view = memoryview(self.mf)
+
+			if index is None:
+				index = filename + INDEX_SUFFIX
+
+			if index.endswith(FAI_SUFFIX):
+				load, save, label_filter = self._load_fai, self._save_fai, _fai_name
 			else:
-				self._build_index()
+				load, save, label_filter = self._load_index, self._save_index, None
 
-			self.line_len, self.newline_len = self._load_row_stat()
+			if not load(index):
+				self._build_index(label_filter)
+				if save_index:
+					save(index)
 		except:
 			self.close()
 			raise
@@ -184,11 +261,16 @@ class MultipleBlockReader(RandomAccessSequence):
 
 	def __getitem__(self, key):
 		if type(key) == int:
-			return Block(self, key, *self.block_list[key][1:])
+			return Block(self, *self.block_list[key])
 		else:
 			return Block(self, key, *self.block_map[key])
 
 	def close(self):
+		self._block_cache.clear()
+		self._block_cache_used = 0
+		if self._map_view is not None:
+			self._map_view.release()
+			self._map_view = None
 		if self.mf is not None:
 			self.mf.close()
 			self.mf = None
@@ -200,12 +282,101 @@ class MultipleBlockReader(RandomAccessSequence):
 		return [ s[0] for s in self.block_list ]
 
 	def iter_blocks(self):
-		for label, size, start, bytes in self.block_list:
-			yield Block(self, label, size, start, bytes)
+		for block in self.block_list:
+			yield Block(self, *block)
+
+	def fetch_many(self, regions):
+		''' Retrieves several regions at once.
+
+		    Regions are read in file order, to reduce page faults (or member
+		    decompressions, on BGZF files), but results follow the input order.
+
+		    @param regions: an iterable over (label, start, stop) or
+		                    (label, start, stop, strand) tuples. The strand
+		                    is either '+' or '-'; for the latter, the reverse
+		                    complement of the region is returned.
+		    @return: a list of sequences.
+		    @raises KeyError: if a label is missing.
+		    @raises ValueError: if a strand is invalid.
+		'''
+		block_map = self.block_map
+		requests = []
+		for region in regions:
+			label, start, stop = region[0], region[1], region[2]
+			strand = region[3] if len(region) > 3 else '+'
+			if strand != '+' and strand != '-':
+				raise ValueError('invalid strand: %s' % strand)
+
+			size, offset, bytes, line_len, newline_len = block_map[label]
+			if stop > size:
+				stop = size
+			if start >= stop:
+				requests.append((-1, 0, strand, None))
+			elif line_len == 0:
+				requests.append((offset, 0, strand, (label, start, stop)))
+			else:
+				content_per_line = line_len - newline_len
+				file_start = offset + start // content_per_line * line_len + start % content_per_line
+				file_stop = offset + stop // content_per_line * line_len + stop % content_per_line
+				requests.append((file_start, file_stop, strand, None))
+
+		mf = self.mf
+		forward_filter = self._forward_filter
+		reverse_filter = self._reverse_filter
+		results = [ None ] * len(requests)
+		file_starts = [ r[0] for r in requests ]
+		for idx in sorted(range(len(requests)), key=file_starts.__getitem__):
+			file_start, file_stop, strand, irregular = requests[idx]
+			if file_start == -1:
+				results[idx] = ''
+			elif irregular is not None:
+				label, start, stop = irregular
+				seq = self[label][start:stop]
+				results[idx] = seq if strand == '+' else reverse_complement(seq)
+			elif strand == '+':
+				results[idx] = forward_filter(mf[file_start:file_stop])
+			else:
+				results[idx] = reverse_filter(mf[file_start:file_stop])
+
+		return results
+
+	def _cached_content(self, block):
+		''' Looks for a block in the cache, possibly adding it.
+
+		    @param block: a L{Block} instance.
+		    @return: the sequence of the block or B{None} if it is not cached.
+		'''
+		label = block.label
+		content = self._block_cache.get(label)
+		if content is not None:
+			self.block_cache_hits += 1
+			self._block_cache.move_to_end(label)
+			return content
+
+		self.block_cache_misses += 1
+		if block.size > self.block_cache_size:
+			return None
+
+		uses = self._block_uses.get(label, 0) + 1
+		if uses < 2:
+			self._block_uses[label] = uses
+			return None
+		del self._block_uses[label]
+
+		content = self._forward_filter(block.raw_content())
+		self._block_cache[label] = content
+		self._block_cache_used += len(content)
+		while self._block_cache_used > self.block_cache_size:
+			evicted = self._block_cache.popitem(last=False)[1]
+			self._block_cache_used -= len(evicted)
+
+		return content
 
 	def _open_map(self):
-		self.fd = file(self.filename, 'r')
-		self.file_size = fstat(self.fd.fileno()).st_size
+		self.fd = open(self.filename, 'rb')
+		stat = fstat(self.fd.fileno())
+		self.file_size = stat.st_size
+		self.file_mtime = stat.st_mtime_ns
 
 		self.mf = None
 		if self.file_size == 0:
@@ -217,112 +388,460 @@ class MultipleBlockReader(RandomAccessSequence):
 			self.fd.close()
 			raise
 
+	def _set_blocks(self, block_list):
+		self.block_list = block_list
+		self.block_map = dict((b[0], b[1:]) for b in block_list)
+
+	def _index_signature(self):
+		return '%s\t%d\t%d\t%d' % (_INDEX_MAGIC, _INDEX_VERSION, self.file_size, self.file_mtime)
+
 	def _load_index(self, filename):
-		self.block_list = []
-		self.block_map = {}
+		''' Loads a block index written by L{_save_index}.
 
-		with file(filename, 'r') as fd:
-			reader = Reader(fd, '0s,1u,2u,3u', False)
-			while True:
-				record = reader.readline()
-				if record is None:
-					break
+		    @param filename: the path of the index.
+		    @return: B{False} if the index is missing or refers to a different
+		             version of the FASTA file; B{True} otherwise.
+		    @raises ValueError: if the index is malformed.
+		'''
+		try:
+			fd = open(filename, 'r', encoding='utf-8')
+		except FileNotFoundError:
+			return False
+
+		with fd:
+			if safe_rstrip(fd.readline()) != self._index_signature():
+				return False
+
+			block_list = []
+			for lineno, line in enumerate(fd, 2):
+				# labels may contain tabs, so we split from the right
+				tokens = safe_rstrip(line).rsplit('\t', 5)
+				try:
+					if len(tokens) != 6: raise ValueError
+					block_list.append((tokens[0],) + tuple(int(t) for t in tokens[1:]))
+				except ValueError:
+					raise ValueError('malformed block index %s at line %d' % (filename, lineno))
+
+		self._set_blocks(block_list)
+		return True
+
+	def _save_index(self, filename):
+		''' Writes the block index.
+
+		    @param filename: the path of the index.
+		'''
+		lines = [ self._index_signature() ]
+		lines.extend('%s\t%d\t%d\t%d\t%d\t%d' % b for b in self.block_list)
+		write_atomically(filename, '\n'.join(lines) + '\n')
+
+	def _load_fai(self, filename):
+		''' Loads an index in the samtools faidx format.
+
+		    @param filename: the path of the index.
+		    @return: B{False} if the index is missing or older than the FASTA
+		             file; B{True} otherwise.
+		    @raises ValueError: if the index is malformed.
+		'''
+		try:
+			fd = open(filename, 'r', encoding='utf-8')
+		except FileNotFoundError:
+			return False
+
+		with fd:
+			if fstat(fd.fileno()).st_mtime_ns < self.file_mtime:
+				return False
+
+			block_list = []
+			for lineno, line in enumerate(fd, 1):
+				tokens = safe_rstrip(line).split('\t')
+				try:
+					if len(tokens) != 5: raise ValueError
+					size, start, line_bases, line_len = [ int(t) for t in tokens[1:] ]
+					if line_bases > line_len or (size > 0 and line_bases == 0): raise ValueError
+				except ValueError:
+					raise ValueError('malformed faidx index %s at line %d' % (filename, lineno))
+
+				newline_len = line_len - line_bases
+				if line_bases == 0:
+					bytes = 0
 				else:
-					# record[2] represents the offset of the FASTA header.
-					# To obtain the offset of the corresponding sequence we
-					# add the length of the label plus 2 (one for the heading '>'
-					# and another for the trailing \n)
-					delta = len(record[0]) + 2
-					start = record[2] + delta
-					bytes = record[3] - delta
-					self.block_list.append( (record[0], record[1], start, bytes) )
-					self.block_map[record[0]] = (record[1], start, bytes)
-
-	def _build_index(self):
-		self.block_list = []
-		self.block_map = {}
-
-		if self.mf[0] != '>':
+					rows, excess = divmod(size, line_bases)
+					bytes = rows * line_len + excess - (newline_len if excess == 0 and rows > 0 else 0)
+				if start + bytes > self.file_size:
+					raise ValueError('faidx index %s does not match FASTA file %s' % (filename, self.filename))
+
+				block_list.append((tokens[0], size, start, bytes, line_len, newline_len))
+
+		self._set_blocks(block_list)
+		return True
+
+	def _save_fai(self, filename):
+		''' Writes the block index in the samtools faidx format.
+
+		    The format cannot describe blocks with irregular line lengths:
+		    if the file has any, no index is written.
+
+		    @param filename: the path of the index.
+		'''
+		lines = []
+		for label, size, start, bytes, line_len, newline_len in self.block_list:
+			if line_len == 0 and size > 0:
+				return
+			lines.append('%s\t%d\t%d\t%d\t%d' % (label, size, start, line_len - newline_len, line_len))
+		write_atomically(filename, '\n'.join(lines) + '\n')
+
+	def _build_index(self, label_filter=None):
+		''' Scans the whole file to locate blocks.
+
+		    For each block, records:
+		      - the label;
+		      - the sequence size;
+		      - the offset of the first sequence line;
+		      - the number of bytes up to the last line terminator (excluded);
+		      - the length of sequence lines, terminator included;
+		      - the length of the line terminator.
+
+		    Line lengths may differ from one block to the other. Within a
+		    block, however, all lines but the last one must have the same
+		    length; otherwise both line and terminator lengths are set to 0.
+
+		    When more than one indexing process is requested, the file is
+		    split into ranges starting at block headers, which are indexed
+		    in parallel.
+
+		    @param label_filter: if not B{None}, a function used to derive
+		                         block labels from FASTA headers.
+		'''
+		if self.mf[:1] != b'>':
 			raise ValueError('invalid first char of FASTA file')
 
-		pos = 0
-		header = None
+		if self.index_processes <= 1 or not isinstance(self.mf, mmap):
+			self._set_blocks(_index_range(self.mf, 0, self.file_size, label_filter))
+			return
+
+		ranges = []
+		chunk_num = self.index_processes * _CHUNKS_PER_PROCESS
 		start = 0
-		size = 0
-		while True:
-			line_end = self.mf.find('\n', pos)
-			if line_end == -1:
-				size += self.file_size - pos
+		for i in range(1, chunk_num):
+			stop = self.mf.find(b'\n>', max(start, self.file_size * i // chunk_num - 1))
+			if stop == -1:
 				break
-			else:
-				if self.mf[pos] == '>':
-					if header:
-						self.block_list.append((header, size, start, pos-start-1))
-						self.block_map[header] = (size, start, pos-start-1)
-					header = self.mf[pos+1:line_end]
-					start = line_end + 1
-					size = 0
-				else:
-					size += line_end - pos
+			stop += 1
+			ranges.append((self.filename, start, stop, label_filter))
+			start = stop
+		ranges.append((self.filename, start, self.file_size, label_filter))
+
+		with Pool(self.index_processes) as pool:
+			parts = pool.starmap(_index_file_range, ranges)
+		self._set_blocks([ b for part in parts for b in part ])
+
+class BgzfMultipleBlockReader(MultipleBlockReader):
+	''' Random access reader for BGZF-compressed files containing multiple blocks.
+
+	    Works like L{MultipleBlockReader}, but decompresses just the BGZF
+	    members overlapping the requested regions. Both the block index
+	    (including faidx indexes built by samtools on bgzipped files) and
+	    the member index (by default, the path of the FASTA file followed
+	    by L{GZI_SUFFIX}) refer to offsets in the uncompressed content.
+	'''
 
-				pos = line_end + 1
+	def __init__(self, filename, force_lower=False, index=None, save_index=True, block_cache_size=0, gzi_index=None, cache_size=64):
+		''' Object constructor.
 
-		if header:
-			self.block_list.append((header, size, start, pos-start-1))
-			self.block_map[header] = (size, start, pos-start-1)
+		    @param filename: the path of the file to read.
+		    @param force_lower: wheter to force all symbols to lower case.
+		    @param index: the path of the block index (see L{MultipleBlockReader}).
+		    @param save_index: whether to write indexes when they are missing
+		                       or out of date.
+		    @param block_cache_size: the maximum number of sequence symbols
+		                             kept in the block cache (0 disables it).
+		    @param gzi_index: the path of the BGZF member index.
+		    @param cache_size: the maximum number of decompressed BGZF members
+		                       kept in memory.
+		    @raises ValueError: if the FASTA file or the indexes are malformed.
+		'''
+		self._gzi_index = gzi_index
+		self._save_gzi_index = save_index
+		self._cache_size = cache_size
+		MultipleBlockReader.__init__(self, filename, force_lower, index, save_index, block_cache_size)
 
-	def _load_row_stat(self):
-		# find the longest line in the first 100
-		pos = 0
-		for i in xrange(100):
-			new_pos = self.mf.find('\n', pos)
-			if new_pos == -1: break
-			pos = new_pos+1
+	def _open_map(self):
+		self.mf = BgzfReader(self.filename, self._gzi_index, self._save_gzi_index, self._cache_size)
+		self.file_size = len(self.mf)
+		self.file_mtime = self.mf.file_mtime
 
-		return max(self._row_stat(l+'\n') for l in self.mf[:pos].split('\n') if len(l) and l[0] != '>')
+		if self.file_size == 0:
+			raise ValueError('file %s is empty' % self.filename)
 
-	def _convert_range(self, start, stop):
-		return RandomAccessSequence._convert_range(self, self.line_len, self.newline_len, start, stop)
+def _index_file_range(filename, start, stop, label_filter):
+	''' Indexes a range of a FASTA file in a worker process (see L{_index_range}). '''
+	with open(filename, 'rb') as fd:
+		with mmap(fd.fileno(), 0, access=ACCESS_READ) as mf:
+			return _index_range(mf, start, stop, label_filter)
+
+def _index_range(mf, start, stop, label_filter):
+	''' Indexes the blocks whose header starts within a range.
+
+	    @param mf: the FASTA content, as a mmap or a L{BgzfReader}.
+	    @param start: the beginning of the range; must be a header start.
+	    @param stop: the end of the range.
+	    @param label_filter: if not B{None}, a function used to derive
+	                         block labels from FASTA headers.
+	    @return: a list of block tuples, as described in
+	             L{MultipleBlockReader._build_index}.
+	'''
+	file_size = len(mf)
+	block_list = []
+	pos = start
+	while pos < stop:
+		header_end = mf.find(b'\n', pos)
+		if header_end == -1:
+			header_end = block_start = file_size
+		else:
+			block_start = header_end + 1
+
+		block_stop = mf.find(b'\n>', header_end)
+		if block_stop == -1:
+			block_stop = file_size
+		else:
+			block_stop += 1
+
+		header = mf[pos+1:header_end].decode('utf-8')
+		if header.endswith('\r'):
+			header = header[:-1]
+		if label_filter is not None:
+			header = label_filter(header)
+
+		if block_stop - block_start <= _SMALL_BLOCK_SIZE:
+			# for a few lines, the fixed cost of the regular scan doesn't pay off
+			stats = _scan_block(mf[block_start:block_stop], 0, block_stop-block_start)
+		else:
+			stats = _scan_regular_block(mf, block_start, block_stop)
+			if stats is None:
+				stats = _scan_block(mf, block_start, block_stop)
+		size, length, line_len, newline_len = stats
+		block_list.append((header, size, block_start, length, line_len, newline_len))
+
+		pos = block_stop
+
+	return block_list
+
+def _scan_regular_block(mf, start, stop):
+	''' Computes the statistics of a block whose lines all have the same length.
+
+	    Instead of looking at each line, this function checks that line
+	    terminators occur at regular intervals using strided slices and
+	    counts, so that all the work is carried out by C code.
+
+	    @param mf: the FASTA content.
+	    @param start: the offset of the first sequence line.
+	    @param stop: the offset of the next header (or the file size).
+	    @return: a (size, bytes, line length, terminator length) tuple or
+	             B{None} if the block layout is not regular.
+	'''
+	if start == stop:
+		return 0, 0, 0, 0
+
+	first_end = mf.find(b'\n', start, stop)
+	if first_end == -1 or first_end == start:
+		return None
+	newline_len = 2 if mf[first_end-1:first_end] == b'\r' else 1
+	line_len = first_end - start + 1
+	if line_len == newline_len:
+		return None
+
+	# count full lines, checking where terminators fall
+	ends = mf[first_end:stop:line_len]
+	full_lines = len(ends) - len(ends.lstrip(b'\n'))
+	ends = mf[first_end-1:first_end-1+full_lines*line_len:line_len]
+	if newline_len == 2:
+		full_lines = len(ends) - len(ends.lstrip(b'\r'))
+	elif b'\r' in ends:
+		return None
+
+	# no other terminator may fall within full lines
+	full_end = start + full_lines * line_len
+	newlines = 0
+	for pos in range(start, full_end, _COUNT_CHUNK_SIZE):
+		newlines += mf[pos:min(pos+_COUNT_CHUNK_SIZE, full_end)].count(b'\n')
+	if newlines != full_lines:
+		return None
+
+	# what remains is an optional short line, followed by empty lines
+	tail = mf[full_end:stop]
+	last_line = tail.rstrip(b'\r\n')
+	rest = tail[len(last_line):]
+	if len(last_line) > line_len - newline_len or b'\n' in last_line:
+		return None
+	elif len(last_line) > 0 and len(rest) > 0 and not rest.startswith(b'\r\n'[2-newline_len:]):
+		return None
+	elif rest.replace(b'\r\n', b'').replace(b'\n', b''):
+		return None
+
+	block_end = stop - 1 if mf[stop-1:stop] == b'\n' else stop
+	size = full_lines * (line_len - newline_len) + len(last_line)
+	return size, block_end - start, line_len, newline_len
+
+def _scan_block(mf, start, stop):
+	''' Computes the statistics of a block line by line.
+
+	    @param mf: the FASTA content.
+	    @param start: the offset of the first sequence line.
+	    @param stop: the offset of the next header (or the file size).
+	    @return: a (size, bytes, line length, terminator length) tuple;
+	             the last two values are 0 if lines have irregular lengths.
+	'''
+	block_end = start
+	size = line_len = newline_len = 0
+	short_line = irregular = False
+
+	pos = start
+	while pos < stop:
+		line_end = mf.find(b'\n', pos, stop)
+		if line_end == -1:
+			line_end = stop
+			terminator_len = 0
+		else:
+			terminator_len = 1
+		content_end = line_end
+		if content_end > pos and mf[content_end-1:content_end] == b'\r':
+			content_end -= 1
+			terminator_len += 1
+		content_len = content_end - pos
+
+		if content_len == 0:
+			short_line = True
+		elif short_line:
+			irregular = True
+		elif line_len == 0:
+			line_len = content_len + terminator_len
+			newline_len = terminator_len
+		elif content_len + terminator_len != line_len or terminator_len != newline_len:
+			if content_len <= line_len - newline_len and terminator_len in (0, newline_len):
+				short_line = True
+			else:
+				irregular = True
+
+		size += content_len
+		block_end = line_end
+		pos = line_end + 1
+
+	if irregular:
+		line_len = newline_len = 0
+	return size, block_end - start, line_len, newline_len
+
+def _find_header(buf, start):
+	''' Same as C{buf.find(b'\\n>', start)}, but faster when ">" is rare. '''
+	pos = buf.find(b'>', start + 1)
+	while pos != -1 and buf[pos-1:pos] != b'\n':
+		pos = buf.find(b'>', pos + 1)
+	return pos - 1 if pos != -1 else -1
+
+def _fai_name(header):
+	''' Extracts the sequence name from a FASTA header, like samtools does. '''
+	tokens = header.split(None, 1)
+	return tokens[0] if len(tokens) else header
 
 class Block(RandomAccessSequence):
-	def __init__(self, parent, label, size, start, bytes):
+	def __init__(self, parent, label, size, start, bytes, line_len, newline_len):
 		self._parent = parent
 		self.label = label
 		self.size = size
 		self.segment_offset = start
 		self.bytes = bytes
+		self.line_len = line_len
+		self.newline_len = newline_len
 
 	def __getitem__(self, key):
-		start, stop = self._parent._convert_range(*self._key_to_range(key))
+		start, stop = self._key_to_range(key)
+		if self._parent.block_cache_size > 0:
+			content = self._parent._cached_content(self)
+			if content is not None:
+				return content[start:stop]
+
+		if self.line_len == 0:
+			# lines have irregular lengths: we cannot compute file offsets
+			return self._parent.sequence_filter(self.raw_content().decode('ascii'))[start:stop]
+
+		start, stop = self._convert_range(self.line_len, self.newline_len, start, stop)
 		start += self.segment_offset
 		stop  += self.segment_offset
-		return self._parent.sequence_filter(self._parent.mf[start:stop])
+		return self._parent._forward_filter(self._parent.mf[start:stop])
 
 	def raw_content(self):
 		start = self.segment_offset
 		stop = self.segment_offset + self.bytes
 		return self._parent.mf[start:stop]
 
+	def view(self, start=0, stop=None):
+		''' Retrieves a slice of the sequence avoiding copies, when possible.
+
+		    Meant for hot loops hashing or comparing windows, this method
+		    returns raw bytes: symbols are not case-folded, even if the
+		    reader forces lower case.
+
+		    When the slice lies within a single line (always the case for
+		    sequences stored on one line), the result is a view over the
+		    memory mapped file. Otherwise the slice is copied once, removing
+		    line terminators.
+
+		    Views over the file must be released before closing the reader.
+
+		    @param start: the first position to read.
+		    @param stop: the position after the last one to read.
+		    @return: a memoryview.
+		'''
+		if stop is None or stop > self.size:
+			stop = self.size
+		if start >= stop:
+			return memoryview(b'')
+		elif self.line_len == 0:
+			return memoryview(self.raw_content().translate(None, b'\r\n')[start:stop])
+
+		content_per_line = self.line_len - self.newline_len
+		excess = start % content_per_line
+		file_start, file_stop = self._convert_range(self.line_len, self.newline_len, start, stop)
+		file_start += self.segment_offset
+		file_stop += self.segment_offset
+
+		map_view = self._parent._map_view
+		if stop - start > content_per_line - excess:
+			# the slice spans multiple lines: copy it, removing terminators
+			return memoryview(self._parent.mf[file_start:file_stop].translate(None, b'\r\n'))
+		elif map_view is None:
+			return memoryview(self._parent.mf[file_start:file_start+stop-start])
+		else:
+			return map_view[file_start:file_start+stop-start]
+
 
 class MultipleBlockStreamingReader(object):
 	''' A sequential reader.
 
             May be used with FASTA files whose blocks contain arbitrary content.
+
+	    When lines are joined and the underlying binary file is available,
+	    the input is read in large chunks and each block is extracted with
+	    a few bulk operations, instead of line by line. In this case, the
+	    source file must not have been read through its text layer before.
+	    Line terminators are translated as universal newlines do, so both
+	    ways of reading give the same blocks.
 	'''
 
 	def __init__(self, src, join_lines=True, force_lower=False):
 		''' Object constructor.
 
 		    @param src: the path of the file to read or a file descriptor.
+		                Compressed files are decompressed on the fly.
 		    @param join_lines: whether to join all the lines in each block.
 		    @param force_lower: whether to force all symbols to lower case.
 		'''
 		self.join_lines = join_lines
 		self.sequence_filter = make_sequence_filter(force_lower, False)
+		self._bytes_table = bytes.maketrans(b'ACGTN', b'acgtn') if force_lower else None
 
-		if type(src) in str:
+		if isinstance(src, str):
 			self.filename = src
-			self.fd = file(src, 'r')
+			self.fd = open_input(src)
 		else:
 			self.filename = None
 			self.fd = src
@@ -335,6 +854,179 @@ class MultipleBlockStreamingReader(object):
 		             for each block.
 		    @raises FormatError: if the FASTA file is malformed
 		'''
+		if self.join_lines:
+			if isinstance(self.fd, (RawIOBase, BufferedIOBase)):
+				return self._iter_chunks(self.fd)
+			elif hasattr(self.fd, 'buffer'):
+				return self._iter_chunks(self.fd.buffer)
+		return self._iter_lines()
+
+	def _iter_chunks(self, fd):
+		self._held_cr = b''
+		buf = self._read_chunk(fd)
+		pos = 0
+		eof = len(buf) == 0
+		lines_before = 0 # newlines preceding buf
+		empty_row = -1 # the next candidate empty row
+
+		# as in the line based parser, a block is returned only after the
+		# next header has been checked
+		block = None
+		while True:
+			if block is not None:
+				# fast path: when the buffer holds several complete blocks
+				# and no anomaly, split them all at once
+				last_header = buf.rfind(b'\n>', pos)
+				if last_header > pos and self._lacks_empty_rows(buf, pos, last_header + 1):
+					for next_block in self._split_blocks(buf, pos, last_header, lines_before):
+						yield block
+						block = next_block
+					pos = last_header + 1
+					continue
+
+			header_end = buf.find(b'\n', pos)
+			while header_end == -1 and not eof:
+				buf, pos, lines_before, eof = self._refill(fd, buf, pos, lines_before)
+				header_end = buf.find(b'\n', pos)
+				empty_row = -1
+			if pos == len(buf):
+				break
+
+			header = buf[pos:len(buf) if header_end == -1 else header_end]
+			if pos == 0 and lines_before == 0:
+				if len(header) == 0:
+					raise FormatError(self._error_msg('unexpected empty row', 1))
+				elif header[:1] != b'>':
+					raise FormatError(self._error_msg('missing FASTA header', 1))
+			elif len(header) == 1:
+				lineno = lines_before + buf.count(b'\n', 0, pos) + 1
+				raise FormatError(self._error_msg('empty FASTA header', lineno))
+			header = header[1:].decode('utf-8')
+
+			if block is not None:
+				yield block
+			if header_end == -1:
+				block = header, ''
+				break
+
+			# collect complete lines until the next header
+			content = []
+			start = header_end + 1
+			while True:
+				stop = _find_header(buf, start - 1)
+				if stop != -1:
+					stop += 1
+					break
+				elif eof:
+					stop = len(buf)
+					break
+
+				last_line_end = buf.rfind(b'\n', start)
+				if last_line_end != -1:
+					empty_row = self._check_rows(buf, start, last_line_end + 1, lines_before, empty_row)
+					content.append(buf[start:last_line_end+1])
+					start = last_line_end + 1
+
+				# keep the last terminator, to spot headers at the beginning of the next chunk
+				buf, pos, lines_before, eof = self._refill(fd, buf, start - 1, lines_before)
+				start = pos + 1
+				empty_row = -1
+
+			empty_row = self._check_rows(buf, start, stop, lines_before, empty_row)
+			content.append(buf[start:stop])
+			block = header, self._join_content(content)
+			pos = stop
+
+		if block is not None:
+			yield block
+
+	def _lacks_empty_rows(self, buf, start, stop):
+		''' Checks that the lines of I{buf} between I{start} and I{stop} are not empty. '''
+		return buf.find(b'\n\n', start, stop) == -1
+
+	def _split_blocks(self, buf, start, stop, lines_before):
+		''' Splits the blocks of I{buf} between I{start} and the last
+		    terminator at I{stop} into (header, sequence) tuples.
+
+		    @raises FormatError: if a header is empty.
+		'''
+		tbl = self._bytes_table
+		pos = start
+		for block in buf[start+1:stop].split(b'\n>'):
+			header, _, sequence = block.partition(b'\n')
+			if len(header) == 0:
+				lineno = lines_before + buf.count(b'\n', 0, pos) + 1
+				raise FormatError(self._error_msg('empty FASTA header', lineno))
+
+			yield header.decode('utf-8'), sequence.translate(tbl, b'\n').decode('utf-8')
+			pos += len(block) + 2
+
+	def _refill(self, fd, buf, pos, lines_before):
+		''' Drops the content of I{buf} before I{pos} and appends a new chunk.
+
+		    @return: the new buffer, the new position of I{pos}, the number
+		             of newlines preceding the buffer and whether the file
+		             is exhausted.
+		'''
+		chunk = self._read_chunk(fd)
+		lines_before += buf.count(b'\n', 0, pos)
+		return buf[pos:] + chunk, 0, lines_before, len(chunk) == 0
+
+	def _read_chunk(self, fd):
+		''' Reads a chunk, translating "\\r\\n" and lone "\\r" terminators into "\\n".
+
+		    A carriage return ending the chunk is held back, since the next
+		    chunk may start with the matching newline.
+
+		    @return: the translated chunk, which is empty only at the end
+		             of the file.
+		'''
+		while True:
+			data = fd.read(_STREAM_CHUNK_SIZE)
+			chunk = self._held_cr + data
+			self._held_cr = b''
+			if len(data) > 0 and chunk[-1:] == b'\r':
+				chunk = chunk[:-1]
+				self._held_cr = b'\r'
+			if b'\r' in chunk:
+				chunk = chunk.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+			if len(chunk) > 0 or len(data) == 0:
+				return chunk
+
+	def _check_rows(self, buf, start, stop, lines_before, empty_row):
+		''' Looks for empty rows among the lines of I{buf} between I{start} and I{stop}.
+
+		    Since I{start} always follows a newline, an empty row starts
+		    with "\\n\\n". To avoid searching each block, the
+		    position of the next such pair is computed once and reused
+		    until it falls behind I{start}.
+
+		    @param empty_row: the position of the next candidate empty row,
+		                      as returned by a previous call.
+		    @return: the position of the next candidate empty row.
+		    @raises FormatError: if an empty row is found.
+		'''
+		if empty_row < start - 1:
+			empty_row = buf.find(b'\n\n', start - 1)
+			if empty_row == -1:
+				empty_row = len(buf)
+
+		if empty_row < stop - 1:
+			lines = buf[start:stop].split(b'\n')
+			if lines[-1] == b'':
+				lines.pop()
+			for idx, line in enumerate(lines):
+				if len(line) == 0:
+					lineno = lines_before + buf.count(b'\n', 0, start) + idx + 1
+					raise FormatError(self._error_msg('unexpected empty row', lineno))
+
+		return empty_row
+
+	def _join_content(self, content):
+		content = content[0] if len(content) == 1 else b''.join(content)
+		return content.translate(self._bytes_table, b'\n').decode('utf-8')
+
+	def _iter_lines(self):
 		self.lineno = 0
 		self.header = self._first_header()
 
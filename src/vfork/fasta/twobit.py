@@ -0,0 +1,314 @@
+''' Compact storage of nucleotide sequences in the UCSC .2bit format.
+
+    Each nucleotide takes 2 bits; runs of unknown symbols (stored as N)
+    and of lower case symbols (soft-masked regions) are recorded as
+    intervals. Symbols other than A, C, G, T and N, in either case, are
+    converted to N.
+'''
+
+from array import array
+from bisect import bisect_right
+from mmap import mmap, ACCESS_READ
+from os import fstat
+from shutil import copyfileobj
+from struct import Struct
+from tempfile import TemporaryFile
+import re
+import sys
+
+from .reader import RandomAccessSequence, MultipleBlockStreamingReader
+
+
+_SIGNATURE = 0x1A412743
+_HEADER = Struct('<4I')
+_UINT32 = Struct('<I')
+_UINT64 = Struct('<Q')
+
+_N_RUN = re.compile('[^ACGTacgt]+')
+_MASK_RUN = re.compile('[a-z]+')
+
+
+def _build_pack_tables():
+	codes = [0] * 256
+	for code, symbols in enumerate(('Tt', 'Cc', 'Aa', 'Gg')):
+		for s in symbols:
+			codes[ord(s)] = code
+	return [ bytes((c << shift) for c in codes) for shift in (6, 4, 2, 0) ]
+_PACK_TABLES = _build_pack_tables()
+
+_UNPACK_TABLES = [ bytes(b'TCAG'[(v >> shift) & 3] for v in range(256)) for shift in (6, 4, 2, 0) ]
+
+
+def _pack(sequence):
+	''' Packs a sequence using 2 bits per symbol.
+
+	    The i-th symbol of each group of 4 is stored in bits 7-2i and 6-2i
+	    of a byte. Each group is converted into a stream of shifted codes;
+	    since the streams use disjoint bits, they can be merged with a
+	    bitwise or between large integers.
+
+	    @param sequence: the sequence, as bytes.
+	    @return: the packed bytes.
+	'''
+	excess = len(sequence) % 4
+	if excess:
+		sequence += b'T' * (4 - excess)
+
+	packed = 0
+	for i, tbl in enumerate(_PACK_TABLES):
+		packed |= int.from_bytes(sequence[i::4].translate(tbl), 'big')
+	return packed.to_bytes(len(sequence) // 4, 'big')
+
+def _uint32_array(values):
+	a = array('I', values)
+	if sys.byteorder == 'big':
+		a.byteswap()
+	return a.tobytes()
+
+def _encode_record(sequence):
+	''' Encodes a sequence as a .2bit record.
+
+	    @param sequence: a string.
+	    @return: the record bytes.
+	'''
+	parts = [ _UINT32.pack(len(sequence)) ]
+	for regex in (_N_RUN, _MASK_RUN):
+		starts = []
+		sizes = []
+		for m in regex.finditer(sequence):
+			starts.append(m.start())
+			sizes.append(m.end() - m.start())
+		parts.append(_UINT32.pack(len(starts)))
+		parts.append(_uint32_array(starts))
+		parts.append(_uint32_array(sizes))
+
+	parts.append(_UINT32.pack(0))
+	parts.append(_pack(sequence.encode('ascii')))
+	return b''.join(parts)
+
+
+def write_twobit(blocks, filename):
+	''' Writes sequences to a .2bit file.
+
+	    Records are first encoded into a temporary file, since the index at
+	    the beginning of the output depends on their sizes.
+
+	    @param blocks: an iterable over (label, sequence) tuples.
+	    @param filename: the path of the output file.
+	    @raises ValueError: if a label is longer than 255 bytes or a
+	                        sequence contains non-ASCII symbols.
+	'''
+	labels = []
+	record_sizes = []
+	with TemporaryFile() as tmp:
+		for label, sequence in blocks:
+			label = label.encode('utf-8')
+			if len(label) > 255:
+				raise ValueError('label too long for the .2bit format: %s' % label.decode('utf-8'))
+
+			record = _encode_record(sequence)
+			tmp.write(record)
+			labels.append(label)
+			record_sizes.append(len(record))
+
+		index_size = sum(1 + len(l) + _UINT32.size for l in labels)
+		offset = _HEADER.size + index_size
+		if offset + sum(record_sizes) < 2**32:
+			version, offset_struct = 0, _UINT32
+		else:
+			version, offset_struct = 1, _UINT64
+			offset += len(labels) * (_UINT64.size - _UINT32.size)
+
+		with open(filename, 'wb') as out:
+			out.write(_HEADER.pack(_SIGNATURE, version, len(labels), 0))
+			for label, size in zip(labels, record_sizes):
+				out.write(bytes((len(label),)))
+				out.write(label)
+				out.write(offset_struct.pack(offset))
+				offset += size
+
+			tmp.seek(0)
+			copyfileobj(tmp, out)
+
+def fasta_to_twobit(src, filename):
+	''' Converts a FASTA file into the .2bit format.
+
+	    @param src: the path of the FASTA file or a file descriptor.
+	    @param filename: the path of the output file.
+	    @raises FormatError: if the FASTA file is malformed.
+	'''
+	write_twobit(MultipleBlockStreamingReader(src), filename)
+
+
+class TwoBitReader(object):
+	''' Random access reader for .2bit files.
+
+	    The file is memory mapped: processes reading the same file share a
+	    single copy of its content in the page cache.
+
+	    Blocks are retrieved by label or by position, as with
+	    L{MultipleBlockReader}, and support the same slicing interface.
+	    The run tables of each block are decoded on first access and
+	    then kept in memory.
+	'''
+
+	def __init__(self, filename, force_lower=False):
+		''' Object constructor.
+
+		    @param filename: the path of the file to read.
+		    @param force_lower: whether to force all symbols to lower case.
+		    @raises ValueError: if the file is malformed.
+		'''
+		self.filename = filename
+		self.force_lower = force_lower
+
+		self.mf = None
+		self._blocks = {}
+		with open(filename, 'rb') as fd:
+			size = fstat(fd.fileno()).st_size
+			if size < _HEADER.size:
+				raise ValueError('file %s is not in the .2bit format' % filename)
+			self.mf = mmap(fd.fileno(), size, access=ACCESS_READ)
+
+		try:
+			self._read_index()
+		except:
+			self.close()
+			raise
+
+	def __del__(self):
+		self.close()
+
+	def __len__(self):
+		return len(self.block_list)
+
+	def __getitem__(self, key):
+		if type(key) == int:
+			label, offset = self.block_list[key]
+		else:
+			label, offset = key, self.block_map[key]
+
+		block = self._blocks.get(label)
+		if block is None:
+			block = self._blocks[label] = TwoBitBlock(self, label, offset)
+		return block
+
+	def close(self):
+		''' Closes the reader. '''
+		if self.mf is not None:
+			self.mf.close()
+			self.mf = None
+
+	def blocks(self):
+		return [ b[0] for b in self.block_list ]
+
+	def iter_blocks(self):
+		for idx in range(len(self.block_list)):
+			yield self[idx]
+
+	def _read_index(self):
+		signature, version, count, reserved = _HEADER.unpack_from(self.mf)
+		if signature == _SIGNATURE:
+			self._byteorder = '<'
+		elif signature == _UINT32.unpack(_UINT32.pack(_SIGNATURE)[::-1])[0]:
+			self._byteorder = '>'
+			version, count = [ _UINT32.unpack(_UINT32.pack(v)[::-1])[0] for v in (version, count) ]
+		else:
+			raise ValueError('file %s is not in the .2bit format' % self.filename)
+
+		if version not in (0, 1):
+			raise ValueError('unsupported .2bit version %d in file %s' % (version, self.filename))
+		offset_struct = Struct(self._byteorder + ('I' if version == 0 else 'Q'))
+
+		self.block_list = []
+		pos = _HEADER.size
+		for i in range(count):
+			label_len = self.mf[pos]
+			label = self.mf[pos+1:pos+1+label_len].decode('utf-8')
+			pos += 1 + label_len
+			self.block_list.append((label, offset_struct.unpack_from(self.mf, pos)[0]))
+			pos += offset_struct.size
+		self.block_map = dict(self.block_list)
+
+	def _read_uint32s(self, pos, count):
+		values = array('I')
+		values.frombytes(self.mf[pos:pos+4*count])
+		if (self._byteorder == '<') != (sys.byteorder == 'little'):
+			values.byteswap()
+		return values
+
+
+class TwoBitBlock(RandomAccessSequence):
+	''' A sequence stored in a .2bit file.
+
+	    This class exposes the following properties:
+	      - B{label}: the sequence label;
+	      - B{size}: the length of the sequence;
+	      - B{n_blocks}: a list of (start, size) tuples for runs of N;
+	      - B{mask_blocks}: a list of (start, size) tuples for soft-masked runs.
+	'''
+
+	def __init__(self, parent, label, offset):
+		self._parent = parent
+		self.label = label
+
+		read = parent._read_uint32s
+		self.size, n_count = read(offset, 2)
+		offset += 8
+		self._n_starts = read(offset, n_count)
+		self._n_sizes = read(offset + 4*n_count, n_count)
+		offset += 8 * n_count
+
+		mask_count = read(offset, 1)[0]
+		offset += 4
+		self._mask_starts = read(offset, mask_count)
+		self._mask_sizes = read(offset + 4*mask_count, mask_count)
+		offset += 8 * mask_count
+
+		self._dna_offset = offset + 4
+
+	@property
+	def n_blocks(self):
+		return list(zip(self._n_starts, self._n_sizes))
+
+	@property
+	def mask_blocks(self):
+		return list(zip(self._mask_starts, self._mask_sizes))
+
+	def __getitem__(self, key):
+		start, stop = self._key_to_range(key)
+		if start >= stop:
+			return ''
+
+		first = start // 4
+		packed = self._parent.mf[self._dna_offset+first:self._dna_offset+(stop+3)//4]
+		content = bytearray(4 * len(packed))
+		for i, tbl in enumerate(_UNPACK_TABLES):
+			content[i::4] = packed.translate(tbl)
+
+		excess = start - 4 * first
+		content = content[excess:excess+stop-start]
+
+		for run_start, run_stop in self._runs(self._n_starts, self._n_sizes, start, stop):
+			content[run_start:run_stop] = b'N' * (run_stop - run_start)
+
+		if self._parent.force_lower:
+			content = content.lower()
+		else:
+			for run_start, run_stop in self._runs(self._mask_starts, self._mask_sizes, start, stop):
+				content[run_start:run_stop] = content[run_start:run_stop].lower()
+
+		return content.decode('ascii')
+
+	def _runs(self, starts, sizes, start, stop):
+		''' Finds the runs overlapping a range.
+
+		    @return: an iterator over (start, stop) tuples, relative to I{start}.
+		'''
+		idx = max(bisect_right(starts, start) - 1, 0)
+		while idx < len(starts) and starts[idx] < stop:
+			run_start = max(starts[idx], start)
+			run_stop = min(starts[idx] + sizes[idx], stop)
+			if run_start < run_stop:
+				yield run_start - start, run_stop - start
+			idx += 1
@@ -1,6 +1,10 @@
 from os import linesep
 
 
+#: A buffer size suitable for L{MultipleBlockWriter} bulk writes.
+BULK_BUFFER_SIZE = 1024 * 1024
+
+
 # DEPRECATED
 class SingleBlockWriter(object):
 	def __init__(self, f, header, width=80):
@@ -36,32 +40,110 @@ class SingleBlockWriter(object):
 		print(header, file=self.fd)
 
 class MultipleBlockWriter(object):
-	def __init__(self, f, max_width=80):
+	''' Writes FASTA blocks, wrapping sequences at a fixed width.
+
+	    By default, output is written as soon as a line is complete.
+	    When a buffer size is given, complete lines are instead collected
+	    in memory and handed to the file with a single C{write} whenever
+	    their total length reaches the buffer size; L{flush} writes out
+	    whatever is left. Nothing else should write to the same file
+	    between two flushes.
+	'''
+
+	def __init__(self, f, max_width=80, buffer_size=0):
+		''' Object constructor.
+
+		    @param f: the path of the output file or a file object.
+		    @param max_width: the maximum length of sequence lines.
+		    @param buffer_size: the number of characters collected before
+		                        writing to the file (0 disables buffering).
+		'''
 		self.max_width = max_width
+		self.buffer_size = buffer_size
 		self.sequence_buffer = ''
+		self._chunks = []
+		self._buffered = 0
 		self._open_file(f)
 
 	def flush(self):
+		''' Terminates the current sequence and writes out buffered content. '''
 		if len(self.sequence_buffer) > 0:
-			print(self.sequence_buffer, file=self.fd)
+			self._write(self.sequence_buffer + '\n')
 			self.sequence_buffer = ''
+		self._write_chunks()
 
 	def write_header(self, header):
-		self.flush()
-		print('>%s' % header, file=self.fd)
+		if len(self.sequence_buffer) > 0:
+			self._write(self.sequence_buffer + '\n')
+			self.sequence_buffer = ''
+		self._write('>%s\n' % header)
 
 	def write_sequence(self, sequence):
-		self.sequence_buffer += sequence
-
-		last_offset = len(self.sequence_buffer) // self.max_width * self.max_width
-		for offset in range(0, last_offset, self.max_width):
-			print(self.sequence_buffer[offset:offset+self.max_width], file=self.fd)
+		if len(self.sequence_buffer) > 0:
+			sequence = self.sequence_buffer + sequence
 
+		last_offset = len(sequence) // self.max_width * self.max_width
 		if last_offset > 0:
-			self.sequence_buffer = self.sequence_buffer[last_offset:]
+			self._write(self._wrap(sequence, last_offset) + '\n')
+		self.sequence_buffer = sequence[last_offset:]
+
+	def write_records(self, records):
+		''' Writes a series of blocks.
 
+		    The output is the same obtained by calling L{write_header} and
+		    L{write_sequence} for each block, but with less overhead.
+
+		    @param records: an iterable over (header, sequence) tuples.
+		'''
+		if len(self.sequence_buffer) > 0:
+			self._write(self.sequence_buffer + '\n')
+			self.sequence_buffer = ''
+
+		width = self.max_width
+		buffer_size = max(self.buffer_size, 1)
+		chunks = self._chunks
+		buffered = self._buffered
+		for header, sequence in records:
+			if len(sequence) == 0:
+				chunk = '>%s\n' % header
+			elif len(sequence) <= width:
+				chunk = '>%s\n%s\n' % (header, sequence)
+			else:
+				chunk = '>%s\n%s\n' % (header, self._wrap(sequence, len(sequence)))
+
+			chunks.append(chunk)
+			buffered += len(chunk)
+			if buffered >= buffer_size:
+				self.fd.write(''.join(chunks))
+				del chunks[:]
+				buffered = 0
+
+		self._buffered = buffered
+
+	##
+	## Internal use only
+	##
 	def _open_file(self, f):
 		if isinstance(f, str) or isinstance(f, bytes):
-			self.fd = file(f, 'w')
+			self.fd = open(f, 'w')
 		else:
 			self.fd = f
+
+	def _wrap(self, sequence, stop):
+		width = self.max_width
+		return '\n'.join([ sequence[offset:offset+width] for offset in range(0, stop, width) ])
+
+	def _write(self, text):
+		if self.buffer_size == 0:
+			self.fd.write(text)
+		else:
+			self._chunks.append(text)
+			self._buffered += len(text)
+			if self._buffered >= self.buffer_size:
+				self._write_chunks()
+
+	def _write_chunks(self):
+		if len(self._chunks) > 0:
+			self.fd.write(''.join(self._chunks))
+			self._chunks = []
+			self._buffered = 0
@@ -5,5 +5,6 @@
 
 ''' A collection of classes for reading and writing FASTQ files. '''
 
-from .reader import FastqStreamingReader, FormatError
+from .reader import FastqBatch, FastqStreamingReader, PairedFastqReader, ParallelFastqReader, FormatError
 from .writer import FastqWriter
+from .index import IndexedFastqReader, INDEX_SUFFIX
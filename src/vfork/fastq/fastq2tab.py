@@ -8,6 +8,7 @@
 from optparse import OptionParser
 from sys import stdin, stdout
 from vfork.fastq.reader import FastqStreamingReader, FormatError
+from vfork.io.compression import open_input
 from vfork.util import ignore_broken_pipe
 from vfork.util import exit, format_usage
 
@@ -20,13 +21,15 @@ def main():
         1) label
         2) sequence
         3) quality
+
+        The input may be compressed with gzip, bgzip, bzip2, xz or zstd.
     '''))
     options, args = parser.parse_args()
     if len(args) != 0:
         exit('Unexpected argument number.')
 
     try:
-        for label, seq, qual in FastqStreamingReader(stdin):
+        for label, seq, qual in FastqStreamingReader(open_input(stdin)):
             if len(seq) == 0:
                 exit('Empty FASTQ sequence in input: ' + label)
             else:
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+#
+# Copyright 2012 Gabriele Sales <gbrsales@gmail.com>
+#
+# This file is part of BioinfoTree. It is licensed under the
+# terms of the GNU Affero General Public License version 3.
+
+from itertools import islice
+from optparse import OptionParser
+from sys import stdin, stdout
+from vfork.fastq.index import IndexedFastqReader
+from vfork.fastq.reader import FormatError
+from vfork.fastq.writer import FastqWriter
+from vfork.io.util import safe_rstrip
+from vfork.util import ignore_broken_pipe
+from vfork.util import exit, format_usage
+
+
+_REQUEST_BATCH_SIZE = 100000
+
+
+def parse_keys(lines, ordinals):
+    for lineno, line in enumerate(lines, 1):
+        key = safe_rstrip(line)
+        if not ordinals:
+            yield key
+        else:
+            try:
+                ordinal = int(key)
+                if ordinal < 1: raise ValueError
+            except ValueError:
+                exit('Invalid record number at line %d: %s' % (lineno, key))
+            yield ordinal - 1
+
+def main():
+    parser = OptionParser(usage=format_usage('''
+        Usage: %prog [OPTIONS] FASTQ <IDS >FASTQ
+
+        Extracts the records of a FASTQ file whose names are listed on
+        standard input, one per line, in the same order. Names are
+        compared with the part of the labels preceding the first
+        whitespace.
+
+        The first time a file is accessed, an index is built and saved
+        next to it (see also --index); later runs reuse it and read
+        just the requested records. Compressed files are not supported.
+    '''))
+    parser.add_option('-n', '--numbers', dest='numbers', action='store_true', default=False,
+                      help='standard input lists record numbers (1-based) instead of names')
+    parser.add_option('-i', '--index', dest='index',
+                      help='the path of the index (default: the FASTQ path followed by .vfqi)', metavar='PATH')
+    parser.add_option('-s', '--stride', dest='stride', type='int',
+                      help='when building the index, record the offset of a record every N (default: 1)', metavar='N')
+    parser.add_option('-m', '--ignore-missing', dest='ignore_missing', action='store_true', default=False,
+                      help='skip missing records instead of failing')
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        exit('Unexpected argument number.')
+    elif options.stride is not None and options.stride < 1:
+        exit('Invalid stride: %d' % options.stride)
+
+    try:
+        reader = IndexedFastqReader(args[0], options.index, stride=options.stride, names=not options.numbers)
+    except FormatError as e:
+        exit('Malformed input: ' + e.args[0])
+    except ValueError as e:
+        exit(e.args[0].capitalize() + '.')
+
+    writer = FastqWriter(stdout)
+    keys = parse_keys(stdin, options.numbers)
+    while True:
+        batch = list(islice(keys, _REQUEST_BATCH_SIZE))
+        if len(batch) == 0:
+            break
+
+        if options.ignore_missing:
+            records = [ r for r in map(reader.get, batch) if r is not None ]
+        else:
+            try:
+                records = reader.fetch_many(batch)
+            except KeyError as e:
+                exit('Missing record: %s' % e.args[0])
+            except IndexError:
+                exit('Record number out of range.')
+
+        for label, seq, qual in records:
+            writer.write(label, seq, qual)
+
+
+if __name__ == '__main__':
+    ignore_broken_pipe(main)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+#
+# Copyright 2012 Gabriele Sales <gbrsales@gmail.com>
+#
+# This file is part of BioinfoTree. It is licensed under the
+# terms of the GNU Affero General Public License version 3.
+
+from optparse import OptionParser
+from sys import stdin, stdout
+from vfork.fastq.reader import FastqStreamingReader, FormatError, DEFAULT_BATCH_SIZE
+from vfork.io.compression import open_input
+from vfork.util import ignore_broken_pipe, safe_import
+from vfork.util import exit, format_usage
+
+with safe_import('numpy'):
+    from vfork.fastq.stats import QualityStats
+
+
+def write_cycles(stats):
+    means = stats.cycle_means()
+    fractions = stats.cycle_fractions_above()
+    for idx in range(len(stats.cycle_counts)):
+        stdout.write('%d\t%d\t%.2f\t%.4f\n' % (idx + 1, stats.cycle_counts[idx], means[idx], fractions[idx]))
+
+def write_summary(stats):
+    stdout.write('reads\t%d\n' % stats.reads)
+    stdout.write('bases\t%d\n' % stats.bases)
+    stdout.write('mean_quality\t%.2f\n' % stats.mean_score())
+    stdout.write('fraction_q%d\t%.4f\n' % (stats.threshold, stats.fraction_above()))
+
+    reads = stats.read_mean_counts.sum()
+    for name, counts in (('read_mean_quality', stats.read_mean_counts), ('read_min_quality', stats.read_min_counts)):
+        for score in counts.nonzero()[0]:
+            stdout.write('%s\t%d\t%d\t%.4f\n' % (name, score, counts[score], counts[score] / reads))
+
+def main():
+    parser = OptionParser(usage=format_usage('''
+        Usage: %prog [OPTIONS] <FASTQ >TAB
+
+        Computes quality score statistics over a FASTQ file.
+
+        By default, prints a row for each cycle (position within
+        reads) with four columns:
+        1) cycle (1-based)
+        2) number of reads covering the cycle
+        3) mean quality
+        4) fraction of qualities not lower than the threshold
+
+        With --summary, prints the number of reads and bases, the
+        overall mean quality and fraction above the threshold, followed
+        by the distributions of per-read mean (rounded down) and minimum
+        qualities, as (name, quality, reads, fraction) rows.
+
+        With --reads, prints a row for each read instead:
+        1) label
+        2) length
+        3) mean quality
+        4) minimum quality
+        5) fraction of qualities not lower than the threshold
+
+        The input may be compressed with gzip, bgzip, bzip2, xz or zstd.
+    '''))
+    parser.add_option('-6', '--phred64', dest='phred64', action='store_true', default=False,
+                      help='qualities are encoded with an offset of 64 (default: 33)')
+    parser.add_option('-t', '--threshold', dest='threshold', type='int', default=30,
+                      help='the quality threshold (default: 30)', metavar='Q')
+    parser.add_option('-s', '--summary', dest='summary', action='store_true', default=False,
+                      help='print overall statistics')
+    parser.add_option('-r', '--reads', dest='reads', action='store_true', default=False,
+                      help='print per-read statistics')
+    parser.add_option('-b', '--batch-size', dest='batch_size', type='int', default=DEFAULT_BATCH_SIZE,
+                      help='the number of reads processed at a time (default: %d)' % DEFAULT_BATCH_SIZE, metavar='N')
+    options, args = parser.parse_args()
+    if len(args) != 0:
+        exit('Unexpected argument number.')
+    elif options.summary and options.reads:
+        exit('--summary and --reads are mutually exclusive.')
+    elif options.threshold < 0:
+        exit('Invalid threshold: %d' % options.threshold)
+    elif options.batch_size < 1:
+        exit('Invalid batch size: %d' % options.batch_size)
+
+    stats = QualityStats(64 if options.phred64 else 33, options.threshold)
+    try:
+        for batch in FastqStreamingReader(open_input(stdin)).iter_batches(options.batch_size, numpy=True):
+            scores, means, mins, fractions = stats.update(batch)
+            if options.reads:
+                lengths = batch.lengths()
+                for idx, label in enumerate(batch.labels):
+                    stdout.write('%s\t%d\t%.2f\t%d\t%.4f\n' % (label, lengths[idx], means[idx], mins[idx], fractions[idx]))
+
+    except FormatError as e:
+        exit('Malformed input: ' + e.args[0])
+    except ValueError as e:
+        exit('Invalid qualities: ' + e.args[0])
+
+    if options.summary:
+        write_summary(stats)
+    elif not options.reads:
+        write_cycles(stats)
+
+
+if __name__ == '__main__':
+    ignore_broken_pipe(main)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#
+# Copyright 2012 Gabriele Sales <gbrsales@gmail.com>
+#
+# This file is part of BioinfoTree. It is licensed under the
+# terms of the GNU Affero General Public License version 3.
+
+from optparse import OptionParser
+from sys import stderr, stdin, stdout
+from vfork.fastq.reader import FormatError, DEFAULT_BATCH_SIZE
+from vfork.io.compression import open_input
+from vfork.util import ignore_broken_pipe, safe_import
+from vfork.util import exit, format_usage
+
+with safe_import('numpy'):
+    from vfork.fastq.trim import ReadTrimmer, trim_fastq
+
+
+def main():
+    parser = OptionParser(usage=format_usage('''
+        Usage: %prog [OPTIONS] <FASTQ >FASTQ
+
+        Trims and filters the reads of a FASTQ file.
+
+        Steps are applied in the following order:
+        1) removal of fixed-length ends (--head, --tail)
+        2) removal of an adapter prefix found at the 3' end (--adapter)
+        3) quality trimming: reads are cut at the start of the first
+           window whose mean quality is below the threshold (--window)
+        4) cropping (--max-length)
+        5) removal of reads with too many N (--max-n) or too short
+           (--min-length)
+
+        The input may be compressed with gzip, bgzip, bzip2, xz or zstd.
+        The output may be compressed with gzip or in the BGZF format by
+        several threads.
+    '''))
+    parser.add_option('--head', dest='head', type='int', default=0,
+                      help='remove N bases from the 5\' end', metavar='N')
+    parser.add_option('--tail', dest='tail', type='int', default=0,
+                      help='remove N bases from the 3\' end', metavar='N')
+    parser.add_option('-a', '--adapter', dest='adapter',
+                      help='the adapter sequence', metavar='SEQ')
+    parser.add_option('-O', '--min-overlap', dest='min_overlap', type='int', default=3,
+                      help='the minimum length of an adapter prefix to be removed (default: 3)', metavar='N')
+    parser.add_option('-w', '--window', dest='window', type='int',
+                      help='the size of the quality window', metavar='N')
+    parser.add_option('-q', '--min-quality', dest='min_quality', type='int', default=20,
+                      help='the minimum mean quality of a window (default: 20)', metavar='Q')
+    parser.add_option('-L', '--max-length', dest='max_length', type='int',
+                      help='crop reads to N bases', metavar='N')
+    parser.add_option('-n', '--max-n', dest='max_n', type='int',
+                      help='discard reads with more than N unknown bases', metavar='N')
+    parser.add_option('-m', '--min-length', dest='min_length', type='int', default=0,
+                      help='discard reads shorter than N bases (default: 0)', metavar='N')
+    parser.add_option('-6', '--phred64', dest='phred64', action='store_true', default=False,
+                      help='qualities are encoded with an offset of 64 (default: 33)')
+    parser.add_option('-z', '--gzip', dest='compression', action='store_const', const='gzip',
+                      help='compress the output with gzip')
+    parser.add_option('-b', '--bgzf', dest='compression', action='store_const', const='bgzf',
+                      help='compress the output in the BGZF format (as bgzip does)')
+    parser.add_option('-t', '--threads', dest='threads', type='int',
+                      help='the number of compression threads (default: the number of CPUs)', metavar='N')
+    parser.add_option('-v', '--verbose', dest='verbose', action='store_true', default=False,
+                      help='print statistics on standard error')
+    options, args = parser.parse_args()
+    if len(args) != 0:
+        exit('Unexpected argument number.')
+    elif options.threads is not None and options.threads < 1:
+        exit('Invalid number of threads: %d' % options.threads)
+
+    try:
+        trimmer = ReadTrimmer(options.head, options.tail, options.adapter, options.min_overlap,
+                              options.window, options.min_quality, options.max_length,
+                              options.max_n, options.min_length, 64 if options.phred64 else 33)
+    except ValueError as e:
+        exit(e.args[0].capitalize() + '.')
+
+    try:
+        trim_fastq(open_input(stdin), stdout, trimmer, DEFAULT_BATCH_SIZE, options.compression, options.threads)
+    except FormatError as e:
+        exit('Malformed input: ' + e.args[0])
+    except ValueError as e:
+        exit('Invalid qualities: ' + e.args[0])
+
+    if options.verbose:
+        for name in ('reads_in', 'bases_in', 'reads_out', 'bases_out',
+                     'adapter_trimmed', 'quality_trimmed', 'too_many_n', 'too_short'):
+            stderr.write('%s\t%d\n' % (name, getattr(trimmer, name)))
+
+
+if __name__ == '__main__':
+    ignore_broken_pipe(main)
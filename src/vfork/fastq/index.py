@@ -0,0 +1,470 @@
+# Copyright 2012 Gabriele Sales <gbrsales@gmail.com>
+#
+# This file is part of BioinfoTree. It is licensed under the
+# terms of the GNU Affero General Public License version 3.
+
+''' Random access to FASTQ files. '''
+
+from array import array
+from functools import partial
+from hashlib import blake2b
+from itertools import accumulate, repeat
+from mmap import mmap, ACCESS_READ
+from operator import add, itemgetter, methodcaller
+from os import fstat
+from struct import Struct
+from sys import byteorder
+
+from .reader import FastqStreamingReader, FormatError, _split_blocks, _strip_marker
+from ..io.compression import detect_compression
+from ..io.util import write_atomically
+
+
+#: Suffix appended to the path of a FASTQ file to obtain the path of its index.
+INDEX_SUFFIX = '.vfqi'
+_INDEX_MAGIC = b'vfqindex'
+_INDEX_VERSION = 1
+
+# magic, version, stride, file size, file mtime, record count, table slots
+_HEADER = Struct('<8sIIQQQQ')
+_UINT64 = Struct('<Q')
+_ENTRY = Struct('<QQ')
+_EMPTY = 2**64 - 1
+_MAX_LOAD = 0.75
+_SCAN_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def read_name(label):
+    ''' Extracts the name of a read from its label.
+
+        @param label: the label, as a string or as bytes.
+        @return: the text before the first whitespace.
+    '''
+    tokens = label.split(None, 1)
+    return tokens[0] if len(tokens) > 0 else label[:0]
+
+def _name_hash(name):
+    return int.from_bytes(blake2b(name, digest_size=8).digest(), 'little')
+
+def _name_hashes(names):
+    ''' Computes the hashes of several names at once.
+
+        @return: an C{array('Q')}, whose items match L{_name_hash}.
+    '''
+    hashes = array('Q')
+    hashes.frombytes(b''.join(map(_digest, map(_hasher, names))))
+    if byteorder != 'little':
+        hashes.byteswap()
+    return hashes
+
+def _read_names(labels):
+    ''' Extracts the names of several reads at once (see L{read_name}). '''
+    try:
+        return list(map(_first_token, map(bytes.split, labels, repeat(None), repeat(1))))
+    except IndexError:
+        # blank labels
+        return list(map(read_name, labels))
+
+def _fill_table(table, hashes, offsets):
+    ''' Fills a hash table with linear probing.
+
+        @param table: a sequence of integers, holding the hash and the
+                      offset of each slot in turn.
+        @param hashes: the hashes of names.
+        @param offsets: the offsets of the corresponding records.
+    '''
+    # mark all slots as empty
+    empty_slots = array('Q', (0, _EMPTY)) * min(len(table) // 2, 65536)
+    for start in range(0, len(table), len(empty_slots)):
+        end = min(start + len(empty_slots), len(table))
+        table[start:end] = empty_slots[:end-start]
+
+    mask = len(table) - 1
+    for name_hash, offset in zip(hashes, offsets):
+        pos = (name_hash << 1) & mask
+        while table[pos+1] != _EMPTY:
+            pos = (pos + 2) & mask
+        table[pos] = name_hash
+        table[pos+1] = offset
+
+_hasher = partial(blake2b, digest_size=8)
+_digest = methodcaller('digest')
+_first_token = itemgetter(0)
+
+
+class IndexedFastqReader(object):
+    ''' Random access reader for FASTQ files.
+
+        Records are retrieved by ordinal (0-based) or by name (the text
+        of the label before the first whitespace) from a memory mapped
+        view of the file. Sequences and qualities may span several lines.
+
+        The reader relies on an index saved next to the FASTQ file (by
+        default, its path followed by L{INDEX_SUFFIX}) and reused as long
+        as the size and the modification time of the file don't change.
+        The index is memory mapped as well: opening it takes constant
+        time and lookups touch just a few of its pages. It holds:
+          - the byte offset of every I{stride}-th record: retrieving a
+            record by ordinal requires parsing up to I{stride}-1 records
+            following the closest offset, in exchange for a smaller index;
+          - optionally, a hash table (with linear probing) mapping the
+            64-bit hash of each name to the offset of its record. Records
+            found through the table are checked against the requested
+            name, so that hash collisions are harmless. When several
+            records share a name, the first one is returned.
+
+        Building the index requires a full scan of the FASTQ file. Besides
+        the index itself (between 29 and 51 bytes per record, when all
+        offsets and names are indexed), 16 bytes of memory are needed
+        for each record.
+
+        This class exposes the following properties:
+          - B{filename}: the path of the FASTQ file;
+          - B{stride}: the distance between records whose offset is indexed;
+          - B{has_names}: whether records can be retrieved by name.
+    '''
+
+    def __init__(self, filename, index=None, save_index=True, stride=None, names=True):
+        ''' Object constructor.
+
+            @param filename: the path of the file to read. The file must
+                             not be compressed.
+            @param index: the path of the index. If B{None}, the FASTQ
+                          path followed by L{INDEX_SUFFIX} is used.
+            @param save_index: whether to write the index when it is
+                               missing, out of date or not matching the
+                               requested parameters.
+            @param stride: the distance between records whose offset is
+                           indexed. If B{None}, an existing index is used
+                           whatever its stride; new indexes record every
+                           offset.
+            @param names: whether the index must support lookups by name.
+            @raises ValueError: if the file is compressed, the index is
+                                malformed or the stride is invalid.
+            @raises FormatError: if the FASTQ file is malformed.
+        '''
+        if stride is not None and stride < 1:
+            raise ValueError('invalid stride: %d' % stride)
+
+        self.filename = filename
+        self.fd = None
+        self.mf = None
+        self._index_map = None
+
+        self.fd = open(filename, 'rb')
+        try:
+            stat = fstat(self.fd.fileno())
+            self.file_size = stat.st_size
+            self.file_mtime = stat.st_mtime_ns
+            if self.file_size > 0:
+                self.mf = mmap(self.fd.fileno(), self.file_size, access=ACCESS_READ)
+                if detect_compression(self.mf[:18]) is not None:
+                    raise ValueError('cannot index compressed file %s' % filename)
+            else:
+                self.mf = b''
+
+            if index is None:
+                index = filename + INDEX_SUFFIX
+            if not self._load_index(index, stride, names):
+                self._build_index(stride or 1, names)
+                if save_index:
+                    write_atomically(index, self._index_map)
+        except:
+            self.close()
+            raise
+
+    def __del__(self):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, key):
+        ''' Retrieves a record.
+
+            @param key: the ordinal of the record (negative values count
+                        from the end) or its name.
+            @return: a (label, sequence, qualities) tuple.
+            @raises IndexError: if the ordinal is out of range.
+            @raises KeyError: if the name is missing.
+        '''
+        if type(key) == int:
+            offset, skip = self._locate(key)
+            records = self._iter_records(offset)
+            for i in range(skip):
+                next(records)
+            return next(records)
+        else:
+            name = key.encode('utf-8')
+            for offset in self._candidates(name):
+                record = next(self._iter_records(offset))
+                if read_name(record[0]) == key:
+                    return record
+            raise KeyError(key)
+
+    def close(self):
+        ''' Closes the reader. '''
+        if isinstance(self._index_map, mmap):
+            self._index_map.close()
+        self._index_map = None
+        if isinstance(self.mf, mmap):
+            self.mf.close()
+        self.mf = None
+        if self.fd is not None:
+            self.fd.close()
+            self.fd = None
+
+    def get(self, key, default=None):
+        ''' Retrieves a record, returning I{default} if it is missing. '''
+        try:
+            return self[key]
+        except (IndexError, KeyError):
+            return default
+
+    def fetch_many(self, keys):
+        ''' Retrieves several records at once.
+
+            Records are read in file order, to reduce page faults, but
+            results follow the input order.
+
+            @param keys: an iterable over ordinals or names.
+            @return: a list of (label, sequence, qualities) tuples.
+            @raises IndexError: if an ordinal is out of range.
+            @raises KeyError: if a name is missing.
+        '''
+        requests = []
+        for key in keys:
+            if type(key) == int:
+                offset = self._locate(key)[0]
+            else:
+                offset = next(self._candidates(key.encode('utf-8')), -1)
+                if offset == -1:
+                    raise KeyError(key)
+            requests.append((offset, key))
+
+        results = [ None ] * len(requests)
+        for idx in sorted(range(len(requests)), key=lambda i: requests[i][0]):
+            results[idx] = self[requests[idx][1]]
+        return results
+
+    def _locate(self, ordinal):
+        ''' @return: the offset of the closest indexed record preceding
+                     the one with the given ordinal, and the number of
+                     records in between.
+        '''
+        if ordinal < 0:
+            ordinal += self.count
+        if ordinal < 0 or ordinal >= self.count:
+            raise IndexError('record index out of range')
+
+        pos = _HEADER.size + ordinal // self.stride * _UINT64.size
+        return _UINT64.unpack_from(self._index_map, pos)[0], ordinal % self.stride
+
+    def _candidates(self, name):
+        ''' Iterates over the offsets of records whose name has the same hash as I{name}. '''
+        if not self.has_names:
+            raise ValueError('the index of file %s does not support lookups by name' % self.filename)
+
+        name_hash = _name_hash(name)
+        mask = self._table_slots - 1
+        slot = name_hash & mask
+        index_map = self._index_map
+        while True:
+            entry_hash, offset = _ENTRY.unpack_from(index_map, self._table_start + slot * _ENTRY.size)
+            if offset == _EMPTY:
+                return
+            elif entry_hash == name_hash:
+                yield offset
+            slot = (slot + 1) & mask
+
+    def _iter_records(self, offset):
+        ''' Parses records starting at the given offset. '''
+        reader = FastqStreamingReader(self._iter_lines(offset), multiline=True)
+        reader.filename = self.filename
+        return iter(reader)
+
+    def _iter_lines(self, pos):
+        mf = self.mf
+        size = self.file_size
+        while pos < size:
+            end = mf.find(b'\n', pos)
+            end = size if end == -1 else end + 1
+            yield mf[pos:end].decode('utf-8')
+            pos = end
+
+    def _set_layout(self, stride, count, table_slots):
+        self.stride = stride
+        self.count = count
+        self.has_names = table_slots > 0
+        self._table_slots = table_slots
+        self._table_start = _HEADER.size + (count + stride - 1) // stride * _UINT64.size
+        return self._table_start + table_slots * _ENTRY.size
+
+    def _load_index(self, filename, stride, names):
+        ''' Loads an index.
+
+            @param filename: the path of the index.
+            @param stride: the required stride, or B{None} to accept any.
+            @param names: whether lookups by name are required.
+            @return: B{False} if the index is missing, refers to a different
+                     version of the FASTQ file or doesn't match the
+                     requested parameters; B{True} otherwise.
+            @raises ValueError: if the index is malformed.
+        '''
+        try:
+            fd = open(filename, 'rb')
+        except FileNotFoundError:
+            return False
+
+        with fd:
+            header = fd.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                raise ValueError('malformed FASTQ index %s' % filename)
+
+            magic, version, index_stride, file_size, file_mtime, count, table_slots = _HEADER.unpack(header)
+            if magic != _INDEX_MAGIC:
+                raise ValueError('malformed FASTQ index %s' % filename)
+            elif version != _INDEX_VERSION or file_size != self.file_size or file_mtime != self.file_mtime:
+                return False
+            elif (stride is not None and stride != index_stride) or (names and table_slots == 0):
+                return False
+
+            if self._set_layout(index_stride, count, table_slots) != fstat(fd.fileno()).st_size:
+                raise ValueError('malformed FASTQ index %s' % filename)
+            self._index_map = mmap(fd.fileno(), 0, access=ACCESS_READ)
+
+        return True
+
+    def _build_index(self, stride, names):
+        ''' Scans the FASTQ file and builds the index in memory. '''
+        offsets = array('Q')
+        hashes = array('Q')
+        for chunk_offsets, chunk_names in self._scan():
+            offsets.extend(chunk_offsets)
+            if names:
+                hashes.extend(_name_hashes(chunk_names))
+
+        count = len(offsets)
+        table_slots = 0
+        if names:
+            table_slots = 1
+            while table_slots * _MAX_LOAD < count + 1:
+                table_slots *= 2
+
+        index_map = mmap(-1, self._set_layout(stride, count, table_slots))
+        _HEADER.pack_into(index_map, 0, _INDEX_MAGIC, _INDEX_VERSION, stride,
+                          self.file_size, self.file_mtime, count, table_slots)
+        index_map[_HEADER.size:self._table_start] = offsets[::stride] if stride > 1 else offsets
+
+        if names:
+            # a view over the table, whose slots are (hash, offset) pairs
+            table = memoryview(index_map)[self._table_start:].cast('Q')
+            try:
+                _fill_table(table, hashes, offsets)
+            finally:
+                table.release()
+
+        if byteorder != 'little':
+            items = array('Q', index_map[_HEADER.size:])
+            items.byteswap()
+            index_map[_HEADER.size:] = items
+
+        self._index_map = index_map
+
+    def _scan(self):
+        ''' Walks the FASTQ file, as L{FastqStreamingReader} does.
+
+            Chunks of regular, 4-line records are split in bulk; after
+            the first irregular record, the rest of the file is walked
+            one record at a time, allowing for multi-line blocks.
+
+            @return: an iterator yielding the lists of the offsets and
+                     of the names (as bytes) of consecutive records.
+            @raises FormatError: if the FASTQ file is malformed.
+        '''
+        mf = self.mf
+        size = self.file_size
+        pos = 0
+        lineno = 1
+        while pos < size:
+            chunk_end = mf.rfind(b'\n', pos, min(pos + _SCAN_CHUNK_SIZE, size)) + 1
+            if chunk_end == 0:
+                break
+
+            data = mf[pos:chunk_end]
+            raw_lines = data.split(b'\n')
+            raw_lines.pop()
+            if b'\r' in data:
+                lines = list(map(bytes.rstrip, raw_lines, repeat(b'\r')))
+            else:
+                lines = raw_lines
+            headers, seqs, quals, parsed_lines = _split_blocks(lines, b'@', b'+')
+
+            # offsets of records, from the lengths of their lines (plus terminators)
+            ends = list(accumulate(map(len, raw_lines[:parsed_lines]), initial=pos))
+            offsets = list(map(add, ends[0::4], range(0, parsed_lines + 1, 4)))
+            yield offsets[:-1], _read_names(list(map(_strip_marker, headers)))
+
+            pos = offsets[-1]
+            lineno += parsed_lines
+            # up to 3 trailing lines are part of a record completed by
+            # the next chunk; anything else is an irregular record
+            if parsed_lines == 0 or parsed_lines < len(lines) // 4 * 4:
+                break
+
+        while pos < size:
+            name, end, lines = self._scan_record(pos, lineno)
+            yield [ pos ], [ name ]
+            pos = end
+            lineno += lines
+
+    def _scan_record(self, pos, lineno):
+        ''' Walks a record possibly spanning several lines.
+
+            @return: the name of the record (as bytes), its end offset
+                     and its number of lines.
+        '''
+        mf = self.mf
+        size = self.file_size
+        find = mf.find
+
+        header_end = find(b'\n', pos)
+        if header_end == -1:
+            raise FormatError('incomplete FASTQ block in file %s at line: %d' % (self.filename, lineno))
+        elif mf[pos:pos+1] != b'@':
+            raise FormatError('invalid FASTQ header in file %s at line %d: %s' %
+                              (self.filename, lineno, mf[pos:header_end+1].decode('utf-8')))
+        name = read_name(mf[pos+1:header_end])
+
+        # sequence lines, up to the quality header (the first line is
+        # always part of the sequence)
+        line_start = header_end + 1
+        seq_len = 0
+        lines = 1
+        while True:
+            line_end = find(b'\n', line_start)
+            if line_end == -1:
+                raise FormatError('incomplete FASTQ block in file %s at line: %d' % (self.filename, lineno + lines))
+            lines += 1
+            line = mf[line_start:line_end]
+            line_start = line_end + 1
+            if lines > 2 and line[:1] == b'+':
+                break
+            seq_len += len(line.rstrip(b'\r'))
+
+        # quality lines, until their length matches the sequence
+        qual_len = -1
+        while qual_len < seq_len:
+            if line_start >= size:
+                raise FormatError('incomplete FASTQ block in file %s at line: %d' % (self.filename, lineno + lines))
+            line_end = find(b'\n', line_start)
+            if line_end == -1:
+                line_end = size
+            lines += 1
+            qual_len = max(qual_len, 0) + len(mf[line_start:line_end].rstrip(b'\r'))
+            line_start = line_end + 1
+
+        if qual_len > seq_len:
+            raise FormatError('invalid quality in file %s at line %d' % (self.filename, lineno + lines - 1))
+
+        return name, line_start, lines
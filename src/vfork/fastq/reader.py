@@ -5,7 +5,20 @@
 
 ''' Reader for the FASTQ format. '''
 
-from itertools import chain
+from array import array
+from collections import deque
+from itertools import accumulate, chain, islice, repeat
+from operator import itemgetter
+from multiprocessing import Pool, cpu_count
+from queue import Queue, Full
+from threading import Event, Thread
+from ..io.compression import open_input
+
+
+#: The default number of blocks in a batch (see L{FastqStreamingReader.iter_batches}).
+DEFAULT_BATCH_SIZE = 10000
+
+_READ_CHUNK_SIZE = 4 * 1024 * 1024
 
 
 class FormatError(Exception):
@@ -28,19 +41,33 @@ class FastqStreamingReader(object):
         remain undetected.
 
         This choice is a tradeoff to gain processing speed.
+
+        Multi-line blocks
+        =================
+
+        Blocks are first parsed assuming they span exactly 4 lines.
+        On the first block not matching this layout, the reader
+        switches to a mode where sequences and qualities may be
+        wrapped over several lines. Files known to be wrapped (e.g.
+        those holding long reads) can be parsed in this mode from
+        the start.
     '''
 
-    def __init__(self, src):
+    def __init__(self, src, multiline=False):
         ''' Opens a FASTQ reader.
 
             @param src: the path of the file to read or a file descriptor.
+                        Compressed files are decompressed on the fly.
+            @param multiline: whether to parse all blocks in multi-line mode.
         '''
         if type(src) is str:
             self.filename = src
-            self.fd = file(src, 'r')
+            self.fd = open_input(src)
         else:
             self.filename = getattr(src, 'name', '<unknown>')
             self.fd = src
+        self.multiline = multiline
+        self._first_lineno = 1
 
     def __iter__(self):
         ''' Iterates over the blocks of the FASTQ file.
@@ -49,7 +76,11 @@ class FastqStreamingReader(object):
             @raises FormatError: when the FASTQ file is malformed.
         '''
         fd = self.fd
-        lineno = 1
+        lineno = self._first_lineno
+        if self.multiline:
+            for record in self._iter_multiline(fd, lineno):
+                yield record
+            return
 
         try:
             while 1:
@@ -75,40 +106,651 @@ class FastqStreamingReader(object):
                 raise FormatError('incomplete FASTQ block in file %s at line: %d' % (self.filename, lineno))
 
         except _ParseIrregularFastq:
-            lineno -= 4
-            fd = chain([header, seq, header2, qual], fd)
+            fd = chain([header, seq + '\n', header2, qual + '\n'], fd)
+            for record in self._iter_multiline(fd, lineno - 4):
+                yield record
+
+    def _iter_multiline(self, fd, lineno):
+        ''' Parses blocks whose sequences and qualities may span several lines.
+
+            Sequence lines are collected up to the quality header and
+            joined once; quality lines are then read until their total
+            length reaches the one of the sequence. Long reads wrapped
+            over many lines are thus parsed in linear time.
+
+            @param fd: an iterator over the lines of the file.
+            @param lineno: the number of the first line.
+        '''
+        try:
+            while 1:
+                inside_block = False
+                header = next(fd); lineno += 1
+                inside_block = True
+
+                if header[0] != '@':
+                    raise FormatError('invalid FASTQ header in file %s at line %d: %s' % (self.filename, lineno-1, header))
+                elif len(header) < 2:
+                    raise FormatError('empty FASTQ label in file %s at line %d' % (self.filename, lineno-1))
+
+                seq_lines = [ next(fd) ]; lineno += 1
+                while True:
+                    another_line = next(fd); lineno += 1
+                    if another_line[0] != '+':
+                        seq_lines.append(another_line)
+                    else:
+                        break
+
+                if len(seq_lines) == 1:
+                    seq = seq_lines[0].rstrip('\r\n')
+                else:
+                    seq = ''.join(map(str.rstrip, seq_lines, repeat('\r\n')))
+
+                seq_len = len(seq)
+                qual_line = next(fd).rstrip('\r\n'); lineno += 1
+                qual_len = len(qual_line)
+                if qual_len >= seq_len:
+                    qual = qual_line
+                else:
+                    qual_lines = [ qual_line ]
+                    while qual_len < seq_len:
+                        qual_line = next(fd).rstrip('\r\n'); lineno += 1
+                        qual_lines.append(qual_line)
+                        qual_len += len(qual_line)
+                    qual = ''.join(qual_lines)
+
+                if qual_len > seq_len:
+                    raise FormatError('invalid quality in file %s at line %d' % (self.filename, lineno-1))
+
+                yield header[1:].rstrip('\r\n'), seq, qual
+
+        except StopIteration:
+            if inside_block:
+                raise FormatError('incomplete FASTQ block in file %s at line: %d' % (self.filename, lineno))
+
+    def iter_batches(self, size, numpy=False):
+        ''' Iterates over groups of FASTQ blocks, stored by columns.
+
+            When the underlying binary file is available, blocks are
+            split in bulk, without building Python objects for sequences
+            and qualities. In this case, the source file must not have
+            been read through its text layer before.
+
+            @param size: the number of blocks in each group (the last
+                         group may be smaller).
+            @param numpy: whether sequences, qualities and offsets should
+                          be returned as NumPy arrays (see L{FastqBatch}).
+            @return: an iterator yielding L{FastqBatch} instances.
+            @raises FormatError: when the FASTQ file is malformed.
+        '''
+        if size < 1:
+            raise ValueError('invalid batch size: %d' % size)
+
+        fd = getattr(self.fd, 'buffer', None)
+        if fd is None or self.multiline:
+            batches = self._group_blocks(iter(self), [], [], [], size)
+        else:
+            batches = self._iter_binary_batches(fd, size)
+
+        for batch in batches:
+            if numpy:
+                batch.to_numpy()
+            yield batch
+
+    def _iter_binary_batches(self, fd, size):
+        lineno = self._first_lineno
+        line_groups = _LineGroups(fd, 4 * size)
+        groups = iter(line_groups)
+        for lines in groups:
+            headers, seqs, quals, parsed_lines = _split_blocks(lines, b'@', b'+')
+            if len(headers) > 0:
+                # headers were checked: labels can be split on the next marker
+                labels = b'\n'.join(headers)[1:].decode('utf-8').split('\n@')
+            else:
+                labels = []
+
+            if parsed_lines < len(lines):
+                # fall back to the sequential parser
+                tail = chain(lines[parsed_lines:], chain.from_iterable(groups))
+                reader = FastqStreamingReader(_decode_lines(tail, line_groups))
+                reader.filename = self.filename
+                reader._first_lineno = lineno + parsed_lines
+
+                seqs = list(map(bytes.decode, seqs))
+                quals = list(map(bytes.decode, quals))
+                for batch in self._group_blocks(iter(reader), labels, seqs, quals, size):
+                    yield batch
+                return
+
+            yield FastqBatch(labels, b''.join(seqs), b''.join(quals), _offsets(seqs))
+            lineno += len(lines)
+
+    def _group_blocks(self, blocks, labels, seqs, quals, size):
+        ''' Groups (header, sequence, qualities) tuples into batches,
+            starting from the columns of an incomplete one.
+        '''
+        for label, seq, qual in blocks:
+            labels.append(label)
+            seqs.append(seq)
+            quals.append(qual)
+            if len(labels) == size:
+                yield FastqBatch(labels, ''.join(seqs).encode('ascii'), ''.join(quals).encode('ascii'), _offsets(seqs))
+                labels, seqs, quals = [], [], []
+
+        if len(labels) > 0:
+            yield FastqBatch(labels, ''.join(seqs).encode('ascii'), ''.join(quals).encode('ascii'), _offsets(seqs))
+
+
+class FastqBatch(object):
+    ''' A group of FASTQ blocks, stored by columns.
+
+        This class exposes the following properties:
+          - B{labels}: the list of block labels;
+          - B{sequences}: the concatenation of all sequences;
+          - B{qualities}: the concatenation of all quality strings;
+          - B{offsets}: the position of each block within B{sequences}
+            and B{qualities} (which are aligned, since sequences and
+            qualities have the same length), followed by their total
+            length.
+
+        By default, B{sequences} and B{qualities} are bytes objects and
+        B{offsets} is an C{array('Q')}. After L{to_numpy}, they are
+        NumPy arrays of type C{uint8} and C{int64}, respectively; the
+        first two share memory with the original bytes.
+    '''
+
+    def __init__(self, labels, sequences, qualities, offsets):
+        self.labels = labels
+        self.sequences = sequences
+        self.qualities = qualities
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __iter__(self):
+        ''' Iterates over the blocks of the batch.
+
+            @return: an iterator yielding (label, sequence, qualities) tuples.
+        '''
+        seqs = bytes(self.sequences).decode('ascii')
+        quals = bytes(self.qualities).decode('ascii')
+        slices = _slices(self.offsets)
+        return zip(self.labels, map(seqs.__getitem__, slices), map(quals.__getitem__, slices))
+
+    def __getitem__(self, idx):
+        ''' Retrieves a single block.
+
+            @return: a (label, sequence, qualities) tuple.
+        '''
+        if idx < 0:
+            idx += len(self.labels)
+        start = int(self.offsets[idx])
+        stop = int(self.offsets[idx+1])
+        return self.labels[idx], \
+               bytes(self.sequences[start:stop]).decode('ascii'), \
+               bytes(self.qualities[start:stop]).decode('ascii')
+
+    def lengths(self):
+        ''' Computes the length of each sequence.
+
+            @return: a list, or a NumPy array after L{to_numpy}.
+        '''
+        if isinstance(self.offsets, array):
+            return [ b - a for a, b in zip(self.offsets, islice(self.offsets, 1, None)) ]
+        else:
+            return self.offsets[1:] - self.offsets[:-1]
+
+    def to_numpy(self):
+        ''' Converts sequences, qualities and offsets into NumPy arrays. '''
+        import numpy as np
+
+        if isinstance(self.offsets, array):
+            self.sequences = np.frombuffer(self.sequences, dtype=np.uint8)
+            self.qualities = np.frombuffer(self.qualities, dtype=np.uint8)
+            self.offsets = np.array(self.offsets, dtype=np.int64)
+
+
+class PairedFastqReader(object):
+    ''' A reader for paired-end FASTQ files.
+
+        Mates are read either from two files, holding the first and the
+        second mates in the same order, or from a single interleaved
+        file, where each first mate is followed by the second one.
+
+        When two files are given, each one is read and decompressed by
+        a separate thread, so that the two streams are processed
+        concurrently (the decompressors of the standard library release
+        the GIL, and external ones run in their own process; see
+        L{open_input}).
+
+        Mate names are checked a batch at a time. Two labels are
+        consistent when they are equal or when they share the same name,
+        i.e. the text before the first space, possibly followed by
+        C{/1} and C{/2} in all first and second mates, respectively.
+    '''
+
+    def __init__(self, src1, src2=None, check_names=True, batch_size=DEFAULT_BATCH_SIZE, queue_depth=2):
+        ''' Opens a paired-end FASTQ reader.
+
+            @param src1: the path of the file holding the first mates (or
+                         both mates, when I{src2} is B{None}), or a file
+                         descriptor. Compressed files are decompressed on
+                         the fly.
+            @param src2: the path of the file holding the second mates or
+                         a file descriptor.
+            @param check_names: whether mate names should be checked.
+            @param batch_size: the number of pairs read at a time when
+                               iterating over single pairs.
+            @param queue_depth: the number of batches each thread may
+                                read ahead.
+        '''
+        self.reader1 = FastqStreamingReader(src1)
+        self.reader2 = None if src2 is None else FastqStreamingReader(src2)
+        self.check_names = check_names
+        self.batch_size = batch_size
+        self.queue_depth = queue_depth
+
+    def __iter__(self):
+        ''' Iterates over the pairs of the FASTQ files.
+
+            @return: an iterator yielding pairs of (header, sequence,
+                     qualities) tuples.
+            @raises FormatError: when a FASTQ file is malformed or mates
+                                 do not match.
+        '''
+        for batch1, batch2 in self.iter_batches(self.batch_size):
+            for pair in zip(batch1, batch2):
+                yield pair
+
+    def iter_batches(self, size, numpy=False):
+        ''' Iterates over groups of pairs, stored by columns.
+
+            @param size: the number of pairs in each group (the last
+                         group may be smaller).
+            @param numpy: whether sequences, qualities and offsets should
+                          be returned as NumPy arrays (see L{FastqBatch}).
+            @return: an iterator yielding pairs of L{FastqBatch} instances,
+                     holding the first and the second mates.
+            @raises FormatError: when a FASTQ file is malformed or mates
+                                 do not match.
+        '''
+        if self.reader2 is None:
+            filename1 = filename2 = self.reader1.filename
+            batches = self._split_interleaved(self.reader1.iter_batches(2 * size))
+        else:
+            filename1 = self.reader1.filename
+            filename2 = self.reader2.filename
+            batches = self._zip_batches(_prefetch(self.reader1.iter_batches(size), self.queue_depth),
+                                        _prefetch(self.reader2.iter_batches(size), self.queue_depth))
+
+        for batch1, batch2 in batches:
+            if self.check_names:
+                _check_mate_names(batch1.labels, batch2.labels, filename1, filename2)
+            if numpy:
+                batch1.to_numpy()
+                batch2.to_numpy()
+            yield batch1, batch2
+
+    def _split_interleaved(self, batches):
+        for batch in batches:
+            if len(batch) % 2 != 0:
+                raise FormatError('odd number of FASTQ blocks in interleaved file %s' % self.reader1.filename)
+
+            slices = _slices(batch.offsets)
+            mates = []
+            for first in (0, 1):
+                mate_slices = slices[first::2]
+                seqs = list(map(batch.sequences.__getitem__, mate_slices))
+                mates.append(FastqBatch(batch.labels[first::2], b''.join(seqs),
+                                        b''.join(map(batch.qualities.__getitem__, mate_slices)),
+                                        _offsets(seqs)))
+            yield mates
 
+    def _zip_batches(self, batches1, batches2):
+        # batches hold the same number of blocks, except the last ones
+        for batch1 in batches1:
+            batch2 = next(batches2, None)
+            if batch2 is None or len(batch2) < len(batch1):
+                raise FormatError('file %s has more FASTQ blocks than %s' % (self.reader1.filename, self.reader2.filename))
+            elif len(batch2) > len(batch1):
+                break
+            yield batch1, batch2
+        else:
+            if next(batches2, None) is None:
+                return
+        raise FormatError('file %s has more FASTQ blocks than %s' % (self.reader2.filename, self.reader1.filename))
+
+
+class ParallelFastqReader(object):
+    ''' A FASTQ reader splitting the work among several processes.
+
+        The input is read in large chunks, cut at block boundaries,
+        which are parsed in parallel by a pool of worker processes.
+        Blocks are returned in the same order they appear in the file.
+        When the input is compressed, decompression is carried out by
+        a separate process (see L{open_input}).
+
+        Chunks are cut assuming that each block spans exactly 4 lines.
+        Whenever a worker finds a block not matching this layout, the
+        rest of the file is parsed sequentially, as L{FastqStreamingReader}
+        does. Validation and error messages are the same of that class.
+    '''
+
+    def __init__(self, src, processes=None, chunk_size=4*1024*1024, queue_depth=None):
+        ''' Opens a FASTQ reader.
+
+            @param src: the path of the file to read or a file descriptor.
+                        Compressed files are decompressed on the fly.
+            @param processes: the number of parsing processes. If B{None},
+                              the number of CPUs. With a single process,
+                              chunks are parsed by the calling one.
+            @param chunk_size: the approximate size of chunks, in bytes.
+            @param queue_depth: the maximum number of chunks being parsed
+                                or waiting to be returned, which bounds
+                                memory usage. If B{None}, twice the number
+                                of processes.
+        '''
+        if type(src) is str:
+            self.filename = src
+        else:
+            self.filename = getattr(src, 'name', '<unknown>')
+        self.fd = open_input(src, 'rb')
+
+        self.processes = processes or cpu_count()
+        self.chunk_size = chunk_size
+        self.queue_depth = queue_depth or 2 * self.processes
+
+    def __iter__(self):
+        ''' Iterates over the blocks of the FASTQ file.
+
+            @return: an iterator yielding (header, sequence, qualities) tuples.
+            @raises FormatError: when the FASTQ file is malformed.
+        '''
+        pool = Pool(self.processes) if self.processes > 1 else None
+        try:
+            pending = deque()
+            chunks = self._iter_chunks()
+            lineno = 1
+
+            while True:
+                while len(pending) < self.queue_depth:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+
+                    if pool is None:
+                        pending.append((chunk, lineno, _parse_chunk(chunk)))
+                    else:
+                        pending.append((chunk, lineno, pool.apply_async(_parse_chunk, (chunk,))))
+                    lineno += chunk.count(b'\n')
+
+                if len(pending) == 0:
+                    break
+
+                chunk, chunk_lineno, result = pending.popleft()
+                labels, seqs, quals, parsed_lines = result if pool is None else result.get()
+                for record in zip(labels, seqs, quals):
+                    yield record
+
+                if parsed_lines is not None:
+                    # fall back to the sequential parser
+                    rest = chunk.split(b'\n', parsed_lines)[-1] if parsed_lines > 0 else chunk
+                    tail = chain([rest], (c for c, _, _ in pending), chunks)
+
+                    reader = FastqStreamingReader(_iter_lines(tail))
+                    reader.filename = self.filename
+                    reader._first_lineno = chunk_lineno + parsed_lines
+                    for record in reader:
+                        yield record
+                    break
+
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    def _iter_chunks(self):
+        ''' Reads the input in chunks holding a multiple of 4 lines,
+            translating terminators as in universal newlines mode.
+        '''
+        leftover = b''
+        for data in _iter_translated_chunks(self.fd, self.chunk_size):
+            chunk = leftover + data
+            excess_lines = chunk.count(b'\n') % 4
+
+            cut = len(chunk)
+            for i in range(excess_lines + 1):
+                cut = chunk.rfind(b'\n', 0, cut)
+            if cut == -1:
+                leftover = chunk
+            else:
+                leftover = chunk[cut+1:]
+                yield chunk[:cut+1]
+
+        if len(leftover) > 0:
+            yield leftover
+
+
+def _parse_chunk(chunk):
+    ''' Parses a chunk of regular, 4-line FASTQ blocks.
+
+        @param chunk: the chunk content, as bytes with translated terminators.
+        @return: a (labels, sequences, qualities, parsed lines) tuple. The
+                 last item is the number of lines successfully parsed if
+                 a block could not be handled, B{None} otherwise.
+    '''
+    lines = chunk.decode('utf-8').split('\n')
+    # drop what follows the last newline: either nothing or,
+    # at the end of the file, an unterminated line
+    lines.pop()
+
+    headers, seqs, quals, line_num = _split_blocks(lines, '@', '+')
+    labels = list(map(_strip_marker, headers))
+    if line_num < len(lines) or chunk[-1:] != b'\n':
+        return labels, seqs, quals, line_num
+    else:
+        return labels, seqs, quals, None
+
+def _split_blocks(lines, header_marker, header2_marker):
+    ''' Splits lines, without terminators, into regular 4-line FASTQ blocks.
+
+        Lines are checked in bulk by means of C{map}, so that no Python
+        code runs for each block unless an anomaly is found.
+
+        @param lines: a list of strings or bytes.
+        @param header_marker: the first character of headers, of the same type of lines.
+        @param header2_marker: the first character of quality headers.
+        @return: the lists of headers, sequences and qualities, plus
+                 the number of lines belonging to the leading sequence
+                 of valid blocks.
+    '''
+    startswith = type(header_marker).startswith
+    empty = header_marker[:0]
+    line_num = len(lines) // 4 * 4
+    headers = lines[0:line_num:4]
+    seqs = lines[1:line_num:4]
+    headers2 = lines[2:line_num:4]
+    quals = lines[3:line_num:4]
+
+    # gather the first character of each header: empty lines contribute nothing
+    if not (empty.join(map(_first_char, headers)).count(header_marker) == len(headers) and \
+            empty.join(map(_first_char, headers2)).count(header2_marker) == len(headers2) and \
+            list(map(len, seqs)) == list(map(len, quals))):
+        for idx, (header, seq, header2, qual) in enumerate(zip(headers, seqs, headers2, quals)):
+            if not startswith(header, header_marker) or not startswith(header2, header2_marker) or len(seq) != len(qual):
+                break
+        del headers[idx:], seqs[idx:], quals[idx:]
+        line_num = idx * 4
+
+    return headers, seqs, quals, line_num
+
+def _offsets(seqs):
+    return array('Q', accumulate(map(len, seqs), initial=0))
+
+def _slices(offsets):
+    offsets = offsets.tolist()
+    return list(map(slice, offsets, islice(offsets, 1, None)))
+
+def _mate_names(labels, suffix):
+    ''' Extracts the names of mates, dropping I{suffix} if all of them end with it. '''
+    names = list(map(itemgetter(0), map(str.partition, labels, repeat(' '))))
+    if all(map(str.endswith, names, repeat(suffix))):
+        names = list(map(_strip_mate_suffix, names))
+    return names
+
+def _check_mate_names(labels1, labels2, filename1, filename2):
+    if labels1 == labels2:
+        return
+
+    names1 = _mate_names(labels1, '/1')
+    names2 = _mate_names(labels2, '/2')
+    if names1 != names2:
+        for label1, label2, name1, name2 in zip(labels1, labels2, names1, names2):
+            if name1 != name2:
+                raise FormatError('mismatched mate names in files %s and %s: %s, %s' % (filename1, filename2, label1, label2))
+
+def _prefetch(iterator, depth):
+    ''' Consumes an iterator in a background thread.
+
+        @param iterator: the iterator to consume.
+        @param depth: the number of items that may be read ahead.
+        @return: an iterator yielding the same items. Exceptions raised
+                 by I{iterator} are raised again by the returned one.
+    '''
+    items = Queue(depth)
+    stop = Event()
+
+    def put(item):
+        while not stop.is_set():
             try:
-                while 1:
-                    inside_block = False
-                    header = next(fd); lineno += 1
-                    inside_block = True
-
-                    if header[0] != '@':
-                        raise FormatError('invalid FASTQ header in file %s at line %d: %s' % (self.filename, lineno-1, header))
-                    elif len(header) < 2:
-                        raise FormatError('empty FASTQ label in file %s at line %d' % (self.filename, lineno-1))
-
-                    seq = next(fd).rstrip('\r\n'); lineno += 1
-                    while True:
-                        another_line = next(fd); lineno += 1
-                        if another_line[0] != '+':
-                            seq += another_line.rstrip('\r\n')
-                        else:
-                            break
-
-                    seq_len = len(seq)
-                    qual = ''
-                    while 1:
-                        qual += next(fd).rstrip('\r\n'); lineno += 1
-                        if len(qual) >= seq_len:
-                            break
-
-                    if len(qual) > seq_len:
-                        raise FormatError('invalid quality in file %s at line %d' % (self.filename, lineno-1))
-
-                    yield header[1:].rstrip('\r\n'), seq, qual
-
-            except StopIteration:
-                if inside_block:
-                    raise FormatError('incomplete FASTQ block in file %s at line: %d' % (self.filename, lineno))
+                items.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def run():
+        try:
+            for item in iterator:
+                if not put((True, item)):
+                    return
+            put((False, None))
+        except BaseException as e:
+            put((False, e))
+
+    Thread(target=run, daemon=True).start()
+    try:
+        while True:
+            is_item, value = items.get()
+            if is_item:
+                yield value
+            elif value is None:
+                return
+            else:
+                raise value
+    finally:
+        # let the thread exit if the consumer stops early
+        stop.set()
+
+_first_char = itemgetter(slice(0, 1))
+_strip_marker = itemgetter(slice(1, None))
+_strip_mate_suffix = itemgetter(slice(None, -2))
+
+def _iter_translated_chunks(fd, chunk_size):
+    ''' Reads a file in chunks, translating "\\r\\n" and lone "\\r"
+        terminators into "\\n", as universal newlines mode does.
+
+        A carriage return ending a chunk is held back, since the next
+        chunk may start with the matching newline.
+
+        @param fd: a file object; text is encoded in UTF-8.
+        @param chunk_size: how many bytes (or characters) to read at a time.
+        @return: an iterator yielding non-empty bytes.
+    '''
+    held_cr = b''
+    while True:
+        data = fd.read(chunk_size)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if len(data) == 0:
+            if len(held_cr) > 0:
+                yield b'\n'
+            return
+
+        chunk = held_cr + data
+        held_cr = b''
+        if chunk[-1:] == b'\r':
+            chunk = chunk[:-1]
+            held_cr = b'\r'
+        if b'\r' in chunk:
+            chunk = chunk.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+        if len(chunk) > 0:
+            yield chunk
+
+class _LineGroups(object):
+    ''' Splits a binary file into groups of lines, without terminators.
+
+        Terminators are translated as in universal newlines mode (see
+        L{_iter_translated_chunks}).
+
+        This class exposes the following property:
+          - B{terminated}: once all groups have been read, whether the
+            last line of the file ends with a newline.
+    '''
+
+    def __init__(self, fd, count):
+        ''' Object constructor.
+
+            @param fd: a binary file object.
+            @param count: the number of lines in each group (the last one
+                          may be shorter).
+        '''
+        self.fd = fd
+        self.count = count
+        self.terminated = True
+
+    def __iter__(self):
+        ''' @return: an iterator yielding lists of bytes. '''
+        count = self.count
+        pending = []
+        leftover = b''
+        for data in _iter_translated_chunks(self.fd, _READ_CHUNK_SIZE):
+            lines = (leftover + data).split(b'\n')
+            leftover = lines.pop()
+            pending.extend(lines)
+
+            while len(pending) >= count:
+                yield pending[:count]
+                del pending[:count]
+
+        if len(leftover) > 0:
+            pending.append(leftover)
+            self.terminated = False
+
+        while len(pending) > 0:
+            yield pending[:count]
+            del pending[:count]
+
+def _decode_lines(lines, line_groups):
+    ''' Decodes lines split by a L{_LineGroups} instance, restoring their terminators.
+
+        @param lines: an iterator over the lines following those already parsed.
+        @param line_groups: the source of the lines.
+    '''
+    line = next(lines, None)
+    while line is not None:
+        next_line = next(lines, None)
+        if next_line is None and not line_groups.terminated:
+            yield line.decode('utf-8')
+        else:
+            yield line.decode('utf-8') + '\n'
+        line = next_line
+
+def _iter_lines(chunks):
+    ''' Splits a series of chunks, cut at line boundaries, into text lines. '''
+    for chunk in chunks:
+        lines = chunk.decode('utf-8').split('\n')
+        last_line = lines.pop()
+        for line in lines:
+            yield line + '\n'
+        if len(last_line) > 0:
+            yield last_line
@@ -0,0 +1,210 @@
+# Copyright 2012 Gabriele Sales <gbrsales@gmail.com>
+#
+# This file is part of BioinfoTree. It is licensed under the
+# terms of the GNU Affero General Public License version 3.
+
+''' Quality score statistics for FASTQ files.
+
+    Qualities are processed in batches (see
+    L{FastqStreamingReader.iter_batches}): each batch is decoded into a
+    single NumPy array of Phred scores and summarized with array
+    operations, so that no Python code runs for each read or base.
+    Statistics are accumulated in fixed-size tables, whose size depends
+    only on the length of the longest read: memory usage does not grow
+    with the number of reads.
+'''
+
+import numpy as np
+
+from .reader import FastqStreamingReader, DEFAULT_BATCH_SIZE
+
+
+#: The offsets of the supported quality encodings.
+PHRED_OFFSETS = (33, 64)
+
+#: The highest Phred score that can be encoded with printable characters.
+MAX_SCORE = 126 - 33
+
+
+def decode_qualities(qualities, offset=33):
+    ''' Converts encoded quality strings into Phred scores.
+
+        @param qualities: the concatenated quality strings, either as
+                          bytes or as a NumPy array of type C{uint8}.
+        @param offset: the encoding offset (33 or 64).
+        @return: a NumPy array of type C{uint8}.
+        @raises ValueError: if the offset is not supported or a quality
+                            character is out of range.
+    '''
+    if offset not in PHRED_OFFSETS:
+        raise ValueError('unsupported quality offset: %d' % offset)
+
+    encoded = np.frombuffer(qualities, dtype=np.uint8)
+    if len(encoded) > 0 and (encoded.min() < offset or encoded.max() > 126):
+        raise ValueError('quality characters out of range for Phred+%d encoding' % offset)
+    return encoded - np.uint8(offset)
+
+def read_summaries(scores, offsets, threshold=30):
+    ''' Summarizes the qualities of each read in a batch.
+
+        @param scores: the Phred scores of all reads, as returned by L{decode_qualities}.
+        @param offsets: the start of each read within I{scores},
+                        followed by the length of I{scores}.
+        @param threshold: the score threshold used to compute the last statistic.
+        @return: three NumPy arrays, with the mean score, the minimum
+                 score and the fraction of scores not lower than
+                 I{threshold} for each read. Empty reads have a mean
+                 and fraction of NaN and a minimum of 0.
+    '''
+    offsets = np.asarray(offsets, dtype=np.int64)
+    starts = offsets[:-1]
+    lengths = np.diff(offsets)
+
+    cumulative = np.zeros(len(scores) + 1, dtype=np.int64)
+    np.cumsum(scores, out=cumulative[1:])
+    cumulative_above = np.zeros(len(scores) + 1, dtype=np.int64)
+    np.cumsum(scores >= threshold, out=cumulative_above[1:])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = (cumulative[offsets[1:]] - cumulative[starts]) / lengths
+        fractions = (cumulative_above[offsets[1:]] - cumulative_above[starts]) / lengths
+
+    mins = np.zeros(len(starts), dtype=np.uint8)
+    non_empty = lengths > 0
+    if non_empty.any():
+        # empty reads don't split segments: each one extends to the next non-empty read
+        mins[non_empty] = np.minimum.reduceat(scores, starts[non_empty])
+
+    return means, mins, fractions
+
+
+class QualityStats(object):
+    ''' Accumulates quality statistics over a stream of FASTQ batches.
+
+        This class exposes the following properties:
+          - B{offset}: the quality encoding offset;
+          - B{threshold}: the score threshold (30 by default);
+          - B{reads}: the number of reads;
+          - B{bases}: the number of bases;
+          - B{score_counts}: the number of bases having each score;
+          - B{read_mean_counts}: the number of non-empty reads whose
+            mean score, rounded down, equals each value;
+          - B{read_min_counts}: the number of non-empty reads whose
+            minimum score equals each value;
+          - B{cycle_counts}: the number of reads covering each cycle;
+          - B{cycle_sums}: the sum of scores at each cycle;
+          - B{cycle_above}: the number of scores not lower than the
+            threshold at each cycle.
+
+        All counters are NumPy arrays of type C{int64}. Score tables
+        have L{MAX_SCORE}+1 entries; cycle tables grow up to the length
+        of the longest read.
+    '''
+
+    def __init__(self, offset=33, threshold=30):
+        ''' Object constructor.
+
+            @param offset: the quality encoding offset (33 or 64).
+            @param threshold: the score threshold for the fraction of
+                              high quality bases (e.g. 30 for Q30).
+            @raises ValueError: if the offset is not supported.
+        '''
+        if offset not in PHRED_OFFSETS:
+            raise ValueError('unsupported quality offset: %d' % offset)
+
+        self.offset = offset
+        self.threshold = threshold
+        self.reads = 0
+        self.bases = 0
+        self.score_counts = np.zeros(MAX_SCORE + 1, dtype=np.int64)
+        self.read_mean_counts = np.zeros(MAX_SCORE + 1, dtype=np.int64)
+        self.read_min_counts = np.zeros(MAX_SCORE + 1, dtype=np.int64)
+        self.cycle_counts = np.zeros(0, dtype=np.int64)
+        self.cycle_sums = np.zeros(0, dtype=np.int64)
+        self.cycle_above = np.zeros(0, dtype=np.int64)
+
+    def update(self, batch):
+        ''' Adds the reads of a batch to the statistics.
+
+            @param batch: a L{FastqBatch}, with or without NumPy arrays.
+            @return: the Phred scores of the batch and the summaries
+                     computed by L{read_summaries}, so that callers can
+                     report per-read values without decoding twice.
+            @raises ValueError: if a quality character is out of range.
+        '''
+        scores = decode_qualities(batch.qualities, self.offset)
+        offsets = np.asarray(batch.offsets, dtype=np.int64)
+        lengths = np.diff(offsets)
+        means, mins, fractions = read_summaries(scores, offsets, self.threshold)
+
+        self.reads += len(lengths)
+        self.bases += len(scores)
+        self.score_counts += np.bincount(scores, minlength=MAX_SCORE + 1)
+
+        non_empty = lengths > 0
+        self.read_mean_counts += np.bincount(means[non_empty].astype(np.int64), minlength=MAX_SCORE + 1)
+        self.read_min_counts += np.bincount(mins[non_empty], minlength=MAX_SCORE + 1)
+
+        if len(scores) > 0:
+            self._update_cycles(scores, offsets, lengths)
+
+        return scores, means, mins, fractions
+
+    def _update_cycles(self, scores, offsets, lengths):
+        max_length = int(lengths.max())
+        if max_length > len(self.cycle_counts):
+            grow = max_length - len(self.cycle_counts)
+            self.cycle_counts = np.append(self.cycle_counts, np.zeros(grow, dtype=np.int64))
+            self.cycle_sums = np.append(self.cycle_sums, np.zeros(grow, dtype=np.int64))
+            self.cycle_above = np.append(self.cycle_above, np.zeros(grow, dtype=np.int64))
+
+        if lengths.min() == max_length:
+            # all reads have the same length: a read per row
+            matrix = scores.reshape(-1, max_length)
+            self.cycle_counts[:max_length] += len(lengths)
+            self.cycle_sums[:max_length] += matrix.sum(axis=0, dtype=np.int64)
+            self.cycle_above[:max_length] += (matrix >= self.threshold).sum(axis=0)
+        else:
+            cycles = np.arange(len(scores)) - np.repeat(offsets[:-1], lengths)
+            self.cycle_counts[:max_length] += np.bincount(cycles, minlength=max_length)
+            self.cycle_sums[:max_length] += np.bincount(cycles, weights=scores, minlength=max_length).astype(np.int64)
+            self.cycle_above[:max_length] += np.bincount(cycles[scores >= self.threshold], minlength=max_length)
+
+    def mean_score(self):
+        ''' @return: the mean score over all bases (NaN without bases). '''
+        if self.bases == 0:
+            return float('nan')
+        return float(np.dot(self.score_counts, np.arange(len(self.score_counts)))) / self.bases
+
+    def fraction_above(self):
+        ''' @return: the fraction of bases whose score is not lower
+                     than the threshold (NaN without bases).
+        '''
+        if self.bases == 0:
+            return float('nan')
+        return float(self.score_counts[self.threshold:].sum()) / self.bases
+
+    def cycle_means(self):
+        ''' @return: the mean score at each cycle. '''
+        return self.cycle_sums / self.cycle_counts
+
+    def cycle_fractions_above(self):
+        ''' @return: the fraction of scores not lower than the threshold at each cycle. '''
+        return self.cycle_above / self.cycle_counts
+
+
+def compute_stats(src, offset=33, threshold=30, batch_size=DEFAULT_BATCH_SIZE):
+    ''' Computes quality statistics over a FASTQ file in a single pass.
+
+        @param src: the path of the FASTQ file or a file descriptor.
+        @param offset: the quality encoding offset (33 or 64).
+        @param threshold: the score threshold for the fraction of high quality bases.
+        @param batch_size: the number of reads processed at a time.
+        @return: a L{QualityStats} instance.
+        @raises FormatError: when the FASTQ file is malformed.
+        @raises ValueError: if a quality character is out of range.
+    '''
+    stats = QualityStats(offset, threshold)
+    for batch in FastqStreamingReader(src).iter_batches(batch_size, numpy=True):
+        stats.update(batch)
+    return stats
@@ -0,0 +1,208 @@
+# Copyright 2012 Gabriele Sales <gbrsales@gmail.com>
+#
+# This file is part of BioinfoTree. It is licensed under the
+# terms of the GNU Affero General Public License version 3.
+
+''' Trimming and filtering of FASTQ reads.
+
+    Reads are processed in batches (see
+    L{FastqStreamingReader.iter_batches}). Each trimming step narrows
+    the (start, end) range kept for every read by means of NumPy
+    operations over the whole batch; the surviving ranges are then
+    gathered into a new batch at once.
+
+    Steps are applied in the following order:
+      1. fixed-length trimming of both ends;
+      2. removal of an adapter prefix found at the 3' end;
+      3. sliding-window quality trimming;
+      4. cropping to a maximum length;
+      5. filters on the number of N symbols and on the final length.
+'''
+
+import numpy as np
+
+from .reader import FastqBatch, FastqStreamingReader, DEFAULT_BATCH_SIZE
+from .stats import decode_qualities
+from .writer import FastqWriter, BULK_BUFFER_SIZE
+
+
+_SHIFTED_SUM_MAX_WINDOW = 8
+
+class ReadTrimmer(object):
+    ''' Trims and filters batches of FASTQ reads.
+
+        This class exposes the following counters:
+          - B{reads_in}, B{bases_in}: the reads and bases processed;
+          - B{reads_out}, B{bases_out}: the reads and bases kept;
+          - B{adapter_trimmed}: the reads ending with an adapter prefix;
+          - B{quality_trimmed}: the reads trimmed by the quality window;
+          - B{too_many_n}: the reads discarded because of N symbols;
+          - B{too_short}: the reads discarded because of their length.
+    '''
+
+    def __init__(self, head=0, tail=0, adapter=None, min_overlap=3,
+                 window=None, min_quality=20, max_length=None,
+                 max_n=None, min_length=0, offset=33):
+        ''' Object constructor.
+
+            @param head: the number of bases removed from the 5' end.
+            @param tail: the number of bases removed from the 3' end.
+            @param adapter: the adapter sequence, as a string. Reads
+                            ending with a prefix of the adapter, at least
+                            I{min_overlap} bases long, are cut where the
+                            prefix starts. Matches are exact and case
+                            sensitive. If B{None}, adapters are ignored.
+            @param min_overlap: the shortest adapter prefix removed.
+            @param window: the size of the quality window. Reads are cut
+                           at the start of the first window whose mean
+                           score is lower than I{min_quality}; reads
+                           shorter than the window are left untouched.
+                           If B{None}, quality trimming is disabled.
+            @param min_quality: the minimum mean score of a window.
+            @param max_length: reads are cropped to this length, if given.
+            @param max_n: reads with more N symbols (in either case)
+                          are discarded, if given.
+            @param min_length: shorter reads are discarded.
+            @param offset: the quality encoding offset (33 or 64).
+            @raises ValueError: if a parameter is out of range.
+        '''
+        if head < 0 or tail < 0:
+            raise ValueError('invalid trimming length')
+        elif adapter is not None and (len(adapter) == 0 or min_overlap < 1):
+            raise ValueError('invalid adapter parameters')
+        elif window is not None and window < 1:
+            raise ValueError('invalid window size: %d' % window)
+        elif max_length is not None and max_length < 0:
+            raise ValueError('invalid maximum length: %d' % max_length)
+        elif max_n is not None and max_n < 0:
+            raise ValueError('invalid maximum number of N: %d' % max_n)
+        elif min_length < 0:
+            raise ValueError('invalid minimum length: %d' % min_length)
+
+        self.head = head
+        self.tail = tail
+        self.adapter = None if adapter is None else np.frombuffer(adapter.encode('ascii'), dtype=np.uint8)
+        self.min_overlap = min_overlap
+        self.window = window
+        self.min_quality = min_quality
+        self.max_length = max_length
+        self.max_n = max_n
+        self.min_length = min_length
+        self.offset = offset
+
+        self.reads_in = self.bases_in = 0
+        self.reads_out = self.bases_out = 0
+        self.adapter_trimmed = self.quality_trimmed = 0
+        self.too_many_n = self.too_short = 0
+
+    def process(self, batch):
+        ''' Trims and filters a batch.
+
+            @param batch: a L{FastqBatch}, with or without NumPy arrays.
+            @return: a new L{FastqBatch}, holding NumPy arrays.
+            @raises ValueError: if a quality character is out of range.
+        '''
+        seqs = np.frombuffer(batch.sequences, dtype=np.uint8)
+        offsets = np.asarray(batch.offsets, dtype=np.int64)
+        starts = np.minimum(offsets[:-1] + self.head, offsets[1:])
+        ends = np.maximum(offsets[1:] - self.tail, starts)
+
+        if self.adapter is not None:
+            self._trim_adapter(seqs, starts, ends)
+        if self.window is not None:
+            scores = decode_qualities(batch.qualities, self.offset)
+            self._trim_window(scores, starts, ends)
+        if self.max_length is not None:
+            np.minimum(ends, starts + self.max_length, out=ends)
+
+        keep = ends - starts >= self.min_length
+        self.too_short += len(keep) - int(keep.sum())
+        if self.max_n is not None:
+            # N symbols are rare: count them by locating their positions
+            n_positions = np.flatnonzero((seqs == ord('N')) | (seqs == ord('n')))
+            acceptable = np.searchsorted(n_positions, ends) - np.searchsorted(n_positions, starts) <= self.max_n
+            self.too_many_n += int((keep & ~acceptable).sum())
+            keep &= acceptable
+
+        starts = starts[keep]
+        lengths = ends[keep] - starts
+        new_offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=new_offsets[1:])
+        # the position of each kept base in the original columns
+        positions = np.arange(new_offsets[-1]) + np.repeat(starts - new_offsets[:-1], lengths)
+        labels = [ l for l, k in zip(batch.labels, keep.tolist()) if k ]
+
+        self.reads_in += len(batch.labels)
+        self.bases_in += len(seqs)
+        self.reads_out += len(labels)
+        self.bases_out += len(positions)
+        return FastqBatch(labels, seqs[positions],
+                          np.frombuffer(batch.qualities, dtype=np.uint8)[positions],
+                          new_offsets)
+
+    def _trim_adapter(self, seqs, starts, ends):
+        ''' Moves the ends of reads having an adapter prefix as a suffix.
+
+            Prefixes are tried from the shortest to the longest, so that
+            longer matches take precedence. For each length, candidate
+            reads are narrowed one base at a time: few of them survive
+            the first comparisons.
+        '''
+        cuts = ends.copy()
+        for size in range(self.min_overlap, min(len(self.adapter), int((ends - starts).max(initial=0))) + 1):
+            candidates = np.flatnonzero(ends - starts >= size)
+            for idx in range(size):
+                bases = seqs[ends[candidates] - size + idx]
+                candidates = candidates[bases == self.adapter[idx]]
+                if len(candidates) == 0:
+                    break
+            cuts[candidates] = ends[candidates] - size
+
+        self.adapter_trimmed += int((cuts < ends).sum())
+        ends[:] = cuts
+
+    def _trim_window(self, scores, starts, ends):
+        ''' Cuts reads at the start of their first low quality window. '''
+        window = self.window
+        if len(scores) < window:
+            return
+
+        count = len(scores) - window + 1
+        if window <= _SHIFTED_SUM_MAX_WINDOW:
+            # adding shifted views is faster than a cumulative sum for small windows
+            sums = scores[:count].astype(np.int32)
+            for shift in range(1, window):
+                sums += scores[shift:shift+count]
+        else:
+            cumulative = np.zeros(len(scores) + 1, dtype=np.int64)
+            np.cumsum(scores, out=cumulative[1:])
+            sums = cumulative[window:] - cumulative[:-window]
+
+        # positions, within all the concatenated scores, of windows having a low mean
+        low = np.flatnonzero(sums < self.min_quality * window)
+        low = np.append(low, len(scores))
+
+        first_low = low[np.searchsorted(low, starts)]
+        trimmed = first_low <= ends - window
+        self.quality_trimmed += int(trimmed.sum())
+        ends[trimmed] = first_low[trimmed]
+
+
+def trim_fastq(src, dst, trimmer, batch_size=DEFAULT_BATCH_SIZE, compression=None, threads=None):
+    ''' Trims and filters all reads of a FASTQ file.
+
+        @param src: the path of the FASTQ file or a file descriptor.
+        @param dst: the path of the output file or a file descriptor.
+        @param trimmer: a L{ReadTrimmer}, which also collects statistics.
+        @param batch_size: the number of reads processed at a time.
+        @param compression: the output compression format (see L{FastqWriter}).
+        @param threads: the number of compression threads.
+        @raises FormatError: when the FASTQ file is malformed.
+        @raises ValueError: if a quality character is out of range.
+    '''
+    writer = FastqWriter(dst, BULK_BUFFER_SIZE, compression, threads)
+    try:
+        for batch in FastqStreamingReader(src).iter_batches(batch_size, numpy=True):
+            writer.write_batch(trimmer.process(batch))
+    finally:
+        writer.close()
@@ -5,32 +5,102 @@
 
 ''' Writer for the FASTQ format. '''
 
+from io import TextIOBase
+from itertools import islice, repeat
+
+from ..io.compression import BlockCompressedWriter
+
+
+#: A buffer size suitable for L{FastqWriter} bulk writes.
+BULK_BUFFER_SIZE = 1024 * 1024
+
+
 class FormatError(Exception):
     ''' Raised to signal an error in a FASTQ block. '''
 
 
 class FastqWriter(object):
-    ''' An streaming FASTQ writer. '''
+    ''' An streaming FASTQ writer.
+
+        By default, each block is handed to the file as soon as it is
+        written. When a buffer size is given, blocks are instead encoded
+        into a bytearray, which is written to the underlying binary file
+        with a single call whenever its size reaches the buffer size;
+        L{flush} writes out whatever is left. Nothing else should write
+        to the same file between two flushes.
 
-    def __init__(self, src):
+        Output may also be compressed in the gzip or BGZF formats, by a
+        pool of threads (see L{BlockCompressedWriter}). Compression
+        implies buffering.
+    '''
+
+    def __init__(self, src, buffer_size=0, compression=None, threads=None, level=6):
         ''' Opens a FASTQ writer.
 
             @param src: the path of the file to writer or a file descriptor.
+                        Text files must expose their binary stream through
+                        the B{buffer} attribute (as B{sys.stdout} does) to
+                        be compressed.
+            @param buffer_size: the number of bytes collected before
+                                writing to the file (0 disables buffering,
+                                unless output is compressed).
+            @param compression: either C{'gzip'}, C{'bgzf'} or B{None}.
+            @param threads: the number of compression threads. If B{None},
+                            the number of CPUs.
+            @param level: the compression level (1-9).
+            @raises ValueError: if the compression parameters are invalid
+                                or the file can't be compressed.
         '''
+        if compression is not None and buffer_size == 0:
+            buffer_size = BULK_BUFFER_SIZE
+        self.buffer_size = buffer_size
+
         if type(src) is str:
             self.filename = src
-            self.fd = file(src, 'w')
+            self.fd = open(src, 'wb' if buffer_size > 0 else 'w')
             self.own_fd = True
         else:
             self.filename = getattr(src, 'name', '<unknown>')
             self.fd = src
             self.own_fd = False
 
+        self._buffer = None
+        self._out = None
+        if buffer_size > 0:
+            self._buffer = bytearray()
+            self._out = self.fd
+            if isinstance(self.fd, TextIOBase):
+                # text written before us must precede our output
+                self.fd.flush()
+                self._out = getattr(self.fd, 'buffer', None)
+
+            if compression is not None:
+                if self._out is None:
+                    raise ValueError('cannot compress output to file %s' % self.filename)
+                self._out = BlockCompressedWriter(self._out, compression, threads, level)
+
     def close(self):
         ''' Closes the writer. '''
+        if self._buffer is not None:
+            self._write_buffer()
+            if isinstance(self._out, BlockCompressedWriter):
+                self._out.close()
+            elif self._out is not None:
+                self._out.flush()
         if self.own_fd:
             self.fd.close()
 
+    def flush(self):
+        ''' Writes out buffered blocks.
+
+            With compressed output, this also terminates the current
+            compression block.
+        '''
+        if self._buffer is not None:
+            self._write_buffer()
+            if self._out is not None:
+                self._out.flush()
+
     def write(self, label, seq, qual):
         ''' Writes a single FASTQ block.
 
@@ -43,4 +113,61 @@ class FastqWriter(object):
         elif len(seq) != len(qual):
             raise FormatError('sequence and quality values differ in length')
 
-        self.fd.write('@%s\n%s\n+\n%s\n' % (label, seq, qual))
+        self._write('@%s\n%s\n+\n%s\n' % (label, seq, qual))
+
+    def write_many(self, blocks):
+        ''' Writes several FASTQ blocks at once.
+
+            Blocks are validated in bulk before writing any of them.
+
+            @param blocks: a sequence of (label, sequence, qualities) tuples.
+        '''
+        if len(blocks) == 0:
+            return
+
+        labels, seqs, quals = zip(*blocks)
+        if not all(labels):
+            raise FormatError('empty label')
+        elif list(map(len, seqs)) != list(map(len, quals)):
+            raise FormatError('sequence and quality values differ in length')
+
+        self._write_lines(labels, seqs, quals)
+
+    def write_batch(self, batch):
+        ''' Writes a group of FASTQ blocks stored by columns.
+
+            @param batch: a L{FastqBatch}, with or without NumPy arrays.
+        '''
+        if not all(batch.labels):
+            raise FormatError('empty label')
+
+        seqs = bytes(batch.sequences).decode('ascii')
+        quals = bytes(batch.qualities).decode('ascii')
+        offsets = batch.offsets.tolist()
+        slices = list(map(slice, offsets, islice(offsets, 1, None)))
+        self._write_lines(batch.labels, map(seqs.__getitem__, slices), map(quals.__getitem__, slices))
+
+    def _write_lines(self, labels, seqs, quals):
+        # interleave the four lines of each block and join them at once
+        lines = [None] * (4 * len(labels))
+        lines[0::4] = map('@'.__add__, labels)
+        lines[1::4] = seqs
+        lines[2::4] = repeat('+', len(labels))
+        lines[3::4] = quals
+        lines.append('')
+        self._write('\n'.join(lines))
+
+    def _write(self, content):
+        if self._buffer is None:
+            self.fd.write(content)
+        else:
+            self._buffer += content.encode('utf-8')
+            if len(self._buffer) >= self.buffer_size:
+                self._write_buffer()
+
+    def _write_buffer(self):
+        if self._out is None:
+            self.fd.write(self._buffer.decode('utf-8'))
+        else:
+            self._out.write(self._buffer)
+        self._buffer.clear()
@@ -1,3 +1,3 @@
 ''' A collection of classes for reading GenBank records. '''
 
-from reader import RecordIterator
+from .reader import RecordIterator
@@ -1,6 +1,5 @@
-from __future__ import with_statement
-from cStringIO import StringIO
-from types import StringTypes
+from io import StringIO
+from ..io.compression import open_input
 
 class RecordIterator(object):
 	''' An iterator over GenBank-formatted records. '''
@@ -9,9 +8,10 @@ class RecordIterator(object):
 		''' Builds an iterator.
 		    
 		    @param src: the path of the file to read or a file descriptor.
+		                Compressed files are decompressed on the fly.
 		'''
-		if type(src) in StringTypes:
-			self.fd = file(src, 'r')
+		if isinstance(src, str):
+			self.fd = open_input(src)
 			self.need_close = True
 		else:
 			self.fd = src
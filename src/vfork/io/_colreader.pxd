@@ -1,13 +1,12 @@
-cdef extern from "Python.h":
-  ctypedef struct FILE
-  FILE* PyFile_AsFile(object)
+from cpython.ref cimport PyObject
 
 
 cdef extern from "reader.h":
   ctypedef struct Reader:
-    pass
+    unsigned long lineno
 
-  Reader* new_Reader(FILE* fd, char* spec, int allow_missing_cols)
+  Reader* new_Reader(int fd, PyObject* source, const char* spec, int allow_missing_cols) except NULL
   void delete_Reader(Reader* reader)
   object Reader_readline(Reader* reader)
+  Py_ssize_t Reader_readbatch(Reader* reader, Py_ssize_t max_row_num, void** arrays, PyObject** lists) except -1
   unsigned long Reader_lineno(Reader* reader)
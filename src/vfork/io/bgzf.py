@@ -0,0 +1,300 @@
+''' Random access to BGZF-compressed files. '''
+
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from os import fstat
+from struct import Struct
+import sys
+import zlib
+
+from .util import write_atomically
+
+
+#: Suffix appended to the path of a BGZF file to obtain the path of its block index.
+GZI_SUFFIX = '.gzi'
+
+_HEADER = Struct('<4BI2BH')
+_SUBFIELD_HEADER = Struct('<2BH')
+_UINT16 = Struct('<H')
+_UINT32 = Struct('<I')
+_UINT64 = Struct('<Q')
+_GZI_ENTRY = Struct('<QQ')
+
+
+class BgzfReader(object):
+	''' Random access reader for BGZF files.
+
+	    A BGZF file is a series of gzip members, each one holding at most
+	    64 KB of data. Knowing where members start, both in the compressed
+	    and in the uncompressed stream, any region can be retrieved by
+	    decompressing just the members overlapping it.
+
+	    Member offsets are stored in an index having the same format of
+	    the C{.gzi} files produced by C{bgzip -i} (by default, the path of
+	    the BGZF file followed by L{GZI_SUFFIX}). If the index is missing
+	    or older than the BGZF file, it is rebuilt by walking member
+	    headers, without decompressing any data.
+
+	    Instances behave like a read-only mmap over the uncompressed
+	    content: they support slicing (returning B{bytes}) and L{find}.
+	    The last decompressed members are kept in a small LRU cache.
+
+	    This class exposes the following properties:
+	      - B{filename}: the path of the BGZF file;
+	      - B{file_mtime}: the modification time of the BGZF file, in ns;
+	      - B{size}: the size of the uncompressed content;
+	      - B{cache_hits}, B{cache_misses}: cache statistics.
+	'''
+
+	def __init__(self, filename, index=None, save_index=True, cache_size=64):
+		''' Object constructor.
+
+		    @param filename: the path of the file to read.
+		    @param index: the path of the block index. If B{None}, the
+		                  BGZF path followed by L{GZI_SUFFIX} is used.
+		    @param save_index: whether to write the index when it is missing
+		                       or out of date.
+		    @param cache_size: the maximum number of decompressed members
+		                       kept in memory.
+		    @raises ValueError: if the file is not in the BGZF format or the
+		                        index is malformed.
+		'''
+		if cache_size < 1:
+			raise ValueError('invalid cache size: %d' % cache_size)
+
+		self.filename = filename
+		self.cache_size = cache_size
+		self.cache_hits = 0
+		self.cache_misses = 0
+		self._cache = OrderedDict()
+
+		self.fd = open(filename, 'rb')
+		try:
+			stat = fstat(self.fd.fileno())
+			self.file_size = stat.st_size
+			self.file_mtime = stat.st_mtime_ns
+
+			if index is None:
+				index = filename + GZI_SUFFIX
+			if not self._load_index(index):
+				self._scan(0, 0)
+				if save_index:
+					self._save_index(index)
+		except:
+			self.close()
+			raise
+
+	def __del__(self):
+		self.close()
+
+	def __len__(self):
+		return self.size
+
+	def __getitem__(self, key):
+		if not isinstance(key, slice):
+			if key < 0:
+				key += self.size
+			if key < 0 or key >= self.size:
+				raise IndexError('index out of range')
+			return self[key:key+1][0]
+
+		start, stop, step = key.indices(self.size)
+		if step != 1:
+			if step < 0:
+				raise ValueError('negative slice steps are not supported')
+			return self[start:stop][::step]
+
+		chunks = []
+		idx = bisect_right(self._uoffsets, start) - 1
+		while start < stop:
+			data = self._member(idx)
+			base = self._uoffsets[idx]
+			chunks.append(data[start-base:stop-base])
+			start = base + len(data)
+			idx += 1
+
+		if len(chunks) == 1:
+			return chunks[0]
+		else:
+			return b''.join(chunks)
+
+	def close(self):
+		''' Closes the reader. '''
+		fd = getattr(self, 'fd', None)
+		if fd is not None:
+			fd.close()
+			self.fd = None
+			self._cache.clear()
+
+	def find(self, sub, start=0, end=None):
+		''' Searches the uncompressed content.
+
+		    @param sub: the bytes to look for.
+		    @param start: where to start the search.
+		    @param end: where to stop the search; if B{None}, the search
+		                extends to the end of the content.
+		    @return: the lowest offset, not lower than I{start}, where
+		             I{sub} is found within the range; -1 if there is
+		             no match.
+		'''
+		if end is None or end > self.size:
+			end = self.size
+
+		overlap = len(sub) - 1
+		while start < end:
+			idx = bisect_right(self._uoffsets, start) - 1
+			base = self._uoffsets[idx]
+			data = self._member(idx)
+
+			pos = data.find(sub, start-base, end-base)
+			if pos != -1:
+				return base + pos
+
+			next_base = base + len(data)
+			if overlap > 0 and next_base < end:
+				# a match may span two members
+				boundary_start = max(start, next_base - overlap)
+				pos = self[boundary_start:min(next_base+overlap, end)].find(sub)
+				if pos != -1:
+					return boundary_start + pos
+
+			start = next_base
+
+		return -1
+
+	def _member(self, idx):
+		''' Retrieves the uncompressed content of a member.
+
+		    @param idx: the member index.
+		    @return: a bytes object.
+		'''
+		data = self._cache.get(idx)
+		if data is not None:
+			self.cache_hits += 1
+			self._cache.move_to_end(idx)
+			return data
+
+		self.cache_misses += 1
+		start = self._coffsets[idx]
+		stop = self._coffsets[idx+1] if idx+1 < len(self._coffsets) else self._cend
+		self.fd.seek(start)
+		# empty members may follow: stop at the end of the first one
+		data = zlib.decompressobj(31).decompress(self.fd.read(stop-start))
+
+		self._cache[idx] = data
+		if len(self._cache) > self.cache_size:
+			self._cache.popitem(last=False)
+		return data
+
+	def _member_size(self, coffset):
+		''' Reads the header and the footer of the member starting at I{coffset}.
+
+		    @return: the compressed and the uncompressed size of the member.
+		    @raises ValueError: if the member is not a valid BGZF block.
+		'''
+		fd = self.fd
+		fd.seek(coffset)
+		header = fd.read(_HEADER.size)
+		if len(header) != _HEADER.size:
+			raise ValueError('truncated BGZF file %s' % self.filename)
+
+		id1, id2, cm, flags, mtime, xfl, os, xlen = _HEADER.unpack(header)
+		if id1 != 31 or id2 != 139 or cm != 8 or not (flags & 4):
+			raise ValueError('file %s is not in the BGZF format' % self.filename)
+
+		extra = fd.read(xlen)
+		pos = 0
+		bsize = None
+		while pos + _SUBFIELD_HEADER.size <= len(extra):
+			si1, si2, slen = _SUBFIELD_HEADER.unpack_from(extra, pos)
+			pos += _SUBFIELD_HEADER.size
+			if si1 == 66 and si2 == 67 and slen == 2:
+				bsize = _UINT16.unpack_from(extra, pos)[0] + 1
+			pos += slen
+		if bsize is None:
+			raise ValueError('file %s is not in the BGZF format' % self.filename)
+
+		fd.seek(coffset + bsize - _UINT32.size)
+		footer = fd.read(_UINT32.size)
+		if len(footer) != _UINT32.size:
+			raise ValueError('truncated BGZF file %s' % self.filename)
+
+		return bsize, _UINT32.unpack(footer)[0]
+
+	def _scan(self, coffset, uoffset):
+		''' Walks member headers from the given position to the end of the file,
+		    recording the offsets of non-empty members.
+		'''
+		self._coffsets = array('Q')
+		self._uoffsets = array('Q')
+		self._append_members(coffset, uoffset)
+
+	def _append_members(self, coffset, uoffset):
+		while coffset < self.file_size:
+			csize, usize = self._member_size(coffset)
+			if usize > 0:
+				self._coffsets.append(coffset)
+				self._uoffsets.append(uoffset)
+			coffset += csize
+			uoffset += usize
+
+		self._cend = coffset
+		self.size = uoffset
+
+	def _load_index(self, filename):
+		''' Loads a C{.gzi} index.
+
+		    @param filename: the path of the index.
+		    @return: B{False} if the index is missing or older than the BGZF
+		             file; B{True} otherwise.
+		    @raises ValueError: if the index is malformed.
+		'''
+		try:
+			fd = open(filename, 'rb')
+		except FileNotFoundError:
+			return False
+
+		with fd:
+			if fstat(fd.fileno()).st_mtime_ns < self.file_mtime:
+				return False
+
+			content = fd.read()
+			if len(content) < _UINT64.size:
+				raise ValueError('malformed BGZF index %s' % filename)
+			count = _UINT64.unpack_from(content)[0]
+			if len(content) != _UINT64.size + count * _GZI_ENTRY.size:
+				raise ValueError('malformed BGZF index %s' % filename)
+
+		entries = array('Q', content[_UINT64.size:])
+		if sys.byteorder == 'big':
+			entries.byteswap()
+
+		self._coffsets = array('Q', [0])
+		self._coffsets.extend(entries[0::2])
+		self._uoffsets = array('Q', [0])
+		self._uoffsets.extend(entries[1::2])
+
+		# the index doesn't record the size of the last member(s):
+		# walk headers from the last entry on
+		last_coffset = self._coffsets.pop()
+		last_uoffset = self._uoffsets.pop()
+		self._append_members(last_coffset, last_uoffset)
+
+		if self._cend != self.file_size:
+			raise ValueError('BGZF index %s does not match file %s' % (filename, self.filename))
+		return True
+
+	def _save_index(self, filename):
+		''' Writes a C{.gzi} index.
+
+		    As in the files produced by C{bgzip}, the first member,
+		    which always starts at offset 0, is omitted.
+
+		    @param filename: the path of the index.
+		'''
+		count = max(len(self._coffsets) - 1, 0)
+		content = [ _UINT64.pack(count) ]
+		for idx in range(1, len(self._coffsets)):
+			content.append(_GZI_ENTRY.pack(self._coffsets[idx], self._uoffsets[idx]))
+		write_atomically(filename, b''.join(content))
@@ -1,5 +1,15 @@
+# cython: language_level=3
+
+from cpython.mem cimport PyMem_Malloc, PyMem_Free
+from cpython.ref cimport PyObject
+from libc.stdint cimport int64_t
+from io import TextIOBase
+
 cimport _colreader
-cimport cpython
+
+
+#: The number of lines parsed at a time by L{Reader.read_all}.
+DEFAULT_BATCH_SIZE = 65536
 
 
 cdef class Reader:
@@ -27,22 +37,55 @@ The available type codes are:
   - B{f}: float
   - B{s}: string (no conversion)
   - B{a}: the full line, including the trailing newline
+
+Input is read in large blocks into a buffer owned by the reader, which
+looks for line ends and column separators without holding the GIL.
+Strings are decoded as UTF-8.
+
+Besides iterating over tuples, lines can be read in batches (see
+L{read_batch} and L{read_all}), whose values are returned by columns:
+numbers are then stored straight into NumPy arrays.
 '''
 
   cdef _colreader.Reader* __colreader
+  cdef object __fd
+  cdef list __types
 
-  def __cinit__(self, fd, spec, allow_missing=True):
+  def __cinit__(self, fd, spec, allow_missing=True, lineno=0):
     ''' Object constructor.
 
-        @param fd: a file object. Must be a real file descriptor.
+        @param fd: a file descriptor number or a file object. Descriptors
+          are read directly, with no Python call at all. File objects must
+          provide a I{readinto} method (binary files, L{io.BytesIO},
+          decompressing files...); text files are read through their
+          underlying binary buffer, so nothing must have been read from
+          them yet.
         @param spec: a description of the columns to be read.
-        @param allow_missing_cols: if B{False} the reader will raise an error when
+        @param allow_missing: if B{False} the reader will raise an error when
           one of the input lines has too few columns to match the I{spec}.
+        @param lineno: the number of lines preceding the input, when it
+          starts in the middle of a file; it is added to line numbers.
+        @raises TypeError: if I{fd} is neither a file descriptor nor a binary file.
+        @raises ValueError: if the I{spec} is invalid.
     '''
-    cdef _colreader.FILE* naked = _colreader.PyFile_AsFile(fd)
-    self.__colreader = _colreader.new_Reader(naked, spec, allow_missing)
-    if self.__colreader is NULL:
-      cpython.PyErr_NoMemory()
+    cdef int fileno = -1
+    cdef PyObject* source = NULL
+
+    # text files close their buffer when collected
+    self.__fd = fd
+    if isinstance(fd, int):
+      fileno = fd
+    else:
+      if isinstance(fd, TextIOBase):
+        fd = getattr(fd, 'buffer', fd)
+      if not hasattr(fd, 'readinto'):
+        raise TypeError('need a binary file or a file descriptor')
+      source = <PyObject*>fd
+
+    self.__types = [ token[-1:] for token in spec.split(',') ]
+    spec = spec.encode('ascii')
+    self.__colreader = _colreader.new_Reader(fileno, source, spec, allow_missing)
+    self.__colreader.lineno = lineno
 
   def __dealloc__(self):
     if self.__colreader is not NULL:
@@ -64,3 +107,100 @@ The available type codes are:
         @returns: a line number.
     '''
     return _colreader.Reader_lineno(self.__colreader)
+
+  def read_batch(self, size):
+    ''' Reads up to I{size} lines, returning their values by columns.
+
+        Numbers are parsed straight into NumPy arrays, with no Python
+        object for each value: B{u} and B{i} fields become arrays of type
+        C{int64}, while B{f} fields become arrays of type C{float64}.
+        B{s} and B{a} fields become lists of strings.
+
+        Missing floats are set to NaN and missing strings to B{None};
+        missing integers are an error, as there is no value to signal
+        them with.
+
+        @param size: the maximum number of lines to read.
+        @return: a list with a column for each field of the I{spec}.
+          Columns are shorter than I{size} only at the end of the file.
+        @raises IOError: if the input is malformed.
+        @raises ValueError: if the I{size} is negative.
+    '''
+    import numpy as np
+
+    if size < 0:
+      raise ValueError('invalid batch size: %d' % size)
+
+    cdef int field_num = len(self.__types)
+    cdef void** arrays = <void**>PyMem_Malloc(sizeof(void*) * field_num)
+    cdef PyObject** lists = <PyObject**>PyMem_Malloc(sizeof(PyObject*) * field_num)
+    cdef int64_t[::1] ints
+    cdef double[::1] floats
+    cdef Py_ssize_t row_num
+
+    try:
+      if arrays is NULL or lists is NULL:
+        raise MemoryError()
+
+      columns = []
+      for field_idx, code in enumerate(self.__types):
+        arrays[field_idx] = NULL
+        lists[field_idx] = NULL
+        if code in ('s', 'a'):
+          column = []
+          lists[field_idx] = <PyObject*>column
+        elif code == 'f':
+          column = np.empty(size, dtype=np.float64)
+          if size > 0:
+            floats = column
+            arrays[field_idx] = &floats[0]
+        else:
+          column = np.empty(size, dtype=np.int64)
+          if size > 0:
+            ints = column
+            arrays[field_idx] = &ints[0]
+        columns.append(column)
+
+      row_num = _colreader.Reader_readbatch(self.__colreader, size, arrays, lists)
+    finally:
+      PyMem_Free(arrays)
+      PyMem_Free(lists)
+
+    if row_num < size:
+      # release the unused part of the arrays
+      columns = [ c if type(c) is list else c[:row_num].copy() for c in columns ]
+    return columns
+
+  def read_all(self, batch_size=DEFAULT_BATCH_SIZE):
+    ''' Reads all the remaining lines, returning their values by columns.
+
+        @param batch_size: the number of lines parsed at a time.
+        @return: a list of columns, as described by L{read_batch}.
+        @raises IOError: if the input is malformed.
+        @raises ValueError: if the I{batch_size} is not positive.
+    '''
+    import numpy as np
+
+    if batch_size < 1:
+      raise ValueError('invalid batch size: %d' % batch_size)
+
+    batches = []
+    while True:
+      batch = self.read_batch(batch_size)
+      batches.append(batch)
+      if len(batch[0]) < batch_size:
+        break
+
+    if len(batches) == 1:
+      return batches[0]
+
+    columns = []
+    for parts in zip(*batches):
+      if type(parts[0]) is list:
+        column = []
+        for part in parts:
+          column.extend(part)
+      else:
+        column = np.concatenate(parts)
+      columns.append(column)
+    return columns
@@ -0,0 +1,342 @@
+''' Transparent access to compressed input, and parallel compression of output.
+
+    The compression format is detected from the first bytes of the
+    input, so that plain and compressed files (including those read
+    from a pipe) can be handled by the same code.
+
+    On multi-core machines, decompression is delegated to an external
+    program whenever possible, preferring multi-threaded implementations.
+    It then runs in parallel with the parsing carried out by the Python
+    process. Otherwise, the modules of the standard library are used:
+    on a single core, this saves the cost of moving data through a pipe.
+
+    Output is compressed in independent blocks (see
+    L{BlockCompressedWriter}), which a pool of threads can process
+    concurrently since C{zlib} releases the GIL.
+'''
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BufferedReader, BufferedIOBase, RawIOBase, TextIOWrapper
+from os import cpu_count
+from shutil import copyfileobj, which
+from struct import Struct
+from subprocess import Popen, PIPE
+from threading import Thread
+import bz2
+import gzip
+import lzma
+import zlib
+
+
+_MAGIC_LENGTH = 18
+_GZIP_MAGIC = b'\x1f\x8b\x08'
+_BZIP2_MAGIC = b'BZh'
+_XZ_MAGIC = b'\xfd7zXZ\x00'
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+_PIPE_BUFFER_SIZE = 1024 * 1024
+
+#: The amount of data compressed by each task of L{BlockCompressedWriter}.
+COMPRESSION_BLOCK_SIZE = 1024 * 1024
+
+# the uncompressed size of BGZF members used by htslib, which guarantees
+# that compressed members fit the 64 KB limit
+_BGZF_BLOCK_SIZE = 65280
+_BGZF_HEADER = Struct('<4BI2BH2BHH')
+_BGZF_FOOTER = Struct('<2I')
+_BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+#: External decompressors, in order of preference. The C{{threads}}
+#: placeholder is replaced by the number of threads.
+DECOMPRESSORS = {
+	'gzip': [ ('pigz', '-dc', '-p', '{threads}'), ('gzip', '-dc') ],
+	'bgzf': [ ('bgzip', '-dc', '-@', '{threads}'), ('pigz', '-dc', '-p', '{threads}'), ('gzip', '-dc') ],
+	'bz2':  [ ('lbzip2', '-dc', '-n', '{threads}'), ('pbzip2', '-dc', '-p{threads}'), ('bzip2', '-dc') ],
+	'xz':   [ ('xz', '-dc', '-T', '{threads}') ],
+	'zstd': [ ('zstd', '-dcq', '-T{threads}') ],
+}
+
+
+def detect_compression(header):
+	''' Identifies the compression format of a file.
+
+	    @param header: the first bytes of the file (18 are enough to
+	                   tell BGZF from plain gzip).
+	    @return: one of C{'gzip'}, C{'bgzf'}, C{'bz2'}, C{'xz'}, C{'zstd'}
+	             or B{None} for uncompressed content.
+	'''
+	if header.startswith(_GZIP_MAGIC):
+		# BGZF files store the block size in an extra subfield named BC
+		if header[3] & 4 and header[12:16] == b'BC\x02\x00':
+			return 'bgzf'
+		else:
+			return 'gzip'
+	elif header.startswith(_BZIP2_MAGIC):
+		return 'bz2'
+	elif header.startswith(_XZ_MAGIC):
+		return 'xz'
+	elif header.startswith(_ZSTD_MAGIC):
+		return 'zstd'
+	else:
+		return None
+
+def open_input(src, mode='r', threads=None, external=None):
+	''' Opens a possibly compressed file for reading.
+
+	    Uncompressed inputs are returned as they are (file objects) or
+	    opened with the builtin C{open} (paths).
+
+	    @param src: the path of the file or a file object. File objects
+	                must expose a buffered binary stream supporting C{peek},
+	                either directly or through their C{buffer} attribute
+	                (as B{sys.stdin} does); otherwise they are returned
+	                unchanged.
+	    @param mode: either C{'r'} (text) or C{'rb'} (binary).
+	    @param threads: the number of threads used by external
+	                    decompressors. If B{None}, the number of CPUs.
+	    @param external: whether external decompressors may be used.
+	                     If B{None}, they are used when more than one
+	                     CPU is available.
+	    @return: a file object.
+	    @raises ValueError: if the mode is invalid or the input is compressed
+	                        with an unsupported format.
+	'''
+	if mode not in ('r', 'rb'):
+		raise ValueError('invalid mode: %s' % mode)
+	if threads is None:
+		threads = cpu_count() or 1
+
+	if isinstance(src, str):
+		fd = open(src, 'rb')
+	else:
+		fd = src if isinstance(src, BufferedIOBase) else getattr(src, 'buffer', None)
+		if fd is None or not hasattr(fd, 'peek'):
+			return src
+
+	try:
+		compression = detect_compression(fd.peek(_MAGIC_LENGTH)[:_MAGIC_LENGTH])
+		if compression is None:
+			if mode == 'rb':
+				return fd
+			elif isinstance(src, str):
+				fd.close()
+				return open(src, mode)
+			elif fd is src:
+				return TextIOWrapper(fd)
+			else:
+				return src
+
+		stream = None
+		if external or (external is None and threads > 1):
+			stream = _open_external(compression, src, fd, threads)
+		if stream is None:
+			stream = _open_internal(compression, fd)
+		if stream is None and external is None:
+			stream = _open_external(compression, src, fd, threads)
+		if stream is None:
+			raise ValueError('cannot read %s-compressed input: no decompressor available' % compression)
+	except:
+		if isinstance(src, str):
+			fd.close()
+		raise
+
+	if mode == 'rb':
+		return stream
+	else:
+		return TextIOWrapper(stream)
+
+def _open_external(compression, src, fd, threads):
+	for command in DECOMPRESSORS[compression]:
+		if which(command[0]) is not None:
+			args = [ a.format(threads=threads) for a in command ]
+			return BufferedReader(_DecompressorPipe(args, src, fd), _PIPE_BUFFER_SIZE)
+
+	return None
+
+def _open_internal(compression, fd):
+	if compression in ('gzip', 'bgzf'):
+		return gzip.GzipFile(fileobj=fd, mode='rb')
+	elif compression == 'bz2':
+		return bz2.BZ2File(fd, 'rb')
+	elif compression == 'xz':
+		return lzma.LZMAFile(fd, 'rb')
+	else:
+		try:
+			import zstandard
+		except ImportError:
+			return None
+		return BufferedReader(zstandard.ZstdDecompressor().stream_reader(fd, closefd=True), _PIPE_BUFFER_SIZE)
+
+
+class _DecompressorPipe(RawIOBase):
+	''' Reads the output of an external decompressor.
+
+	    Files opened by path are handed to the decompressor directly; the
+	    content of other file objects is fed to it by a background thread.
+	    A decompressor exiting with an error is reported at the end of the
+	    stream.
+	'''
+
+	def __init__(self, args, src, fd):
+		self._args = args
+		self._fd = fd
+		if isinstance(src, str):
+			fd.close()
+			with open(src, 'rb') as input_fd:
+				self._proc = Popen(args, stdin=input_fd, stdout=PIPE, bufsize=0)
+		else:
+			self._proc = Popen(args, stdin=PIPE, stdout=PIPE, bufsize=0)
+			Thread(target=self._feed, daemon=True).start()
+
+	def readable(self):
+		return True
+
+	def readinto(self, b):
+		count = self._proc.stdout.readinto(b)
+		if count == 0:
+			self._check_status()
+		return count
+
+	def close(self):
+		if not self.closed and hasattr(self, '_proc'):
+			self._proc.stdout.close()
+			if self._proc.poll() is None:
+				# the reader stopped before the end of the stream
+				self._proc.terminate()
+			self._proc.wait()
+		RawIOBase.close(self)
+
+	def _feed(self):
+		try:
+			copyfileobj(self._fd, self._proc.stdin, _PIPE_BUFFER_SIZE)
+		except (BrokenPipeError, ValueError):
+			# the decompressor exited early or the input was closed
+			pass
+		finally:
+			try:
+				self._proc.stdin.close()
+			except BrokenPipeError:
+				pass
+
+	def _check_status(self):
+		status = self._proc.wait()
+		if status != 0:
+			raise OSError('%s exited with status %d' % (self._args[0], status))
+
+
+class BlockCompressedWriter(BufferedIOBase):
+	''' Writes compressed data, splitting it into independent blocks.
+
+	    Each block becomes a separate gzip member: the concatenation is
+	    a valid gzip file, readable by any decompressor. In the C{'bgzf'}
+	    format, members follow the BGZF layout and an empty member marks
+	    the end of the file, as for C{bgzip}; the result supports random
+	    access (see L{BgzfReader}).
+
+	    Blocks are compressed by a pool of threads, a bounded number at
+	    a time, and written out in order. Each call to L{flush} terminates
+	    the current block: flushing often reduces the compression ratio.
+	'''
+
+	def __init__(self, fd, format='gzip', threads=None, level=6, block_size=COMPRESSION_BLOCK_SIZE, closefd=False):
+		''' Object constructor.
+
+		    @param fd: a binary file object.
+		    @param format: either C{'gzip'} or C{'bgzf'}.
+		    @param threads: the number of compression threads. If B{None},
+		                    the number of CPUs. With a single thread, blocks
+		                    are compressed by the calling one.
+		    @param level: the compression level (1-9).
+		    @param block_size: the amount of data compressed by each task.
+		                       For BGZF output, it is rounded to a multiple
+		                       of the member size.
+		    @param closefd: whether L{close} should close I{fd} as well.
+		    @raises ValueError: if the format or the level is invalid.
+		'''
+		if format not in ('gzip', 'bgzf'):
+			raise ValueError('unsupported compression format: %s' % format)
+		elif level < 1 or level > 9:
+			raise ValueError('invalid compression level: %d' % level)
+
+		self._fd = fd
+		self._closefd = closefd
+		self.format = format
+		self.level = level
+		self.threads = threads or cpu_count() or 1
+		if format == 'bgzf':
+			self.block_size = max(block_size // _BGZF_BLOCK_SIZE, 1) * _BGZF_BLOCK_SIZE
+			self._compress = _compress_bgzf
+		else:
+			self.block_size = block_size
+			self._compress = _compress_gzip
+
+		self._data = bytearray()
+		self._pending = deque()
+		self._pool = ThreadPoolExecutor(self.threads) if self.threads > 1 else None
+
+	def writable(self):
+		return True
+
+	def write(self, b):
+		self._check_closed()
+		self._data += b
+		block_size = self.block_size
+		if len(self._data) >= block_size:
+			data = self._data
+			count = len(data) // block_size * block_size
+			for start in range(0, count, block_size):
+				self._submit(bytes(data[start:start+block_size]))
+			del data[:count]
+		return len(b)
+
+	def flush(self):
+		self._check_closed()
+		if len(self._data) > 0:
+			self._submit(bytes(self._data))
+			self._data.clear()
+		while len(self._pending) > 0:
+			self._fd.write(self._pending.popleft().result())
+		self._fd.flush()
+
+	def close(self):
+		if self.closed:
+			return
+		try:
+			self.flush()
+			if self.format == 'bgzf':
+				self._fd.write(_BGZF_EOF)
+				self._fd.flush()
+		finally:
+			if self._pool is not None:
+				self._pool.shutdown()
+			BufferedIOBase.close(self)
+			if self._closefd:
+				self._fd.close()
+
+	def _check_closed(self):
+		if self.closed:
+			raise ValueError('I/O operation on closed file')
+
+	def _submit(self, data):
+		if self._pool is None:
+			self._fd.write(self._compress(data, self.level))
+		else:
+			self._pending.append(self._pool.submit(self._compress, data, self.level))
+			while len(self._pending) > 2 * self.threads:
+				self._fd.write(self._pending.popleft().result())
+
+def _compress_gzip(data, level):
+	return gzip.compress(data, level, mtime=0)
+
+def _compress_bgzf(data, level):
+	members = []
+	for start in range(0, len(data), _BGZF_BLOCK_SIZE):
+		block = data[start:start+_BGZF_BLOCK_SIZE]
+		compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+		content = compressor.compress(block) + compressor.flush()
+		# BSIZE is the member size minus one: 18 bytes of header and 8 of footer
+		members.append(_BGZF_HEADER.pack(31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, len(content) + 25))
+		members.append(content)
+		members.append(_BGZF_FOOTER.pack(zlib.crc32(block), len(block)))
+	return b''.join(members)
@@ -0,0 +1,230 @@
+''' Parallel parsing of tab-delimited files. '''
+
+from collections import deque
+from itertools import chain
+from mmap import mmap, ACCESS_READ
+from multiprocessing import Pool, cpu_count
+
+from .colreader import Reader, DEFAULT_BATCH_SIZE
+
+
+#: The default size of the byte ranges parsed by each task.
+DEFAULT_RANGE_SIZE = 16 * 1024 * 1024
+
+
+class ParallelColumnReader(object):
+	''' A reader for tab-delimited files splitting the work among several processes.
+
+	    The file is memory mapped and cut into ranges of about the same
+	    size, ending with a newline. Each range is parsed by a worker
+	    process with a L{Reader} built from the same I{spec}; results
+	    are returned in the same order as in the file.
+
+	    Rows can be retrieved either as tuples, as a L{Reader} returns
+	    them, or by columns (see L{Reader.read_batch}). The latter are
+	    much cheaper to send back from workers, because numbers travel
+	    as NumPy arrays instead of one object each.
+
+	    Errors are reported with the same messages and line numbers as a
+	    L{Reader} would use: when a worker fails, its range is parsed
+	    again by the calling process to raise the error.
+	'''
+
+	def __init__(self, filename, spec, allow_missing=True, processes=None, range_size=DEFAULT_RANGE_SIZE, queue_depth=None):
+		''' Opens a reader.
+
+		    @param filename: the path of the file. Compressed files are not
+		                     supported.
+		    @param spec: a description of the columns to be read (see L{Reader}).
+		    @param allow_missing: if B{False} lines with too few columns
+		                          are an error.
+		    @param processes: the number of parsing processes. If B{None},
+		                      the number of CPUs. With a single process,
+		                      ranges are parsed by the calling one.
+		    @param range_size: the approximate size of ranges, in bytes.
+		    @param queue_depth: the maximum number of ranges being parsed or
+		                        waiting to be returned, which bounds memory
+		                        usage. If B{None}, twice the number of processes.
+		    @raises ValueError: if the I{spec} is invalid.
+		'''
+		# validate the spec before starting any process
+		Reader(-1, spec, allow_missing)
+
+		self.filename = filename
+		self.spec = spec
+		self.allow_missing = allow_missing
+		self.processes = processes or cpu_count()
+		self.range_size = range_size
+		self.queue_depth = queue_depth or 2 * self.processes
+
+		self.fd = open(filename, 'rb')
+		try:
+			self.mm = mmap(self.fd.fileno(), 0, access=ACCESS_READ) if self._size() > 0 else None
+		except:
+			self.fd.close()
+			raise
+
+	def __del__(self):
+		self.close()
+
+	def __iter__(self):
+		''' Iterates over the rows of the file.
+
+		    @return: an iterator yielding a tuple for each line.
+		    @raises IOError: if the input is malformed.
+		'''
+		return chain.from_iterable(self.iter_batches())
+
+	def close(self):
+		''' Releases the memory map and closes the file. '''
+		if getattr(self, 'mm', None) is not None:
+			self.mm.close()
+			self.mm = None
+		if getattr(self, 'fd', None) is not None:
+			self.fd.close()
+			self.fd = None
+
+	def iter_batches(self, columns=False):
+		''' Iterates over the rows of the file, a range at a time.
+
+		    @param columns: if B{True}, each batch is a list of columns, as
+		                    returned by L{Reader.read_all}; otherwise, a list
+		                    of tuples.
+		    @return: an iterator over batches, one for each range.
+		    @raises IOError: if the input is malformed.
+		'''
+		if self.mm is None:
+			# an empty file
+			return
+
+		ranges = iter(self._ranges())
+		args = (self.filename, self.spec, self.allow_missing)
+		pool = Pool(self.processes, _init_worker, args) if self.processes > 1 else None
+		try:
+			pending = deque()
+			lineno = 0
+
+			while True:
+				while len(pending) < self.queue_depth:
+					span = next(ranges, None)
+					if span is None:
+						break
+
+					if pool is None:
+						result = _parse_range(self.mm, self.spec, self.allow_missing, span, columns)
+					else:
+						result = pool.apply_async(_parse_worker_range, (span, columns))
+					pending.append((span, result))
+
+				if len(pending) == 0:
+					break
+
+				span, result = pending.popleft()
+				batch, line_num = result if pool is None else result.get()
+				if batch is None:
+					# raise the error again, with the right line number
+					_parse_range(self.mm, self.spec, self.allow_missing, span, columns, lineno)
+					raise RuntimeError('range %d-%d failed in a worker process only' % span)
+
+				yield batch
+				lineno += line_num
+
+		finally:
+			if pool is not None:
+				pool.terminate()
+
+	def read_all(self):
+		''' Reads the whole file by columns.
+
+		    @return: a list of columns, as described by L{Reader.read_batch}.
+		    @raises IOError: if the input is malformed.
+		'''
+		import numpy as np
+
+		batches = list(self.iter_batches(columns=True))
+		if len(batches) == 0:
+			# an empty file
+			return Reader(-1, self.spec, self.allow_missing).read_batch(0)
+		elif len(batches) == 1:
+			return batches[0]
+
+		columns = []
+		for parts in zip(*batches):
+			if type(parts[0]) is list:
+				columns.append(list(chain.from_iterable(parts)))
+			else:
+				columns.append(np.concatenate(parts))
+		return columns
+
+	def _ranges(self):
+		''' Cuts the file into ranges ending with a newline (or at the end of the file). '''
+		size = len(self.mm)
+		ranges = []
+		start = 0
+		while start < size:
+			end = self.mm.find(b'\n', min(start + self.range_size, size) - 1) + 1
+			if end == 0:
+				end = size
+			ranges.append((start, end))
+			start = end
+		return ranges
+
+	def _size(self):
+		self.fd.seek(0, 2)
+		return self.fd.tell()
+
+
+class _MappedRange(object):
+	''' A file-like view over a range of a memory map. '''
+
+	def __init__(self, mm, start, end):
+		self.mapped = memoryview(mm)
+		self.view = self.mapped[start:end]
+		self.pos = 0
+
+	def close(self):
+		self.view.release()
+		self.mapped.release()
+
+	def readinto(self, buffer):
+		count = min(len(buffer), len(self.view) - self.pos)
+		buffer[:count] = self.view[self.pos:self.pos+count]
+		self.pos += count
+		return count
+
+
+def _parse_range(mm, spec, allow_missing, span, columns, lineno=None):
+	''' Parses a range of a memory mapped file.
+
+	    @param lineno: the number of lines preceding the range. If B{None},
+	                   errors are not raised: the returned batch is B{None}.
+	    @return: a (batch, number of lines) tuple.
+	'''
+	source = _MappedRange(mm, *span)
+	try:
+		reader = Reader(source, spec, allow_missing, lineno or 0)
+		try:
+			if columns:
+				batch = reader.read_all(DEFAULT_BATCH_SIZE)
+			else:
+				batch = list(reader)
+		except IOError:
+			if lineno is None:
+				return None, None
+			raise
+		return batch, reader.lineno() - (lineno or 0)
+	finally:
+		source.close()
+
+
+_worker_state = None
+
+def _init_worker(filename, spec, allow_missing):
+	global _worker_state
+	with open(filename, 'rb') as fd:
+		mm = mmap(fd.fileno(), 0, access=ACCESS_READ)
+	_worker_state = (mm, spec, allow_missing)
+
+def _parse_worker_range(span, columns):
+	mm, spec, allow_missing = _worker_state
+	return _parse_range(mm, spec, allow_missing, span, columns)
@@ -1,7 +1,9 @@
 #include "reader.h"
+#include <errno.h>
+#include <stdint.h>
 #include <stdlib.h>
 #include <string.h>
-#include "strtok.h"
+#include <unistd.h>
 
 static int set_spec_stat(Reader* reader, const char* spec, int* spec_len, char** tokenized_spec)
 {
@@ -11,6 +13,11 @@ static int set_spec_stat(Reader* reader, const char* spec, int* spec_len, char**
 		PyErr_SetString(PyExc_ValueError, "empty spec");
 		return -1;
 	}
+	else if (spec[0] == ',' || spec[*spec_len-1] == ',' || strstr(spec, ",,") != NULL)
+	{
+		PyErr_SetString(PyExc_ValueError, "empty token in spec");
+		return -1;
+	}
 	
 	char* spec_copy = (char*)malloc(*spec_len+2);
 	if (spec_copy == NULL)
@@ -37,9 +44,7 @@ static int set_spec_stat(Reader* reader, const char* spec, int* spec_len, char**
 		
 		if (token_len < 1)
 		{
-			PyObject* error_message = PyString_FromFormat("invalid token %s", token);
-			if (error_message != NULL)
-				PyErr_SetObject(PyExc_ValueError, error_message);
+			PyErr_Format(PyExc_ValueError, "invalid token %s", token);
 			goto cleanup;
 		}
 		else if (token_len == 1 && token[0] == 'a')
@@ -50,19 +55,16 @@ static int set_spec_stat(Reader* reader, const char* spec, int* spec_len, char**
 		else
 		{
 			char *endptr;
+			errno = 0;
 			const int col_idx = strtol(token, &endptr, 10);
 			if (endptr == token)
 			{
-				PyObject* error_message = PyString_FromFormat("invalid token %s", token);
-				if (error_message != NULL)
-					PyErr_SetObject(PyExc_ValueError, error_message);
+				PyErr_Format(PyExc_ValueError, "invalid token %s", token);
 				goto cleanup;
 			}
 			else if (errno == ERANGE || col_idx < 0)
 			{
-				PyObject* error_message = PyString_FromFormat("invalid column index in %s", token);
-				if (error_message != NULL)
-					PyErr_SetObject(PyExc_ValueError, error_message);
+				PyErr_Format(PyExc_ValueError, "invalid column index in %s", token);
 				goto cleanup;
 			}
 			
@@ -80,7 +82,7 @@ cleanup:
 	return -1;
 }
 
-static int parse_spec(Reader* reader, const int spec_len, char* tokenized_spec)
+static int parse_spec(Reader* reader, char* tokenized_spec)
 {
 	if (reader->max_col_idx >= 0)
 	{
@@ -115,7 +117,7 @@ static int parse_spec(Reader* reader, const int spec_len, char* tokenized_spec)
 	do
 	{
 		const int token_len = strlen(tokenized_spec);
-		if (token_len == 1)
+		if (token_len == 1 && tokenized_spec[0] == 'a')
 		{
 			reader->verbatim_field_idxs[reader->verbatim_num] = field_idx;
 			reader->verbatim_num++;
@@ -126,9 +128,12 @@ static int parse_spec(Reader* reader, const int spec_len, char* tokenized_spec)
 			const int col_idx = strtol(tokenized_spec, &endptr, 10);
 			if (endptr[1] != 0 || (endptr[0] != 's' && endptr[0] != 'u' && endptr[0] != 'i' && endptr[0] != 'f'))
 			{
-				PyObject* error_message = PyString_FromFormat("invalid column type in %s", tokenized_spec);
-				if (error_message != NULL)
-					PyErr_SetObject(PyExc_ValueError, error_message);
+				PyErr_Format(PyExc_ValueError, "invalid column type in %s", tokenized_spec);
+				goto cleanup;
+			}
+			else if (reader->col_field_map[col_idx].idx != -1)
+			{
+				PyErr_Format(PyExc_ValueError, "duplicate column in %s", tokenized_spec);
 				goto cleanup;
 			}
 			
@@ -150,7 +155,7 @@ cleanup:
 	return -1;
 }
 
-Reader* new_Reader(FILE *fd, const char* spec, const int allow_missing_cols)
+Reader* new_Reader(int fd, PyObject* source, const char* spec, const int allow_missing_cols)
 {
 	Reader* r = (Reader*)malloc(sizeof(Reader));
 	if (r == NULL)
@@ -160,21 +165,48 @@ Reader* new_Reader(FILE *fd, const char* spec, const int allow_missing_cols)
 	}
 	
 	r->fd = fd;
+	/* set once everything is allocated, along with its reference */
+	r->source = NULL;
+	r->buffer = NULL;
+	r->buffer_size = READER_BUFFER_SIZE;
+	r->start = 0;
+	r->end = 0;
+	r->eof = 0;
 	r->lineno = 0;
 	r->allow_missing_cols = allow_missing_cols;
 	r->col_field_map = NULL;
 	r->verbatim_field_idxs = NULL;
+	r->token_num = 0;
+	r->token_starts = NULL;
+	r->token_ends = NULL;
 	
 	int spec_len;
 	char* tokenized_spec = NULL;
-	if (set_spec_stat(r, spec, &spec_len, &tokenized_spec) == -1 || parse_spec(r, spec_len, tokenized_spec) == -1)
+	if (set_spec_stat(r, spec, &spec_len, &tokenized_spec) == -1 || parse_spec(r, tokenized_spec) == -1)
 	{
 		if (tokenized_spec)
 			free(tokenized_spec);
 		free(r);
-		r = NULL;
+		return NULL;
 	}
+	free(tokenized_spec);
 	
+	/* one more byte, to terminate the last token of the file */
+	r->buffer = (char*)malloc(r->buffer_size + 1);
+	if (r->max_col_idx >= 0)
+	{
+		r->token_starts = (char**)malloc(sizeof(char*) * (r->max_col_idx + 1));
+		r->token_ends = (char**)malloc(sizeof(char*) * (r->max_col_idx + 1));
+	}
+	if (r->buffer == NULL || (r->max_col_idx >= 0 && (r->token_starts == NULL || r->token_ends == NULL)))
+	{
+		PyErr_SetString(PyExc_MemoryError, "out of memory");
+		delete_Reader(r);
+		return NULL;
+	}
+	
+	r->source = source;
+	Py_XINCREF(source);
 	return r;
 }
 
@@ -184,73 +216,203 @@ void delete_Reader(Reader* reader)
 		free(reader->col_field_map);
 	if (reader->verbatim_num > 0)
 		free(reader->verbatim_field_idxs);
+	free(reader->token_starts);
+	free(reader->token_ends);
+	free(reader->buffer);
+	Py_XDECREF(reader->source);
 	free(reader);
 }
 
-PyObject* Reader_readline(Reader* reader)
+/* Reads more data after the unread part of the buffer, which is first
+   moved to its beginning. If the buffer is full of unread data, its size
+   is doubled. Returns the number of bytes read (0 at the end of the file)
+   or -1 on errors. */
+static Py_ssize_t fill_buffer(Reader* reader)
 {
-	char line[65535], *fget_res;
-	strtok_info_t sinfo;
-
-	Py_BEGIN_ALLOW_THREADS
-	fget_res = fgets(line, 65535, reader->fd);
-	Py_END_ALLOW_THREADS
-
-	if (fget_res == NULL)
+	if (reader->start > 0)
+	{
+		memmove(reader->buffer, reader->buffer + reader->start, reader->end - reader->start);
+		reader->end -= reader->start;
+		reader->start = 0;
+	}
+	else if (reader->end == reader->buffer_size)
 	{
-		if (ferror(reader->fd))
+		if (reader->buffer_size > PY_SSIZE_T_MAX / 2 - 1)
 		{
-			PyErr_SetString(PyExc_IOError, "cannot read line");
-			return NULL;
+			PyErr_Format(PyExc_MemoryError, "line %lu is too long", reader->lineno + 1);
+			return -1;
 		}
-		else
+		
+		char* buffer = (char*)realloc(reader->buffer, reader->buffer_size * 2 + 1);
+		if (buffer == NULL)
 		{
-			Py_INCREF(Py_None);
-			return Py_None;
+			PyErr_SetString(PyExc_MemoryError, "out of memory");
+			return -1;
 		}
+		
+		reader->buffer = buffer;
+		reader->buffer_size *= 2;
 	}
+	
+	char* dest = reader->buffer + reader->end;
+	const Py_ssize_t space = reader->buffer_size - reader->end;
+	Py_ssize_t count;
+	
+	if (reader->source == NULL)
+	{
+		Py_BEGIN_ALLOW_THREADS
+		do
+			count = read(reader->fd, dest, space);
+		while (count == -1 && errno == EINTR);
+		Py_END_ALLOW_THREADS
+		
+		if (count == -1)
+		{
+			PyErr_SetFromErrno(PyExc_IOError);
+			return -1;
+		}
+	}
+	else
+	{
+		PyObject* view = PyMemoryView_FromMemory(dest, space, PyBUF_WRITE);
+		if (view == NULL)
+			return -1;
+		
+		PyObject* result = PyObject_CallMethod(reader->source, "readinto", "O", view);
+		if (result != NULL)
+		{
+			/* the source must not keep a reference to our buffer */
+			PyObject* released = PyObject_CallMethod(view, "release", NULL);
+			if (released == NULL)
+				Py_CLEAR(result);
+			else
+				Py_DECREF(released);
+		}
+		Py_DECREF(view);
+		if (result == NULL)
+			return -1;
+		else if (result == Py_None)
+		{
+			Py_DECREF(result);
+			PyErr_SetString(PyExc_IOError, "no data available from a non-blocking file");
+			return -1;
+		}
+		
+		count = PyLong_AsSsize_t(result);
+		Py_DECREF(result);
+		if (count == -1 && PyErr_Occurred())
+			return -1;
+		else if (count < 0 || count > space)
+		{
+			PyErr_SetString(PyExc_IOError, "invalid number of bytes returned by readinto()");
+			return -1;
+		}
+	}
+	
+	reader->end += count;
+	return count;
+}
 
-	reader->lineno++;
-
-	const int line_length = strlen(line);
-	if (line_length == 0 || line[line_length-1] != '\n')
+/* Splits a line into the tokens needed by the spec. The line ends either
+   with a newline or at the end of the buffer. */
+static void tokenize(Reader* reader, char* line, char* line_end)
+{
+	const int max_token_num = reader->max_col_idx + 1;
+	char* c = line;
+	
+	reader->token_num = 0;
+	while (reader->token_num < max_token_num)
 	{
-		PyObject* error_message = PyString_FromFormat("unterminated string at line %lu (maybe the read buffer is too small?)", reader->lineno);
-		if (error_message != NULL)
-			PyErr_SetObject(PyExc_IOError, error_message);
+		reader->token_starts[reader->token_num] = c;
+		char* separator = (char*)memchr(c, '\t', line_end - c);
+		reader->token_ends[reader->token_num] = separator == NULL ? line_end : separator;
+		reader->token_num++;
+		
+		if (separator == NULL)
+			break;
 		else
-			PyErr_SetString(PyExc_MemoryError, "out of memory");
-		return NULL;
+			c = separator + 1;
 	}
+}
 
-	if (!strtok_init(&sinfo, line, "\t", '\n'))
+/* Locates the next line in the buffer, reading more data if needed, and
+   splits it. Returns 1 on success, 0 at the end of the file and -1 on
+   errors. The line spans from I{line} to I{line_end}, excluded; the
+   latter points to the terminating newline, if any. */
+static int next_line(Reader* reader, char** line, char** line_end)
+{
+	Py_ssize_t scanned = reader->start;
+	while (1)
 	{
-		PyErr_SetString(PyExc_MemoryError, "out of memory");
-		return NULL;
+		char* const data_end = reader->buffer + reader->end;
+		char* c;
+		
+		Py_BEGIN_ALLOW_THREADS
+		c = (char*)memchr(reader->buffer + scanned, '\n', reader->end - scanned);
+		if (c != NULL)
+			tokenize(reader, reader->buffer + reader->start, c);
+		Py_END_ALLOW_THREADS
+		
+		if (c != NULL)
+		{
+			*line = reader->buffer + reader->start;
+			*line_end = c;
+			reader->start = c - reader->buffer + 1;
+			return 1;
+		}
+		else if (reader->eof)
+		{
+			if (reader->start == reader->end)
+				return 0;
+			
+			/* the last line lacks a newline */
+			*line = reader->buffer + reader->start;
+			*line_end = data_end;
+			reader->start = reader->end;
+			tokenize(reader, *line, *line_end);
+			return 1;
+		}
+		
+		scanned = reader->end - reader->start;
+		const Py_ssize_t count = fill_buffer(reader);
+		if (count == -1)
+			return -1;
+		else if (count == 0)
+			reader->eof = 1;
 	}
+}
 
+PyObject* Reader_readline(Reader* reader)
+{
+	char *line, *line_end;
+	const int res = next_line(reader, &line, &line_end);
+	if (res == -1)
+		return NULL;
+	else if (res == 0)
+	{
+		Py_INCREF(Py_None);
+		return Py_None;
+	}
+	
+	reader->lineno++;
 	
 	PyObject* tuple = PyTuple_New(reader->field_num);
 	if (tuple == NULL)
-	{
-		PyErr_SetString(PyExc_MemoryError, "out of memory");
 		return NULL;
-	}
 	
 	if (reader->verbatim_num > 0)
 	{
-		PyObject* line_dup = PyString_FromString(line);
+		/* include the newline, as the old fgets-based reader did */
+		const Py_ssize_t line_length = line_end - line + (line_end < reader->buffer + reader->end);
+		PyObject* line_dup = PyUnicode_DecodeUTF8(line, line_length, NULL);
 		if (line_dup == NULL)
-		{
-			PyErr_SetString(PyExc_MemoryError, "out of memory");
 			goto cleanup;
-		}
 		
 		int verbatim_idx = reader->verbatim_num;
 		while (1)
 		{
 			verbatim_idx--;
-			PyTuple_SetItem(tuple, reader->verbatim_field_idxs[verbatim_idx], line_dup);
+			PyTuple_SET_ITEM(tuple, reader->verbatim_field_idxs[verbatim_idx], line_dup);
 			
 			if (verbatim_idx == 0)
 				break;
@@ -265,115 +427,221 @@ PyObject* Reader_readline(Reader* reader)
 		col_idx = reader->field_num;
 		while (col_idx > 0)
 		{
-			Py_INCREF(Py_None);
 			col_idx--;
-			PyTuple_SetItem(tuple, col_idx, Py_None);
+			if (PyTuple_GET_ITEM(tuple, col_idx) == NULL)
+			{
+				Py_INCREF(Py_None);
+				PyTuple_SET_ITEM(tuple, col_idx, Py_None);
+			}
 		}
 	}
-	else
-		col_idx = 0;
+	else if (reader->token_num <= reader->max_col_idx)
+	{
+		PyErr_Format(PyExc_IOError, "insufficient token number at line %lu", reader->lineno);
+		goto cleanup;
+	}
 	
-	while (col_idx <= reader->max_col_idx)
+	for (col_idx = 0; col_idx < reader->token_num; col_idx++)
 	{
-		char* token = strtok_get(&sinfo);
-		if (token == NULL)
+		const int field_idx = reader->col_field_map[col_idx].idx;
+		if (field_idx == -1)
+			continue;
+		
+		char* token = reader->token_starts[col_idx];
+		char* token_end = reader->token_ends[col_idx];
+		PyObject* value = NULL;
+		
+		/* numeric parsers need a terminated string: the separator is
+		   replaced for a while, and then restored for the other tokens */
+		const char separator = *token_end;
+		char* endptr;
+		switch (reader->col_field_map[col_idx].type)
 		{
-			if (reader->allow_missing_cols)
-				break;
-			else
+		case 's':
+			value = PyUnicode_DecodeUTF8(token, token_end - token, NULL);
+			if (value == NULL)
+				goto cleanup;
+			break;
+		
+		case 'u':
+		case 'i':
+			*token_end = 0;
+			value = PyLong_FromString(token, &endptr, 10);
+			*token_end = separator;
+			if (value == NULL || endptr != token_end || (reader->col_field_map[col_idx].type == 'u' && *token == '-'))
 			{
-				PyObject* error_message = PyString_FromFormat("insufficient token number at line %lu", reader->lineno);
-				if (error_message != NULL)
-					PyErr_SetObject(PyExc_IOError, error_message);
-				else
-					PyErr_SetString(PyExc_MemoryError, "out of memory");
+				Py_XDECREF(value);
+				PyErr_Format(PyExc_IOError, "invalid %s at line %lu, column %d",
+				             reader->col_field_map[col_idx].type == 'u' ? "unsigned long" : "long",
+				             reader->lineno, col_idx+1);
 				goto cleanup;
 			}
+			break;
+		
+		case 'f':
+			{
+				*token_end = 0;
+				const double number = PyOS_string_to_double(token, &endptr, NULL);
+				*token_end = separator;
+				if ((number == -1.0 && PyErr_Occurred()) || endptr != token_end || token == token_end)
+				{
+					PyErr_Format(PyExc_IOError, "invalid float at line %lu, column %d", reader->lineno, col_idx+1);
+					goto cleanup;
+				}
+				
+				value = PyFloat_FromDouble(number);
+				if (value == NULL)
+					goto cleanup;
+			}
+			break;
+		
+		default:
+			PyErr_SetString(PyExc_RuntimeError, "unexpected internal error");
+			goto cleanup;
 		}
 		
-		const int field_idx = reader->col_field_map[col_idx].idx;
-		if (field_idx != -1)
+		PyObject* previous = PyTuple_GET_ITEM(tuple, field_idx);
+		PyTuple_SET_ITEM(tuple, field_idx, value);
+		Py_XDECREF(previous);
+	}
+	
+	return tuple;
+
+cleanup:
+	Py_DECREF(tuple);
+	return NULL;
+}
+
+/* Appends the verbatim line to the lists of the 'a' fields. */
+static int append_verbatim(Reader* reader, char* line, char* line_end, PyObject** lists)
+{
+	const Py_ssize_t line_length = line_end - line + (line_end < reader->buffer + reader->end);
+	PyObject* line_dup = PyUnicode_DecodeUTF8(line, line_length, NULL);
+	if (line_dup == NULL)
+		return -1;
+	
+	int verbatim_idx;
+	for (verbatim_idx = 0; verbatim_idx < reader->verbatim_num; verbatim_idx++)
+	{
+		if (PyList_Append(lists[reader->verbatim_field_idxs[verbatim_idx]], line_dup) == -1)
 		{
-			PyObject* value = NULL;
-			char* endptr;
-			switch (reader->col_field_map[col_idx].type)
+			Py_DECREF(line_dup);
+			return -1;
+		}
+	}
+	
+	Py_DECREF(line_dup);
+	return 0;
+}
+
+Py_ssize_t Reader_readbatch(Reader* reader, Py_ssize_t max_row_num, void** arrays, PyObject** lists)
+{
+	Py_ssize_t row_idx;
+	for (row_idx = 0; row_idx < max_row_num; row_idx++)
+	{
+		char *line, *line_end;
+		const int res = next_line(reader, &line, &line_end);
+		if (res == -1)
+			return -1;
+		else if (res == 0)
+			break;
+		
+		reader->lineno++;
+		
+		if (reader->verbatim_num > 0 && append_verbatim(reader, line, line_end, lists) == -1)
+			return -1;
+		else if (!reader->allow_missing_cols && reader->token_num <= reader->max_col_idx)
+		{
+			PyErr_Format(PyExc_IOError, "insufficient token number at line %lu", reader->lineno);
+			return -1;
+		}
+		
+		int col_idx;
+		for (col_idx = 0; col_idx <= reader->max_col_idx; col_idx++)
+		{
+			const int field_idx = reader->col_field_map[col_idx].idx;
+			if (field_idx == -1)
+				continue;
+			
+			const char type = reader->col_field_map[col_idx].type;
+			if (col_idx >= reader->token_num)
 			{
-			case 's':
-				value = PyString_FromString(token);
-				if (value == NULL)
+				if (type == 's')
 				{
-					PyErr_SetString(PyExc_MemoryError, "out of memory");
-					goto cleanup;
+					if (PyList_Append(lists[field_idx], Py_None) == -1)
+						return -1;
 				}
-				break;
+				else if (type == 'f')
+					((double*)arrays[field_idx])[row_idx] = Py_NAN;
+				else
+				{
+					PyErr_Format(PyExc_IOError, "missing integer at line %lu, column %d", reader->lineno, col_idx+1);
+					return -1;
+				}
+				continue;
+			}
 			
-			case 'u':
-				value = PyLong_FromString(token, &endptr, 10);
-				if (value == NULL || *endptr != 0 || PyLong_AsLong(value) < 0)
+			char* token = reader->token_starts[col_idx];
+			char* token_end = reader->token_ends[col_idx];
+			const char separator = *token_end;
+			char* endptr;
+			switch (type)
+			{
+			case 's':
 				{
-					PyObject* error_message = PyString_FromFormat("invalid unsigned long at line %lu, column %d", reader->lineno, col_idx+1);
-					if (error_message != NULL)
-						PyErr_SetObject(PyExc_IOError, error_message);
-					else
-						PyErr_SetString(PyExc_MemoryError, "out of memory");
-					goto cleanup;
+					PyObject* value = PyUnicode_DecodeUTF8(token, token_end - token, NULL);
+					if (value == NULL)
+						return -1;
+					
+					const int append_res = PyList_Append(lists[field_idx], value);
+					Py_DECREF(value);
+					if (append_res == -1)
+						return -1;
 				}
 				break;
 			
+			case 'u':
 			case 'i':
-				value = PyLong_FromString(token, &endptr, 10);
-				if (value == NULL || *endptr != 0)
 				{
-					PyObject* error_message = PyString_FromFormat("invalid long at line %lu, column %d", reader->lineno, col_idx+1);
-					if (error_message != NULL)
-						PyErr_SetObject(PyExc_IOError, error_message);
-					else
-						PyErr_SetString(PyExc_MemoryError, "out of memory");
-					goto cleanup;
+					*token_end = 0;
+					errno = 0;
+					const long long number = strtoll(token, &endptr, 10);
+					*token_end = separator;
+					if (endptr != token_end || token == token_end || errno == ERANGE || (type == 'u' && *token == '-'))
+					{
+						PyErr_Format(PyExc_IOError, "invalid %s at line %lu, column %d",
+						             type == 'u' ? "unsigned long" : "long",
+						             reader->lineno, col_idx+1);
+						return -1;
+					}
+					
+					((int64_t*)arrays[field_idx])[row_idx] = number;
 				}
 				break;
 			
 			case 'f':
 				{
-					PyObject* aux = PyString_FromString(token);
-					if (aux == NULL)
+					*token_end = 0;
+					const double number = PyOS_string_to_double(token, &endptr, NULL);
+					*token_end = separator;
+					if ((number == -1.0 && PyErr_Occurred()) || endptr != token_end || token == token_end)
 					{
-						PyErr_SetString(PyExc_MemoryError, "out of memory");
-						goto cleanup;
+						PyErr_Format(PyExc_IOError, "invalid float at line %lu, column %d", reader->lineno, col_idx+1);
+						return -1;
 					}
 					
-					value = PyFloat_FromString(aux, NULL);
-					Py_DECREF(aux);
-					if (value == NULL)
-					{
-						PyObject* error_message = PyString_FromFormat("invalid float at line %lu, column %d", reader->lineno, col_idx+1);
-						if (error_message != NULL)
-							PyErr_SetObject(PyExc_IOError, error_message);
-						else
-							PyErr_SetString(PyExc_MemoryError, "out of memory");
-						goto cleanup;
-					}
+					((double*)arrays[field_idx])[row_idx] = number;
 				}
 				break;
 			
 			default:
 				PyErr_SetString(PyExc_RuntimeError, "unexpected internal error");
-				goto cleanup;
+				return -1;
 			}
-			
-			PyTuple_SetItem(tuple, field_idx, value);
 		}
-		
-		col_idx++;
 	}
 	
-	strtok_clean(&sinfo);
-	return tuple;
-
-cleanup:
-	strtok_clean(&sinfo);
-	Py_DECREF(tuple);
-	return NULL;
+	return row_idx;
 }
 
 unsigned long Reader_lineno(Reader* reader)
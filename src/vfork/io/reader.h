@@ -1,5 +1,8 @@
 #include "Python.h"
 
+/* Initial size of the read buffer, which grows to fit longer lines. */
+#define READER_BUFFER_SIZE (1024 * 1024)
+
 typedef struct
 {
 	int idx;
@@ -8,7 +11,13 @@ typedef struct
 
 typedef struct
 {
-	FILE* fd;
+	int fd;
+	PyObject* source;
+	char* buffer;
+	Py_ssize_t buffer_size;
+	Py_ssize_t start;
+	Py_ssize_t end;
+	int eof;
 	unsigned long lineno;
 	int allow_missing_cols;
 	int field_num;
@@ -16,9 +25,13 @@ typedef struct
 	ColumnSpec* col_field_map;
 	int verbatim_num;
 	int* verbatim_field_idxs;
+	int token_num;
+	char** token_starts;
+	char** token_ends;
 } Reader;
 
-Reader* new_Reader(FILE* fd, const char* spec, const int allow_missing_cols);
+Reader* new_Reader(int fd, PyObject* source, const char* spec, const int allow_missing_cols);
 void delete_Reader(Reader* reader);
 PyObject* Reader_readline(Reader* reader);
+Py_ssize_t Reader_readbatch(Reader* reader, Py_ssize_t max_row_num, void** arrays, PyObject** lists);
 unsigned long Reader_lineno(Reader* reader);
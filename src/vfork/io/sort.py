@@ -0,0 +1,104 @@
+''' Sorting of data sets larger than the available memory. '''
+
+from heapq import merge
+from itertools import islice
+from os import unlink
+from os.path import join
+from pickle import dump, load, HIGHEST_PROTOCOL
+
+from .util import NamedTemporaryDirectory
+
+
+#: The default number of items sorted in memory at a time.
+DEFAULT_RUN_SIZE = 1000000
+
+#: The maximum number of runs merged at once.
+MAX_MERGE_WIDTH = 64
+
+_CHUNK_SIZE = 1024
+
+
+def external_sort(items, key=None, run_size=DEFAULT_RUN_SIZE, dir=None):
+	''' Sorts items that may not fit in memory.
+
+	    Items are collected in runs of at most I{run_size} items, which are
+	    sorted in memory. All runs but the last are written to temporary
+	    files, and finally all runs are merged with a heap. To bound the
+	    number of open files, runs are merged in a cascade: as soon as
+	    L{MAX_MERGE_WIDTH} runs of the same level exist, they are merged
+	    into a single run of the next level. Each item is thus written
+	    a number of times logarithmic in the number of runs.
+
+	    The sort is stable: items having the same key are returned in
+	    the same order in which they were read. Items must be picklable.
+
+	    @param items: an iterable over the items to sort.
+	    @param key: a function extracting a comparison key from each item.
+	    @param run_size: the maximum number of items held in memory.
+	    @param dir: where to create temporary files (by default, the
+	                system temporary directory).
+	    @return: an iterator over the sorted items. Temporary files are
+	             removed when it is exhausted or closed.
+	    @raises ValueError: if the I{run_size} is not positive.
+	'''
+	if run_size < 1:
+		raise ValueError('invalid run size: %d' % run_size)
+	return _external_sort(iter(items), key, run_size, dir)
+
+def _external_sort(items, key, run_size, dir):
+	with NamedTemporaryDirectory(dir) as tmp:
+		# the paths of the runs of each level; each level holds runs
+		# following those of the next one in input order
+		levels = [[]]
+		file_num = 0
+		while True:
+			run = list(islice(items, run_size))
+			run.sort(key=key)
+			if len(run) < run_size:
+				break
+
+			path = join(tmp.path, 'run%d' % file_num)
+			file_num += 1
+			_write_run(path, run)
+			levels[0].append(path)
+
+			level = 0
+			while len(levels[level]) == MAX_MERGE_WIDTH:
+				path = join(tmp.path, 'run%d' % file_num)
+				file_num += 1
+				_write_run(path, merge(*map(_read_run, levels[level]), key=key))
+				for p in levels[level]:
+					unlink(p)
+				levels[level] = []
+
+				level += 1
+				if level == len(levels):
+					levels.append([])
+				levels[level].append(path)
+
+		# ties are resolved by run order, which keeps the sort stable
+		paths = [ p for paths in reversed(levels) for p in paths ]
+		if len(paths) == 0:
+			yield from run
+		else:
+			runs = list(map(_read_run, paths))
+			runs.append(run)
+			yield from merge(*runs, key=key)
+
+def _write_run(path, items):
+	with open(path, 'wb') as fd:
+		items = iter(items)
+		while True:
+			chunk = list(islice(items, _CHUNK_SIZE))
+			if len(chunk) == 0:
+				break
+			dump(chunk, fd, HIGHEST_PROTOCOL)
+
+def _read_run(path):
+	with open(path, 'rb') as fd:
+		while True:
+			try:
+				chunk = load(fd)
+			except EOFError:
+				return
+			yield from chunk
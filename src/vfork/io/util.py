@@ -1,8 +1,10 @@
 __author__ = "Gabriele Sales <gbrsales@gmail.com>"
 __copyright__ = "2009-2010 Gabriele Sales"
 
+from os import chmod, fdopen, rename, unlink
+from os.path import abspath, basename, dirname
 from shutil import rmtree
-from tempfile import mkdtemp
+from tempfile import mkdtemp, mkstemp
 from ..util import exit
 
 
@@ -27,6 +29,42 @@ class NamedTemporaryDirectory(object):
 		rmtree(self.path, ignore_errors=True)
 
 
+def write_atomically(filename, content):
+	''' Replaces the content of a file, so that concurrent readers see
+	    either the old or the new version, never a partial one.
+
+	    The content is first written to a temporary file, which is then
+	    renamed. Failures (for instance, a read-only directory) are
+	    ignored: this function is meant for caches, like indexes, which
+	    can always be rebuilt.
+
+	    @param filename: the path of the file.
+	    @param content: a string or a bytes-like object.
+	    @return: B{True} if the file was written, B{False} otherwise.
+	'''
+	try:
+		fd, tmp_path = mkstemp(dir=dirname(abspath(filename)), prefix=basename(filename) + '.')
+	except OSError:
+		return False
+
+	try:
+		if isinstance(content, str):
+			out = fdopen(fd, 'w', encoding='utf-8')
+		else:
+			out = fdopen(fd, 'wb')
+		with out:
+			out.write(content)
+		chmod(tmp_path, 0o644)
+		rename(tmp_path, filename)
+		return True
+	except OSError:
+		try:
+			unlink(tmp_path)
+		except OSError:
+			pass
+		return False
+
+
 def safe_rstrip(line):
 	''' Performs a right strip of the line, without loosing
 	    any (possibly empty) column.
@@ -1,2 +1,2 @@
 ''' Tools to handle genomic sequences. '''
-from .base import make_sequence_filter, complement, reverse_complement, check_nucleotides
+from .base import make_sequence_filter, make_bytes_sequence_filter, complement, reverse_complement, check_nucleotides
@@ -12,12 +12,7 @@ def check_nucleotides(sequence):
 	return True
 
 
-def _build_complement_table():
-	tbl = [ chr(i) for i in range(256) ]
-	for f, t in zip('ACGTNacgtn', 'TGCANtgcan'):
-		tbl[ord(f)] = t
-	return ''.join(tbl)
-_COMPLEMENT_TABLE = _build_complement_table()
+_COMPLEMENT_TABLE = str.maketrans('ACGTNacgtn', 'TGCANtgcan')
 
 def complement(sequence):
 	''' Computes the complement of the given sequence.
@@ -35,18 +30,34 @@ def reverse_complement(sequence):
 	'''
 	return sequence[::-1].translate(_COMPLEMENT_TABLE)
 
-def _build_lower_table():
-	tbl = [ chr(i) for i in range(256) ]
-	for c in 'ACGTN':
-		tbl[ord(c)] = c.lower()
-	return ''.join(tbl)
-_LOWER_TABLE = _build_lower_table()
-_NEUTRAL_TABLE = ''.join(chr(i) for i in range(256))
-
 def make_sequence_filter(force_lower=False, strip_newlines=True):
 	if force_lower == False and strip_newlines == False:
 		return lambda s: s
 	else:
-		tbl = _LOWER_TABLE if force_lower else _NEUTRAL_TABLE
+		lower_src, lower_dst = ('ACGTN', 'acgtn') if force_lower else ('', '')
 		strip_set = '\r\n' if strip_newlines else ''
-		return lambda s: s.translate(tbl, strip_set)
+		tbl = str.maketrans(lower_src, lower_dst, strip_set)
+		return lambda s: s.translate(tbl)
+
+def make_bytes_sequence_filter(force_lower=False, strip_newlines=True, reverse=False):
+	''' Builds a filter turning raw sequence bytes (e.g. a slice of a
+	    memory mapped FASTA file) into a string.
+
+	    @param force_lower: whether to force nucleotides to lower case.
+	    @param strip_newlines: whether to remove line terminators.
+	    @param reverse: whether to compute the reverse complement.
+	    @return: a function.
+	'''
+	tbl = _BYTES_COMPLEMENT_TABLE if reverse else None
+	if force_lower:
+		tbl = (tbl or _BYTES_NEUTRAL_TABLE).translate(_BYTES_LOWER_TABLE)
+	strip_set = b'\r\n' if strip_newlines else b''
+
+	if reverse:
+		return lambda b: b[::-1].translate(tbl, strip_set).decode('ascii')
+	else:
+		return lambda b: b.translate(tbl, strip_set).decode('ascii')
+
+_BYTES_COMPLEMENT_TABLE = bytes.maketrans(b'ACGTNacgtn', b'TGCANtgcan')
+_BYTES_LOWER_TABLE = bytes.maketrans(b'ACGTN', b'acgtn')
+_BYTES_NEUTRAL_TABLE = bytes(range(256))
@@ -1,8 +1,10 @@
 # Copyright 2021 Paolo Martini <paolo.cavei@gmail.com>
 
+from operator import itemgetter
 from optparse import OptionParser
 from sys import stdin
 
+from vfork.io.sort import external_sort, DEFAULT_RUN_SIZE
 from vfork.io.util import safe_rstrip
 from vfork.util import exit, format_usage
 
@@ -12,10 +14,20 @@ def main():
         %prog <TAB >FASTA
         Transforms a tab-delimited file with two columns into a FASTA file;
         each row in the input is converted into a FASTA block.
+
+        With --sort, the input is sorted on the first column, so that
+        it doesn't need to be sorted beforehand; at most N rows are kept
+        in memory, the others are moved to temporary files.
     '''))
 
     parser.add_option('-s', '--already_sorted', dest='already_sorted', action='store_true',
                       default=False, help='assume input already sorted on firs column.')
+    parser.add_option('-S', '--sort', dest='sort', action='store_true', default=False,
+                      help='sort the input on the first column')
+    parser.add_option('-b', '--sort-buffer', dest='sort_buffer', type='int', default=DEFAULT_RUN_SIZE,
+                      help='the number of rows sorted in memory at a time (default: %d)' % DEFAULT_RUN_SIZE, metavar='N')
+    parser.add_option('-T', '--temporary-directory', dest='tmpdir',
+                      help='where to write temporary files while sorting', metavar='DIR')
 
     options, args = parser.parse_args()
 
@@ -24,13 +36,18 @@ def main():
     else:
         exit('Unexpected argument number.')
 
+    if options.sort_buffer < 1:
+        exit('Invalid sort buffer size: %d' % options.sort_buffer)
+
+    rows = (safe_rstrip(line).split('\t') for line in stdin)
+    if options.sort:
+        rows = external_sort(rows, itemgetter(0), options.sort_buffer, options.tmpdir)
+
     pre_id = None
-    for lineidx, line in enumerate(stdin):
-        line = safe_rstrip(line)
-        tokens = line.split('\t')
+    for tokens in rows:
         fatst_id = tokens[0]
         if pre_id is None or fatst_id != pre_id:
-            if pre_id > fatst_id and not options.already_sorted:
+            if pre_id is not None and pre_id > fatst_id and not (options.already_sorted or options.sort):
                 exit("Input not lexicographically sorted on col 1.")
             print(">%s" % tokens[0])
         print("\t".join(tokens[1:]))
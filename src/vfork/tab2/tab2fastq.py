@@ -3,36 +3,72 @@
 # This file is part of BioinfoTree. It is licensed under the
 # terms of the GNU Affero General Public License version 3.
 
+from itertools import islice, repeat
 from optparse import OptionParser
 from sys import stdin, stdout
-from vfork.fastq.writer import FastqWriter, FormatError
-from vfork.io.util import safe_rstrip
+from vfork.fastq.writer import FastqWriter, FormatError, BULK_BUFFER_SIZE
+from vfork.io.compression import open_input
 from vfork.util import exit, ignore_broken_pipe, format_usage
 
 
+_ROWS_PER_WRITE = 10000
+
+
 def main():
     parser = OptionParser(usage=format_usage('''
         %prog <TAB >FASTQ
 
         Transforms a tab-delimited file with three columns into a FASTQ file.
         Each input row is converted into a FASTQ block.
+
+        The input may be compressed with gzip, bgzip, bzip2, xz or zstd.
+        The output may be compressed as well: blocks of data are then
+        compressed in parallel by several threads.
     '''))
+    parser.add_option('-z', '--gzip', dest='compression', action='store_const', const='gzip',
+                      help='compress the output with gzip')
+    parser.add_option('-b', '--bgzf', dest='compression', action='store_const', const='bgzf',
+                      help='compress the output in the BGZF format (as bgzip does)')
+    parser.add_option('-t', '--threads', dest='threads', type='int',
+                      help='the number of compression threads (default: the number of CPUs)', metavar='N')
+    parser.add_option('-l', '--level', dest='level', type='int', default=6,
+                      help='the compression level, from 1 to 9 (default: 6)', metavar='N')
     options, args = parser.parse_args()
     if len(args) != 0:
         exit('Unexpected argument number.')
+    elif options.threads is not None and options.threads < 1:
+        exit('Invalid number of threads: %d' % options.threads)
+    elif options.level < 1 or options.level > 9:
+        exit('Invalid compression level: %d' % options.level)
 
-    writer = FastqWriter(stdout)
+    writer = FastqWriter(stdout, BULK_BUFFER_SIZE, options.compression, options.threads, options.level)
 
     try:
-        for lineno, line in enumerate(stdin, 1):
-            tokens = safe_rstrip(line).split('\t')
-            if len(tokens) != 3:
-                exit('Found %d tokens at line %d; expected 3.' % (len(tokens), lineno))
+        fd = open_input(stdin)
+        lineno = 0
+        while True:
+            rows = list(islice(fd, _ROWS_PER_WRITE))
+            if len(rows) == 0:
+                break
+
+            # same as safe_rstrip, without a Python call per row
+            blocks = list(map(str.split, map(str.rstrip, rows, repeat('\r\n')), repeat('\t')))
+            if list(map(len, blocks)).count(3) != len(blocks):
+                for idx, tokens in enumerate(blocks, lineno + 1):
+                    if len(tokens) != 3:
+                        exit('Found %d tokens at line %d; expected 3.' % (len(tokens), idx))
 
             try:
-                writer.write(*tokens)
-            except FormatError as e:
-                exit('Error writing FASTQ: while processing line %d, %s.' % (lineno, str(e)))
+                writer.write_many(blocks)
+            except FormatError:
+                # locate the offending row
+                for idx, tokens in enumerate(blocks, lineno + 1):
+                    try:
+                        writer.write_many([tokens])
+                    except FormatError as e:
+                        exit('Error writing FASTQ: while processing line %d, %s.' % (idx, str(e)))
+
+            lineno += len(rows)
 
     finally:
         writer.close()
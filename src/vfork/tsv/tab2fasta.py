@@ -6,7 +6,8 @@ from itertools import groupby
 from operator import itemgetter
 from optparse import OptionParser
 from sys import stdin, stdout
-from vfork.fasta.writer import MultipleBlockWriter
+from vfork.fasta.writer import MultipleBlockWriter, BULK_BUFFER_SIZE
+from vfork.io.sort import external_sort, DEFAULT_RUN_SIZE
 from vfork.io.util import safe_rstrip, parse_int
 from vfork.util import exit, format_usage, ignore_broken_pipe
 
@@ -37,6 +38,10 @@ def main():
         Transforms a tab-delimited into a FASTA file;
                 COL indicate the column containing the sequence,
                 others fields set as header.
+
+        With --sort, the input is sorted on the header fields, so that
+        it doesn't need to be sorted beforehand; at most N rows are kept
+        in memory, the others are moved to temporary files.
     '''))
 
     parser.add_option('-s', '--already-sorted', dest='already_sorted', action='store_true', default=False,
@@ -45,16 +50,28 @@ def main():
                       help='collapse equal headers: header contents are printed one per line.')
     parser.add_option('-c', '--concatenate-seq', dest='concatenate', action='store_true', default=False,
                       help='collapses equal headers and concatenate their contents in strict-fasta format')
+    parser.add_option('-S', '--sort', dest='sort', action='store_true', default=False,
+                      help='sort the input on the header fields')
+    parser.add_option('-b', '--sort-buffer', dest='sort_buffer', type='int', default=DEFAULT_RUN_SIZE,
+                      help='the number of rows sorted in memory at a time (default: %d)' % DEFAULT_RUN_SIZE, metavar='N')
+    parser.add_option('-T', '--temporary-directory', dest='tmpdir',
+                      help='where to write temporary files while sorting', metavar='DIR')
     options, args = parser.parse_args()
 
     if len(args) != 1:
         exit('Unexpected argument number.')
+    elif options.sort_buffer < 1:
+        exit('Invalid sort buffer size: %d' % options.sort_buffer)
 
     col = parse_int(args[0], 'COL', 'strict_positive') - 1
-    writer = MultipleBlockWriter(stdout)
+    writer = MultipleBlockWriter(stdout, buffer_size=BULK_BUFFER_SIZE)
+
+    records = read_line(stdin, col, options.already_sorted or options.sort)
+    if options.sort:
+        records = external_sort(records, itemgetter(0), options.sort_buffer, options.tmpdir)
 
     if options.multi or options.concatenate:
-        for ID, grp in groupby(read_line(stdin, col, options.already_sorted), itemgetter(0)):
+        for ID, grp in groupby(records, itemgetter(0)):
             group = list(grp)
             if options.concatenate:
                 seq = ''.join([s[1] for s in group])
@@ -66,9 +83,7 @@ def main():
                     print(group[i][1])
         writer.flush()
     else:
-        for ID, seq in read_line(stdin, col, options.already_sorted):
-            writer.write_header('\t'.join(ID))
-            writer.write_sequence(seq)
+        writer.write_records(('\t'.join(ID), seq) for ID, seq in records)
         writer.flush()
 
 
@@ -0,0 +1,332 @@
+import os
+import random
+
+import pytest
+
+import vfork.fasta.reader as reader_module
+from vfork.fasta.reader import MultipleBlockReader, INDEX_SUFFIX, FAI_SUFFIX
+
+
+def _write(path, text):
+    with open(path, 'w', newline='') as fd:
+        fd.write(text)
+    return str(path)
+
+def _read_all(reader):
+    return [ (block.label, block[:]) for block in reader.iter_blocks() ]
+
+
+def test_index_round_trip(tmp_path, monkeypatch):
+    path = _write(tmp_path / 'seqs.fa', '>a x\nACGT\nAC\n>b\tc\nGGG\n')
+    reader = MultipleBlockReader(path)
+    try:
+        expected = _read_all(reader)
+        assert expected == [ ('a x', 'ACGTAC'), ('b\tc', 'GGG') ]
+    finally:
+        reader.close()
+    assert os.path.exists(path + INDEX_SUFFIX)
+
+    # the saved index is reused: no scan takes place
+    def fail(self, label_filter=None):
+        raise AssertionError('index rebuilt')
+    monkeypatch.setattr(MultipleBlockReader, '_build_index', fail)
+    reader = MultipleBlockReader(path)
+    try:
+        assert _read_all(reader) == expected
+        assert reader['b\tc'][1:] == 'GG'
+    finally:
+        reader.close()
+
+
+def test_stale_index_is_rebuilt(tmp_path):
+    path = _write(tmp_path / 'seqs.fa', '>a\nACGT\n')
+    MultipleBlockReader(path).close()
+    stat = os.stat(path + INDEX_SUFFIX)
+
+    # same size, different modification time
+    _write(path, '>b\nTTTT\n')
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    reader = MultipleBlockReader(path)
+    try:
+        assert _read_all(reader) == [ ('b', 'TTTT') ]
+    finally:
+        reader.close()
+
+    with open(path + INDEX_SUFFIX) as fd:
+        assert fd.readline().split('\t')[-1].rstrip() == str(os.stat(path).st_mtime_ns)
+
+
+def test_index_not_saved(tmp_path):
+    path = _write(tmp_path / 'seqs.fa', '>a\nACGT\n')
+    MultipleBlockReader(path, save_index=False).close()
+    assert not os.path.exists(path + INDEX_SUFFIX)
+
+
+def test_custom_index_path(tmp_path):
+    path = _write(tmp_path / 'seqs.fa', '>a\nACGT\n')
+    index = str(tmp_path / 'other.idx')
+    MultipleBlockReader(path, index=index).close()
+    assert os.path.exists(index)
+    assert not os.path.exists(path + INDEX_SUFFIX)
+
+
+def test_malformed_index(tmp_path):
+    path = _write(tmp_path / 'seqs.fa', '>a\nACGT\n')
+    MultipleBlockReader(path).close()
+    with open(path + INDEX_SUFFIX, 'a') as fd:
+        fd.write('broken\n')
+
+    with pytest.raises(ValueError):
+        MultipleBlockReader(path)
+
+
+def _wrap(seq, width, newline='\n'):
+    return ''.join(seq[i:i+width] + newline for i in range(0, len(seq), width))
+
+def test_per_block_line_geometry(tmp_path):
+    seqs = [ ('four', 'ACGTTGCAAC', 4, '\n'),
+             ('six', 'GATTACAGATTACA', 6, '\n'),
+             ('crlf', 'CCCGGGAAATT', 3, '\r\n'),
+             ('single', 'ACGTACGTAC', 100, '\n') ]
+    text = ''.join('>%s\n%s' % (label, _wrap(seq, width, newline)) for label, seq, width, newline in seqs)
+    path = _write(tmp_path / 'seqs.fa', text)
+
+    reader = MultipleBlockReader(path, save_index=False)
+    try:
+        for label, seq, width, newline in seqs:
+            block = reader[label]
+            assert (block.size, block.line_len, block.newline_len) == \
+                   (len(seq), min(width, len(seq)) + len(newline), len(newline))
+            for start in range(len(seq)):
+                for stop in range(start, len(seq) + 2):
+                    assert block[start:stop] == seq[start:stop]
+    finally:
+        reader.close()
+
+
+def test_irregular_lines(tmp_path):
+    path = _write(tmp_path / 'seqs.fa', '>a\nACG\nTACGT\nA\n>b\nAC\n\nGT\n>c\nACGT\nAC\n')
+    reader = MultipleBlockReader(path, save_index=False)
+    try:
+        for label, seq in [ ('a', 'ACGTACGTA'), ('b', 'ACGT') ]:
+            block = reader[label]
+            assert block.line_len == 0 and block.newline_len == 0
+            assert block[:] == seq
+            assert block[2:5] == seq[2:5]
+        # a short last line keeps the block regular
+        assert reader['c'].line_len == 5
+        assert reader['c'][3:6] == 'TAC'
+    finally:
+        reader.close()
+
+
+def test_fai_round_trip(tmp_path, monkeypatch):
+    path = _write(tmp_path / 'seqs.fa', '>chr1 first\nACGTA\nCG\n>chr2\r\nGGG\r\n>empty\n')
+    fai = path + FAI_SUFFIX
+    reader = MultipleBlockReader(path, index=fai)
+    try:
+        assert reader.blocks() == [ 'chr1', 'chr2', 'empty' ]
+        assert reader['chr1'][3:7] == 'TACG'
+    finally:
+        reader.close()
+
+    # the same lines samtools faidx writes
+    with open(fai) as fd:
+        assert fd.read() == 'chr1\t7\t12\t5\t6\nchr2\t3\t28\t3\t5\nempty\t0\t40\t0\t0\n'
+
+    def fail(self, label_filter=None):
+        raise AssertionError('index rebuilt')
+    monkeypatch.setattr(MultipleBlockReader, '_build_index', fail)
+    reader = MultipleBlockReader(path, index=fai)
+    try:
+        assert [ (b.label, b[:]) for b in reader.iter_blocks() ] == [ ('chr1', 'ACGTACG'), ('chr2', 'GGG'), ('empty', '') ]
+    finally:
+        reader.close()
+
+
+def test_stale_fai_is_rebuilt(tmp_path):
+    path = _write(tmp_path / 'seqs.fa', '>a\nACGT\n')
+    fai = _write(tmp_path / 'seqs.fa.fai', 'old\t4\t3\t4\t5\n')
+    stat = os.stat(path)
+    os.utime(fai, ns=(stat.st_atime_ns, stat.st_mtime_ns - 10**9))
+
+    reader = MultipleBlockReader(path, index=fai)
+    try:
+        assert reader.blocks() == [ 'a' ]
+    finally:
+        reader.close()
+
+
+def test_fai_skipped_for_irregular_lines(tmp_path):
+    path = _write(tmp_path / 'seqs.fa', '>a\nACG\nTACGT\n')
+    reader = MultipleBlockReader(path, index=path + FAI_SUFFIX)
+    try:
+        assert reader['a'][:] == 'ACGTACGT'
+    finally:
+        reader.close()
+    assert not os.path.exists(path + FAI_SUFFIX)
+
+
+@pytest.mark.parametrize('line', [ 'a\t4\t3\t4\n', 'a\t4\t3\t6\t5\n', 'a\t40\t3\t4\t5\n' ])
+def test_malformed_fai(tmp_path, line):
+    path = _write(tmp_path / 'seqs.fa', '>a\nACGT\n')
+    fai = _write(tmp_path / 'seqs.fa.fai', line)
+    with pytest.raises(ValueError):
+        MultipleBlockReader(path, index=fai)
+
+
+_COMPLEMENT = str.maketrans('ACGTNacgtn', 'TGCANtgcan')
+
+def _reverse_complement(seq):
+    return seq.translate(_COMPLEMENT)[::-1]
+
+@pytest.mark.parametrize('force_lower', [False, True])
+def test_fetch_many(tmp_path, force_lower):
+    seqs = { 'a': 'ACGTTGCAACGGNNac', 'b': 'GATTACAGATTACA', 'irregular': 'ACGTAAACCCGGGTTT' }
+    text = '>a\n%s>b\r\n%s>irregular\nACG\nTAAACC\nCGGGTTT\n' % (_wrap(seqs['a'], 5), _wrap(seqs['b'], 4, '\r\n'))
+    path = _write(tmp_path / 'seqs.fa', text)
+
+    regions = [ ('b', 3, 11), ('a', 0, 16, '-'), ('irregular', 2, 9, '-'), ('a', 4, 6, '+'),
+                ('b', 10, 100), ('a', 7, 7), ('a', 20, 30, '-'), ('irregular', 5, 12) ]
+    expected = []
+    for region in regions:
+        label, start, stop = region[:3]
+        seq = seqs[label][start:stop]
+        if len(region) > 3 and region[3] == '-':
+            seq = _reverse_complement(seq)
+        expected.append(seq.lower() if force_lower else seq)
+
+    reader = MultipleBlockReader(path, force_lower=force_lower, save_index=False)
+    try:
+        assert reader.fetch_many(regions) == expected
+        assert reader.fetch_many([]) == []
+    finally:
+        reader.close()
+
+
+def test_fetch_many_errors(tmp_path):
+    path = _write(tmp_path / 'seqs.fa', '>a\nACGT\n')
+    reader = MultipleBlockReader(path, save_index=False)
+    try:
+        with pytest.raises(KeyError):
+            reader.fetch_many([ ('a', 0, 2), ('b', 0, 2) ])
+        with pytest.raises(ValueError):
+            reader.fetch_many([ ('a', 0, 2, '.') ])
+    finally:
+        reader.close()
+
+
+def test_block_view(tmp_path):
+    seqs = { 'wrapped': 'ACGTTgcaacGGTTA', 'single': 'GATTACAgattaca', 'irregular': 'ACGTAAACCCG' }
+    text = '>wrapped\r\n%s>single\n%s\n>irregular\nACG\nTAAACC\nCG\n' % (_wrap(seqs['wrapped'], 4, '\r\n'), seqs['single'])
+    path = _write(tmp_path / 'seqs.fa', text)
+
+    # views hold raw bytes, even when the reader folds case
+    reader = MultipleBlockReader(path, force_lower=True, save_index=False)
+    try:
+        for label, seq in seqs.items():
+            block = reader[label]
+            for start in range(len(seq) + 1):
+                for stop in range(start, len(seq) + 2):
+                    view = block.view(start, stop)
+                    assert view.tobytes() == seq[start:stop].encode('ascii')
+                    view.release()
+            assert block.view().tobytes() == seq.encode('ascii')
+
+        # slices within a line are views over the mapped file
+        view = reader['wrapped'].view(5, 8)
+        assert view.obj is reader.mf
+        view.release()
+        view = reader['single'].view(2, 12)
+        assert view.obj is reader.mf
+        view.release()
+    finally:
+        reader.close()
+
+
+def test_block_cache(tmp_path):
+    seqs = { 'a': 'ACGTAcgtAC', 'b': 'GGGCCCTTTAAA', 'big': 'ACGT' * 10 }
+    text = ''.join('>%s\n%s' % (label, _wrap(seq, 3)) for label, seq in seqs.items())
+    path = _write(tmp_path / 'seqs.fa', text)
+
+    reader = MultipleBlockReader(path, force_lower=True, save_index=False, block_cache_size=20)
+    try:
+        a, b, big = reader['a'], reader['b'], reader['big']
+
+        # blocks are loaded the second time they are sliced
+        assert a[2:7] == 'gtacg'
+        assert a[0:3] == 'acg'
+        assert list(reader._block_cache) == [ 'a' ]
+        assert a[5:] == 'cgtac'
+        assert (reader.block_cache_hits, reader.block_cache_misses) == (1, 2)
+
+        # blocks larger than the budget are never cached
+        for i in range(3):
+            assert big[i:i+5] == seqs['big'][i:i+5].lower()
+        assert list(reader._block_cache) == [ 'a' ]
+
+        # the least recently used block is evicted
+        assert b[1:4] == 'ggc'
+        assert b[10:] == 'aa'
+        assert list(reader._block_cache) == [ 'b' ]
+        assert reader._block_cache_used == len(seqs['b'])
+        assert a[:] == seqs['a'].lower()
+        assert b[:] == seqs['b'].lower()
+        assert (reader.block_cache_hits, reader.block_cache_misses) == (2, 8)
+    finally:
+        reader.close()
+
+
+def _random_fasta(rnd, count):
+    records = []
+    for i in range(count):
+        newline = rnd.choice([ '\n', '\r\n' ])
+        seq = ''.join(rnd.choice('ACGTN') for _ in range(rnd.choice([ 0, 1, 5, 50, 500 ])))
+        content = _wrap(seq, rnd.randint(1, 60), newline)
+        if rnd.random() < 0.2:
+            # blank or uneven lines
+            lines = content.split(newline)
+            pos = rnd.randrange(len(lines))
+            lines.insert(pos, rnd.choice([ '', 'AC' ]))
+            content = newline.join(lines)
+        if rnd.random() < 0.1:
+            content = content.rstrip('\r\n')
+        records.append('>seq%d desc\t%d%s%s' % (i, i, newline, content))
+        if not records[-1].endswith('\n'):
+            records[-1] += newline
+    return ''.join(records)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_regular_scan_matches_line_scan(tmp_path, monkeypatch, seed):
+    path = _write(tmp_path / 'seqs.fa', _random_fasta(random.Random(seed), 60))
+
+    monkeypatch.setattr(reader_module, '_SMALL_BLOCK_SIZE', 0)
+    reader = MultipleBlockReader(path, save_index=False)
+    fast_blocks = reader.block_list
+    reader.close()
+
+    monkeypatch.setattr(reader_module, '_SMALL_BLOCK_SIZE', 2**62)
+    reader = MultipleBlockReader(path, save_index=False)
+    assert reader.block_list == fast_blocks
+    reader.close()
+
+
+def test_parallel_index(tmp_path):
+    path = _write(tmp_path / 'seqs.fa', _random_fasta(random.Random(7), 200))
+    serial_index = str(tmp_path / 'serial.vfi')
+    parallel_index = str(tmp_path / 'parallel.vfi')
+
+    reader = MultipleBlockReader(path, index=serial_index)
+    serial_blocks = reader.block_list
+    reader.close()
+
+    reader = MultipleBlockReader(path, index=parallel_index, index_processes=3)
+    try:
+        assert reader.block_list == serial_blocks
+        assert reader['seq150 desc\t150'][:] == reader[150][:]
+    finally:
+        reader.close()
+
+    with open(serial_index) as serial:
+        with open(parallel_index) as parallel:
+            assert serial.read() == parallel.read()
@@ -0,0 +1,37 @@
+from io import BytesIO, TextIOWrapper
+
+import pytest
+
+import vfork.fasta.reader as reader_module
+from vfork.fasta.reader import MultipleBlockStreamingReader, FormatError
+
+
+def _read_chunks(data):
+    return list(MultipleBlockStreamingReader(BytesIO(data)))
+
+def _read_lines(data):
+    fd = TextIOWrapper(BytesIO(data), encoding='utf-8', newline=None)
+    return [ (header, ''.join(lines)) for header, lines in MultipleBlockStreamingReader(fd, join_lines=False) ]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 4 * 1024 * 1024])
+@pytest.mark.parametrize('data', [
+    b'>a\r\nAC\r\nGT\r\n>b\r\nTT\r\n',
+    b'>a\nAC\rGT\n>b\nT\rT',
+    b'>a\rAC\r>b x\rGG\rTT\r',
+    b'>a\nACGT\n>b\nGG\n',
+])
+def test_carriage_returns_match_line_reader(monkeypatch, chunk_size, data):
+    monkeypatch.setattr(reader_module, '_STREAM_CHUNK_SIZE', chunk_size)
+    assert _read_chunks(data) == _read_lines(data)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 4 * 1024 * 1024])
+def test_carriage_return_empty_row(monkeypatch, chunk_size):
+    monkeypatch.setattr(reader_module, '_STREAM_CHUNK_SIZE', chunk_size)
+    data = b'>a\nAC\r\rGT\n'
+    with pytest.raises(FormatError) as chunk_error:
+        _read_chunks(data)
+    with pytest.raises(FormatError) as line_error:
+        _read_lines(data)
+    assert str(chunk_error.value) == str(line_error.value)
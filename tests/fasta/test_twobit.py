@@ -0,0 +1,89 @@
+import random
+
+import pytest
+
+from vfork.fasta.twobit import TwoBitReader, write_twobit, fasta_to_twobit
+
+
+def _expected(seq):
+    ''' The sequence read back: symbols other than ACGT become N, keeping their case. '''
+    return ''.join(s if s in 'ACGTacgt' else ('n' if s.islower() else 'N') for s in seq)
+
+def _random_sequence(rnd, size):
+    symbols = []
+    while len(symbols) < size:
+        run = rnd.choice([ 'ACGT', 'acgt', 'N', 'n', 'RY-' ])
+        symbols.extend(rnd.choice(run) for _ in range(rnd.randint(1, 9)))
+    return ''.join(symbols[:size])
+
+
+def test_round_trip(tmp_path):
+    rnd = random.Random(1)
+    blocks = [ ('empty', ''), ('short', 'aCg'), ('runs', 'NNACGTnnnacgtNNNN'), ('edge', 'acgtACGTN') ]
+    blocks.extend(('random%d' % i, _random_sequence(rnd, rnd.randint(1, 200))) for i in range(20))
+    path = str(tmp_path / 'seqs.2bit')
+    write_twobit(iter(blocks), path)
+
+    reader = TwoBitReader(path)
+    try:
+        assert reader.blocks() == [ label for label, seq in blocks ]
+        for label, seq in blocks:
+            block = reader[label]
+            expected = _expected(seq)
+            assert len(block) == len(seq)
+            assert block[:] == expected
+            for start in range(0, len(seq) + 1, 3):
+                for stop in range(start, len(seq) + 2, 5):
+                    assert block[start:stop] == expected[start:stop]
+        assert reader[2].label == 'runs'
+    finally:
+        reader.close()
+
+
+def test_run_tables(tmp_path):
+    path = str(tmp_path / 'seqs.2bit')
+    write_twobit([ ('a', 'NNACGTnnnacgtRNNN') ], path)
+
+    reader = TwoBitReader(path)
+    try:
+        block = reader['a']
+        assert block.n_blocks == [ (0, 2), (6, 3), (13, 4) ]
+        assert block.mask_blocks == [ (6, 7) ]
+    finally:
+        reader.close()
+
+
+def test_force_lower(tmp_path):
+    path = str(tmp_path / 'seqs.2bit')
+    write_twobit([ ('a', 'ACgtNnRT') ], path)
+
+    reader = TwoBitReader(path, force_lower=True)
+    try:
+        assert reader['a'][:] == 'acgtnnnt'
+    finally:
+        reader.close()
+
+
+def test_fasta_to_twobit(tmp_path):
+    fasta = str(tmp_path / 'seqs.fa')
+    with open(fasta, 'w') as fd:
+        fd.write('>chr1 first\nACGTN\nacg\n>chr2\nTTTT\n')
+    path = str(tmp_path / 'seqs.2bit')
+    fasta_to_twobit(fasta, path)
+
+    reader = TwoBitReader(path)
+    try:
+        assert [ (block.label, block[:]) for block in reader.iter_blocks() ] == [ ('chr1 first', 'ACGTNacg'), ('chr2', 'TTTT') ]
+    finally:
+        reader.close()
+
+
+def test_invalid_input(tmp_path):
+    with pytest.raises(ValueError):
+        write_twobit([ ('x' * 256, 'ACGT') ], str(tmp_path / 'long.2bit'))
+
+    path = str(tmp_path / 'bad.2bit')
+    with open(path, 'wb') as fd:
+        fd.write(b'\0' * 32)
+    with pytest.raises(ValueError):
+        TwoBitReader(path)
@@ -0,0 +1,63 @@
+from io import StringIO
+
+import pytest
+
+from vfork.fasta.writer import MultipleBlockWriter
+
+
+class _CountingFile(StringIO):
+    def __init__(self):
+        StringIO.__init__(self)
+        self.writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return StringIO.write(self, text)
+
+
+_RECORDS = [ ('a', 'ACGTACGTAC'), ('empty', ''), ('b x', 'GGG'), ('c', 'ACGT' * 7), ('d', 'ACGT') ]
+_EXPECTED = '>a\nACGT\nACGT\nAC\n>empty\n>b x\nGGG\n>c\n' + 'ACGT\n' * 7 + '>d\nACGT\n'
+
+@pytest.mark.parametrize('buffer_size', [0, 1, 7, 1024])
+def test_write_sequences(buffer_size):
+    fd = StringIO()
+    writer = MultipleBlockWriter(fd, 4, buffer_size)
+    for header, seq in _RECORDS:
+        writer.write_header(header)
+        # sequences may be written in several pieces
+        for i in range(0, len(seq), 3):
+            writer.write_sequence(seq[i:i+3])
+    writer.flush()
+    assert fd.getvalue() == _EXPECTED
+
+
+@pytest.mark.parametrize('buffer_size', [0, 1, 7, 1024])
+def test_write_records(buffer_size):
+    fd = StringIO()
+    writer = MultipleBlockWriter(fd, 4, buffer_size)
+    writer.write_header('first')
+    writer.write_sequence('ACGTAC')
+    writer.write_records(iter(_RECORDS))
+    writer.flush()
+    assert fd.getvalue() == '>first\nACGT\nAC\n' + _EXPECTED
+
+
+def test_buffered_writes():
+    fd = _CountingFile()
+    writer = MultipleBlockWriter(fd, 4, 1024)
+    writer.write_records(_RECORDS)
+    writer.write_header('e')
+    writer.write_sequence('ACGTAC')
+    assert fd.writes == 0
+
+    writer.flush()
+    assert fd.writes == 1
+    assert fd.getvalue() == _EXPECTED + '>e\nACGT\nAC\n'
+
+    fd = _CountingFile()
+    writer = MultipleBlockWriter(fd, 4, 30)
+    writer.write_records(_RECORDS * 10)
+    writer.flush()
+    assert fd.getvalue() == _EXPECTED * 10
+    # chunks of at least 30 characters
+    assert fd.writes <= len(_EXPECTED * 10) // 30 + 1
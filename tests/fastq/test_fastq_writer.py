@@ -0,0 +1,113 @@
+import gzip
+from array import array
+from io import BytesIO, StringIO, TextIOWrapper
+
+import pytest
+
+from vfork.fastq.reader import FastqBatch, FastqStreamingReader
+from vfork.fastq.writer import FastqWriter, FormatError
+
+
+class _CountingFile(BytesIO):
+    def __init__(self):
+        BytesIO.__init__(self)
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return BytesIO.write(self, data)
+
+
+_RECORDS = [ ('a x', 'ACGT', 'IIII'), ('b', '', ''), ('c', 'GGTTA', '#I#I5') ]
+_EXPECTED = '@a x\nACGT\n+\nIIII\n@b\n\n+\n\n@c\nGGTTA\n+\n#I#I5\n'
+
+def _batch(records):
+    offsets = array('Q', [ 0 ])
+    for label, seq, qual in records:
+        offsets.append(offsets[-1] + len(seq))
+    return FastqBatch([ r[0] for r in records ], ''.join(r[1] for r in records).encode('ascii'),
+                      ''.join(r[2] for r in records).encode('ascii'), offsets)
+
+
+@pytest.mark.parametrize('buffer_size', [0, 1, 20, 1024])
+def test_write_methods(buffer_size):
+    fd = TextIOWrapper(BytesIO(), encoding='utf-8')
+    writer = FastqWriter(fd, buffer_size)
+    for record in _RECORDS:
+        writer.write(*record)
+    writer.write_many(_RECORDS)
+    writer.write_many([])
+    writer.write_batch(_batch(_RECORDS))
+    writer.close()
+    fd.flush()
+    assert fd.buffer.getvalue().decode('ascii') == _EXPECTED * 3
+
+
+def test_unbuffered_text_file():
+    fd = StringIO()
+    writer = FastqWriter(fd)
+    writer.write_many(_RECORDS)
+    assert fd.getvalue() == _EXPECTED
+
+
+def test_buffered_writes():
+    fd = _CountingFile()
+    writer = FastqWriter(fd, 1024)
+    writer.write_many(_RECORDS)
+    writer.write(*_RECORDS[0])
+    assert fd.writes == 0
+
+    writer.flush()
+    assert fd.writes == 1
+    assert fd.getvalue().decode('ascii') == _EXPECTED + _EXPECTED[:17]
+
+    fd = _CountingFile()
+    writer = FastqWriter(fd, 100)
+    for _ in range(50):
+        writer.write_many(_RECORDS)
+    writer.close()
+    assert fd.getvalue().decode('ascii') == _EXPECTED * 50
+    assert fd.writes <= len(_EXPECTED) * 50 // 100 + 1
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'bgzf'])
+@pytest.mark.parametrize('threads', [1, 3])
+def test_compressed_round_trip(tmp_path, compression, threads):
+    records = [ ('r%d' % i, 'ACGT' * (i % 9), 'I' * (4 * (i % 9))) for i in range(5000) ]
+    path = str(tmp_path / 'reads.fq.gz')
+    writer = FastqWriter(path, compression=compression, threads=threads)
+    writer.write_many(records[:2000])
+    writer.write_batch(_batch(records[2000:]))
+    writer.close()
+
+    with gzip.open(path, 'rt') as fd:
+        assert fd.read() == ''.join('@%s\n%s\n+\n%s\n' % record for record in records)
+    assert list(FastqStreamingReader(path)) == records
+
+
+def test_compressed_text_stream():
+    fd = TextIOWrapper(BytesIO(), encoding='utf-8')
+    fd.write('# text written before\n')
+    writer = FastqWriter(fd, compression='gzip', threads=1)
+    writer.write_many(_RECORDS)
+    writer.close()
+    data = fd.buffer.getvalue()
+    assert data.startswith(b'# text written before\n')
+    assert gzip.decompress(data[22:]).decode('ascii') == _EXPECTED
+
+    with pytest.raises(ValueError):
+        FastqWriter(StringIO(), compression='gzip')
+
+
+def test_invalid_blocks():
+    writer = FastqWriter(StringIO())
+    with pytest.raises(FormatError):
+        writer.write('', 'A', 'I')
+    with pytest.raises(FormatError):
+        writer.write('a', 'AC', 'I')
+    with pytest.raises(FormatError):
+        writer.write_many([ ('a', 'A', 'I'), ('', 'A', 'I') ])
+    with pytest.raises(FormatError):
+        writer.write_many([ ('a', 'A', 'I'), ('b', 'A', 'II') ])
+    with pytest.raises(FormatError):
+        writer.write_batch(_batch([ ('', 'A', 'I') ]))
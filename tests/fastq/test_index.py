@@ -0,0 +1,67 @@
+import vfork.fastq.index as index_module
+from vfork.fastq.index import IndexedFastqReader
+
+
+def _write_fastq(path, count):
+    with open(path, 'w') as fd:
+        for i in range(count):
+            fd.write('@read%d extra\nACGTACGTAC\n+\nIIIIIIIIII\n' % i)
+
+
+def test_bulk_scan_spans_several_chunks(tmp_path, monkeypatch):
+    path = str(tmp_path / 'reads.fq')
+    _write_fastq(path, 5000)
+    # chunk boundaries fall in the middle of records
+    monkeypatch.setattr(index_module, '_SCAN_CHUNK_SIZE', 1000)
+
+    calls = []
+    scan_record = IndexedFastqReader._scan_record
+    def counting_scan_record(self, pos, lineno):
+        calls.append(pos)
+        return scan_record(self, pos, lineno)
+    monkeypatch.setattr(IndexedFastqReader, '_scan_record', counting_scan_record)
+
+    reader = IndexedFastqReader(path, save_index=False)
+    try:
+        assert len(calls) == 0
+        assert reader[0] == ('read0 extra', 'ACGTACGTAC', 'IIIIIIIIII')
+        assert reader[4999][0] == 'read4999 extra'
+        assert reader['read2500'][0] == 'read2500 extra'
+    finally:
+        reader.close()
+
+
+def test_irregular_record_after_bulk_scan(tmp_path, monkeypatch):
+    path = str(tmp_path / 'reads.fq')
+    _write_fastq(path, 100)
+    with open(path, 'a') as fd:
+        fd.write('@multi\nACGT\nACGT\n+\nIIII\nIIII\n@last\nA\n+\nI\n')
+    monkeypatch.setattr(index_module, '_SCAN_CHUNK_SIZE', 1000)
+
+    reader = IndexedFastqReader(path, save_index=False)
+    try:
+        assert reader[99][0] == 'read99 extra'
+        assert reader['multi'] == ('multi', 'ACGTACGT', 'IIIIIIII')
+        assert reader[101] == ('last', 'A', 'I')
+    finally:
+        reader.close()
+
+
+def test_duplicate_and_blank_names(tmp_path, monkeypatch):
+    path = str(tmp_path / 'reads.fq')
+    with open(path, 'w') as fd:
+        for i in range(300):
+            fd.write('@read%d\nA\n+\nI\n@dup %d\nC\n+\nI\n' % (i, i))
+        fd.write('@ \nG\n+\nI\n')
+    monkeypatch.setattr(index_module, '_SCAN_CHUNK_SIZE', 100)
+
+    reader = IndexedFastqReader(path, save_index=False)
+    try:
+        assert len(reader) == 601
+        # the first record with a name wins
+        assert reader['dup'] == ('dup 0', 'C', 'I')
+        assert reader['read299'] == ('read299', 'A', 'I')
+        assert reader[''] == (' ', 'G', 'I')
+        assert reader.fetch_many(['read7', 5, 'dup']) == [('read7', 'A', 'I'), ('dup 2', 'C', 'I'), ('dup 0', 'C', 'I')]
+    finally:
+        reader.close()
@@ -0,0 +1,247 @@
+import gzip
+from array import array
+from io import BytesIO, TextIOWrapper
+
+import pytest
+
+import vfork.fastq.reader as reader_module
+from vfork.fastq.reader import FastqStreamingReader, PairedFastqReader, ParallelFastqReader, FormatError
+
+
+def _open(data):
+    return FastqStreamingReader(TextIOWrapper(BytesIO(data), encoding='utf-8'))
+
+def _read_records(data):
+    return list(_open(data))
+
+def _read_batches(data, size):
+    return [ record for batch in _open(data).iter_batches(size) for record in batch ]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 4 * 1024 * 1024])
+@pytest.mark.parametrize('newline', [b'\n', b'\r\n', b'\r'])
+@pytest.mark.parametrize('data', [
+    b'@a\nACGT\n+\nIIII\n',
+    b'@a x\nAC\n+\nII\n@b\nGGT\n+\nIII',
+    b'@a\nAC\nGT\n+\nII\nII\n@b\nA\n+\nI\n',
+])
+def test_batches_match_records(monkeypatch, chunk_size, newline, data):
+    monkeypatch.setattr(reader_module, '_READ_CHUNK_SIZE', chunk_size)
+    data = data.replace(b'\n', newline)
+    for size in (1, 2, 100):
+        assert _read_batches(data, size) == _read_records(data)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 4 * 1024 * 1024])
+@pytest.mark.parametrize('data', [
+    b'@a\rACGT\r+\rIIIII\r',
+    b'@a\nAC\n+\nII\n@',
+    b'@a\nA\nC\n+\nII\n@',
+    b'@a\r\nA\r\nC\r\n+\r\nII\r\nx\r\n',
+])
+def test_batch_errors_match_records(monkeypatch, chunk_size, data):
+    monkeypatch.setattr(reader_module, '_READ_CHUNK_SIZE', chunk_size)
+    with pytest.raises(FormatError) as record_error:
+        _read_records(data)
+    with pytest.raises(FormatError) as batch_error:
+        _read_batches(data, 2)
+    assert str(batch_error.value) == str(record_error.value)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 4 * 1024 * 1024])
+@pytest.mark.parametrize('newline', [b'\r\n', b'\r'])
+@pytest.mark.parametrize('data', [
+    b'@a x\nAC\n+\nII\n@b\nGGT\n+\nIII',
+    b'@a\nAC\nGT\n+\nII\nII\n@b\nA\n+\nI\n',
+    b'@a\nAC\n+\nII\nb\nA\n+\nI\n',
+    b'@a\nAC\n+\nII\n@b\nAC\n+\nIII\n',
+])
+def test_parallel_reader_matches_records(chunk_size, newline, data):
+    data = data.replace(b'\n', newline)
+    try:
+        expected = _read_records(data)
+    except FormatError as e:
+        expected = str(e)
+
+    try:
+        result = list(ParallelFastqReader(BytesIO(data), processes=1, chunk_size=chunk_size))
+    except FormatError as e:
+        result = str(e)
+
+    assert result == expected
+
+
+def _fastq(count, multiline_at=None):
+    records = []
+    for i in range(count):
+        seq = 'ACGT' * (i % 7 + 1)
+        if i == multiline_at:
+            records.append('@r%d x\n%s\n%s\n+\n%s\n%s\n' % (i, seq, seq, 'I' * len(seq), 'I' * len(seq)))
+        else:
+            records.append('@r%d x\n%s\n+r%d x\n%s\n' % (i, seq, i, '#' * len(seq)))
+    return ''.join(records).encode('ascii')
+
+@pytest.mark.parametrize('processes', [1, 2])
+@pytest.mark.parametrize('multiline_at', [None, 0, 150])
+def test_parallel_reader_order(processes, multiline_at):
+    data = _fastq(300, multiline_at)
+    reader = ParallelFastqReader(BytesIO(data), processes=processes, chunk_size=100, queue_depth=3)
+    assert list(reader) == _read_records(data)
+
+
+def test_parallel_reader_path(tmp_path):
+    data = _fastq(200)
+    path = str(tmp_path / 'reads.fq.gz')
+    with gzip.open(path, 'wb') as fd:
+        fd.write(data)
+    assert list(ParallelFastqReader(path, processes=2, chunk_size=500)) == _read_records(data)
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_parallel_reader_errors(processes):
+    data = _fastq(100) + b'@bad\nACGT\n+\nIII\n' + _fastq(10)
+    with pytest.raises(FormatError) as error:
+        list(ParallelFastqReader(BytesIO(data), processes=processes, chunk_size=64))
+    with pytest.raises(FormatError) as record_error:
+        _read_records(data)
+    assert str(error.value) == str(record_error.value)
+    assert 'at line 405' in str(error.value)
+
+
+def test_batch_columns():
+    data = b'@a x\nACGT\n+\nIIII\n@b\nGG\n+\n#I\n@c\n\n+\n\n@d\nTTTTT\n+\n55555\n'
+    batches = list(_open(data).iter_batches(3))
+    assert list(map(len, batches)) == [ 3, 1 ]
+
+    batch = batches[0]
+    assert batch.labels == [ 'a x', 'b', 'c' ]
+    assert batch.sequences == b'ACGTGG'
+    assert batch.qualities == b'IIII#I'
+    assert batch.offsets == array('Q', [ 0, 4, 6, 6 ])
+    assert batch.lengths() == [ 4, 2, 0 ]
+    assert batch[1] == ('b', 'GG', '#I')
+    assert batch[-1] == ('c', '', '')
+    assert list(batch) == [ ('a x', 'ACGT', 'IIII'), ('b', 'GG', '#I'), ('c', '', '') ]
+
+
+@pytest.mark.parametrize('multiline', [False, True])
+def test_batches_from_lines(multiline):
+    # without a binary buffer, blocks are grouped from the record iterator
+    lines = [ '@a\n', 'AC\n', '+\n', 'II\n', '@b\n', 'G\n', 'T\n', '+\n', '#\n', '#\n' ]
+    batches = list(FastqStreamingReader(iter(lines), multiline=multiline).iter_batches(1))
+    assert [ list(batch) for batch in batches ] == [ [ ('a', 'AC', 'II') ], [ ('b', 'GT', '##') ] ]
+    assert batches[1].offsets == array('Q', [ 0, 2 ])
+
+
+def test_batch_to_numpy():
+    np = pytest.importorskip('numpy')
+    data = b'@a\nACGT\n+\nIIII\n@b\nGG\n+\n#I\n'
+    batch = next(_open(data).iter_batches(10, numpy=True))
+    assert batch.sequences.dtype == np.uint8 and batch.qualities.dtype == np.uint8
+    assert batch.offsets.dtype == np.int64
+    assert batch.sequences.tobytes() == b'ACGTGG'
+    assert batch.offsets.tolist() == [ 0, 4, 6 ]
+    assert batch.lengths().tolist() == [ 4, 2 ]
+    assert batch[1] == ('b', 'GG', '#I')
+    assert list(batch) == _read_records(data)
+
+
+def test_invalid_batch_size():
+    with pytest.raises(ValueError):
+        next(_open(b'@a\nA\n+\nI\n').iter_batches(0))
+
+
+def _mates(count, suffixes=('', '')):
+    mates = ([], [])
+    for i in range(count):
+        for mate, suffix in zip(mates, suffixes):
+            seq = 'ACGT'[i % 4] * (i % 5 + len(mate) % 3)
+            mate.append(('r%d%s x' % (i, suffix), seq, 'I' * len(seq)))
+    return mates
+
+def _write_fastq(path, records):
+    with open(path, 'w') as fd:
+        fd.writelines('@%s\n%s\n+\n%s\n' % record for record in records)
+    return path
+
+@pytest.mark.parametrize('suffixes', [ ('', ''), ('/1', '/2') ])
+@pytest.mark.parametrize('batch_size', [1, 3, 100])
+def test_paired_reader(tmp_path, suffixes, batch_size):
+    mates1, mates2 = _mates(50, suffixes)
+    path1 = _write_fastq(str(tmp_path / 'reads_1.fq'), mates1)
+    path2 = _write_fastq(str(tmp_path / 'reads_2.fq'), mates2)
+    assert list(PairedFastqReader(path1, path2, batch_size=batch_size)) == list(zip(mates1, mates2))
+
+    interleaved = [ record for pair in zip(mates1, mates2) for record in pair ]
+    path = _write_fastq(str(tmp_path / 'reads.fq'), interleaved)
+    assert list(PairedFastqReader(path, batch_size=batch_size)) == list(zip(mates1, mates2))
+
+    batches = list(PairedFastqReader(path1, path2).iter_batches(20))
+    assert [ (len(batch1), len(batch2)) for batch1, batch2 in batches ] == [ (20, 20), (20, 20), (10, 10) ]
+
+
+def test_paired_reader_name_mismatch(tmp_path):
+    mates1, mates2 = _mates(30, ('/1', '/2'))
+    mates2[17] = ('other/2', mates2[17][1], mates2[17][2])
+    path1 = _write_fastq(str(tmp_path / 'reads_1.fq'), mates1)
+    path2 = _write_fastq(str(tmp_path / 'reads_2.fq'), mates2)
+
+    with pytest.raises(FormatError) as error:
+        list(PairedFastqReader(path1, path2, batch_size=4))
+    assert 'r17/1 x, other/2' in str(error.value)
+    assert len(list(PairedFastqReader(path1, path2, check_names=False))) == 30
+
+    # swapped suffixes
+    mates1, mates2 = _mates(3, ('/2', '/1'))
+    path1 = _write_fastq(str(tmp_path / 'reads_1.fq'), mates1)
+    path2 = _write_fastq(str(tmp_path / 'reads_2.fq'), mates2)
+    with pytest.raises(FormatError):
+        list(PairedFastqReader(path1, path2))
+
+
+@pytest.mark.parametrize('batch_size', [1, 4, 100])
+def test_paired_reader_unequal_counts(tmp_path, batch_size):
+    mates1, mates2 = _mates(10)
+    path1 = _write_fastq(str(tmp_path / 'reads_1.fq'), mates1)
+    path2 = _write_fastq(str(tmp_path / 'reads_2.fq'), mates2[:8])
+    with pytest.raises(FormatError):
+        list(PairedFastqReader(path1, path2, batch_size=batch_size))
+    with pytest.raises(FormatError):
+        list(PairedFastqReader(path2, path1, batch_size=batch_size))
+
+    path = _write_fastq(str(tmp_path / 'reads.fq'), mates1[:3])
+    with pytest.raises(FormatError):
+        list(PairedFastqReader(path, batch_size=batch_size))
+
+
+def _wrapped_fastq(records, width):
+    wrap = lambda s: ''.join(s[i:i+width] + '\n' for i in range(0, max(len(s), 1), width))
+    return ''.join('@%s\n%s+\n%s' % (label, wrap(seq), wrap(qual)) for label, seq, qual in records).encode('ascii')
+
+@pytest.mark.parametrize('multiline', [False, True])
+@pytest.mark.parametrize('width', [1, 60, 100000])
+def test_multiline_blocks(multiline, width):
+    records = [ ('r%d' % i, 'ACGT' * (i * 3000 + 1), '#I' * (i * 6000 + 2)) for i in range(5) ]
+    data = _wrapped_fastq(records, width)
+    assert list(FastqStreamingReader(TextIOWrapper(BytesIO(data)), multiline=multiline)) == records
+    assert list(FastqStreamingReader(TextIOWrapper(BytesIO(data.replace(b'\n', b'\r\n'))), multiline=multiline)) == records
+
+
+def test_multiline_after_regular_blocks():
+    # the reader switches mode on the first wrapped block
+    data = b'@a\nAC\n+\nII\n@b\nACG\nT\n+\nII\nII\n@c\nG\n+\n#\n'
+    expected = [ ('a', 'AC', 'II'), ('b', 'ACGT', 'IIII'), ('c', 'G', '#') ]
+    assert _read_records(data) == expected
+    assert list(FastqStreamingReader(TextIOWrapper(BytesIO(data)), multiline=True)) == expected
+
+
+@pytest.mark.parametrize('multiline', [False, True])
+@pytest.mark.parametrize('data, message', [
+    (b'@a\nAC\n+\nII\n@b\nACG\nT\n+\nII\nIII\n', 'invalid quality in file <unknown> at line 10'),
+    (b'@a\nAC\nGT\n+\nII\nII\n@b\nA\n+\n', 'incomplete FASTQ block in file <unknown> at line: 10'),
+    (b'@a\nAC\nGT\n+\nII\nII\nb\nA\n+\nI\n', 'invalid FASTQ header in file <unknown> at line 7: b\n'),
+])
+def test_multiline_errors(multiline, data, message):
+    with pytest.raises(FormatError) as error:
+        list(FastqStreamingReader(iter(TextIOWrapper(BytesIO(data))), multiline=multiline))
+    assert str(error.value) == message
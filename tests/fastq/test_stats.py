@@ -0,0 +1,87 @@
+import math
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from vfork.fastq.stats import QualityStats, compute_stats, decode_qualities, read_summaries, MAX_SCORE
+
+
+def _write_fastq(path, quals):
+    with open(path, 'w') as fd:
+        for i, qual in enumerate(quals):
+            fd.write('@r%d\n%s\n+\n%s\n' % (i, 'A' * len(qual), qual))
+
+def _random_quals(rnd, count, lengths, offset=33):
+    return [ ''.join(chr(offset + rnd.randint(0, 41)) for _ in range(rnd.choice(lengths))) for _ in range(count) ]
+
+def _naive_stats(quals, offset, threshold):
+    scores = [ [ ord(c) - offset for c in qual ] for qual in quals ]
+    score_counts = [0] * (MAX_SCORE + 1)
+    mean_counts = [0] * (MAX_SCORE + 1)
+    min_counts = [0] * (MAX_SCORE + 1)
+    max_length = max(map(len, scores), default=0)
+    cycle_counts = [0] * max_length
+    cycle_sums = [0] * max_length
+    cycle_above = [0] * max_length
+
+    for read in scores:
+        for cycle, score in enumerate(read):
+            score_counts[score] += 1
+            cycle_counts[cycle] += 1
+            cycle_sums[cycle] += score
+            cycle_above[cycle] += score >= threshold
+        if len(read) > 0:
+            mean_counts[sum(read) // len(read)] += 1
+            min_counts[min(read)] += 1
+
+    return dict(reads=len(scores), bases=sum(map(len, scores)), score_counts=score_counts,
+                read_mean_counts=mean_counts, read_min_counts=min_counts, cycle_counts=cycle_counts,
+                cycle_sums=cycle_sums, cycle_above=cycle_above)
+
+
+@pytest.mark.parametrize('lengths', [ [ 50 ], [ 0, 1, 7, 30, 31 ] ])
+@pytest.mark.parametrize('batch_size', [ 1, 13, 1000 ])
+@pytest.mark.parametrize('offset', [ 33, 64 ])
+def test_stats_match_naive_computation(tmp_path, lengths, batch_size, offset):
+    quals = _random_quals(random.Random(batch_size), 200, lengths, offset)
+    path = str(tmp_path / 'reads.fq')
+    _write_fastq(path, quals)
+
+    stats = compute_stats(path, offset, 25, batch_size)
+    for name, expected in _naive_stats(quals, offset, 25).items():
+        value = getattr(stats, name)
+        assert (value.tolist() if isinstance(value, np.ndarray) else value) == expected, name
+
+    scores = [ ord(c) - offset for qual in quals for c in qual ]
+    assert stats.mean_score() == pytest.approx(sum(scores) / len(scores))
+    assert stats.fraction_above() == pytest.approx(sum(s >= 25 for s in scores) / len(scores))
+    assert stats.cycle_means()[0] == pytest.approx(stats.cycle_sums[0] / stats.cycle_counts[0])
+
+
+def test_read_summaries():
+    quals = [ 'II5', '', '#', '5I', '' ]
+    scores = decode_qualities(''.join(quals).encode('ascii'))
+    offsets = np.cumsum([ 0 ] + list(map(len, quals)))
+    means, mins, fractions = read_summaries(scores, offsets, 30)
+
+    assert mins.tolist() == [ 20, 0, 2, 20, 0 ]
+    assert means[[0, 2, 3]].tolist() == pytest.approx([ (40 + 40 + 20) / 3, 2, 30 ])
+    assert fractions[[0, 2, 3]].tolist() == pytest.approx([ 2 / 3, 0, 0.5 ])
+    assert math.isnan(means[1]) and math.isnan(fractions[4])
+
+
+def test_no_reads(tmp_path):
+    path = str(tmp_path / 'reads.fq')
+    _write_fastq(path, [])
+    stats = compute_stats(path)
+    assert stats.reads == 0 and stats.bases == 0
+    assert math.isnan(stats.mean_score())
+
+
+def test_invalid_qualities():
+    with pytest.raises(ValueError):
+        decode_qualities(b'II!', offset=64)
+    with pytest.raises(ValueError):
+        QualityStats(offset=50)
@@ -0,0 +1,124 @@
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from vfork.fastq.reader import FastqBatch, FastqStreamingReader
+from vfork.fastq.trim import ReadTrimmer, trim_fastq
+
+
+_ADAPTER = 'AGATCGGAAG'
+
+def _random_reads(rnd, count):
+    reads = []
+    for i in range(count):
+        seq = ''.join(rnd.choice('ACGTNn' if rnd.random() < 0.2 else 'ACGT') for _ in range(rnd.randint(0, 60)))
+        if rnd.random() < 0.4:
+            seq = seq[:rnd.randint(0, len(seq))] + _ADAPTER[:rnd.randint(1, len(_ADAPTER))]
+        qual = ''.join(chr(33 + rnd.choice([ rnd.randint(0, 15), rnd.randint(25, 40) ])) for _ in seq)
+        reads.append(('r%d' % i, seq, qual))
+    return reads
+
+def _batch(reads):
+    offsets = [ 0 ]
+    for label, seq, qual in reads:
+        offsets.append(offsets[-1] + len(seq))
+    return FastqBatch([ r[0] for r in reads ],
+                      ''.join(r[1] for r in reads).encode('ascii'),
+                      ''.join(r[2] for r in reads).encode('ascii'),
+                      offsets)
+
+def _naive_trim(reads, head=0, tail=0, adapter=None, min_overlap=3, window=None,
+                min_quality=20, max_length=None, max_n=None, min_length=0):
+    trimmed = []
+    for label, seq, qual in reads:
+        start = min(head, len(seq))
+        end = max(len(seq) - tail, start)
+
+        if adapter is not None:
+            for size in range(min(len(adapter), end - start), min_overlap - 1, -1):
+                if seq[end-size:end] == adapter[:size]:
+                    end -= size
+                    break
+        if window is not None:
+            scores = [ ord(q) - 33 for q in qual ]
+            for pos in range(start, end - window + 1):
+                if sum(scores[pos:pos+window]) < min_quality * window:
+                    end = pos
+                    break
+        if max_length is not None:
+            end = min(end, start + max_length)
+
+        if end - start < min_length:
+            continue
+        elif max_n is not None and seq[start:end].upper().count('N') > max_n:
+            continue
+        trimmed.append((label, seq[start:end], qual[start:end]))
+    return trimmed
+
+
+_PARAMETERS = [
+    dict(),
+    dict(head=3, tail=5),
+    dict(head=70),
+    dict(adapter=_ADAPTER),
+    dict(adapter=_ADAPTER, min_overlap=1, tail=2),
+    dict(window=4, min_quality=20),
+    dict(window=12, min_quality=25),
+    dict(max_length=20, min_length=10),
+    dict(max_n=0),
+    dict(head=2, adapter=_ADAPTER, window=5, max_length=40, max_n=1, min_length=15),
+]
+
+@pytest.mark.parametrize('params', _PARAMETERS)
+def test_trimmer_matches_naive_computation(params):
+    rnd = random.Random(len(params))
+    reads = _random_reads(rnd, 300)
+    expected = _naive_trim(reads, **params)
+
+    trimmer = ReadTrimmer(**params)
+    result = []
+    for start in range(0, len(reads), 70):
+        batch = _batch(reads[start:start+70])
+        if start % 140 == 0:
+            batch.to_numpy()
+        result.extend(trimmer.process(batch))
+    assert result == expected
+
+    assert (trimmer.reads_in, trimmer.bases_in) == (len(reads), sum(len(r[1]) for r in reads))
+    assert (trimmer.reads_out, trimmer.bases_out) == (len(expected), sum(len(r[1]) for r in expected))
+    assert trimmer.too_short + trimmer.too_many_n == len(reads) - len(expected)
+
+
+def test_counters():
+    reads = [ ('a', 'ACGTACGTAGAT', 'I' * 12),
+              ('b', 'ACGTACGTACGT', 'IIIIII######'),
+              ('c', 'NNACGTACGTAC', 'I' * 12),
+              ('d', 'ACG', 'III') ]
+    trimmer = ReadTrimmer(adapter=_ADAPTER, window=3, max_n=1, min_length=5)
+    assert list(trimmer.process(_batch(reads))) == [ ('a', 'ACGTACGT', 'I' * 8), ('b', 'ACGTA', 'IIIII') ]
+    assert trimmer.adapter_trimmed == 1
+    assert trimmer.quality_trimmed == 1
+    assert trimmer.too_many_n == 1
+    assert trimmer.too_short == 1
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip'])
+def test_trim_fastq(tmp_path, compression):
+    reads = _random_reads(random.Random(5), 500)
+    src = str(tmp_path / 'reads.fq')
+    with open(src, 'w') as fd:
+        fd.writelines('@%s\n%s\n+\n%s\n' % read for read in reads)
+
+    dst = str(tmp_path / 'trimmed.fq')
+    trimmer = ReadTrimmer(adapter=_ADAPTER, window=4, min_length=1)
+    trim_fastq(src, dst, trimmer, batch_size=64, compression=compression)
+    assert list(FastqStreamingReader(dst)) == _naive_trim(reads, adapter=_ADAPTER, window=4, min_length=1)
+
+
+@pytest.mark.parametrize('params', [ dict(head=-1), dict(adapter=''), dict(adapter='A', min_overlap=0),
+                                     dict(window=0), dict(max_length=-1), dict(max_n=-1), dict(min_length=-1) ])
+def test_invalid_parameters(params):
+    with pytest.raises(ValueError):
+        ReadTrimmer(**params)
@@ -0,0 +1,132 @@
+import gzip
+import os
+import zlib
+from struct import pack, unpack_from
+
+import pytest
+
+from vfork.fasta.reader import MultipleBlockReader, BgzfMultipleBlockReader, FAI_SUFFIX
+from vfork.io.bgzf import BgzfReader, GZI_SUFFIX
+
+
+def _bgzf_member(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    header = pack('<4BI2BH2BHH', 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, 18 + len(cdata) + 8 - 1)
+    return header + cdata + pack('<2I', zlib.crc32(data), len(data))
+
+def _write_bgzf(path, data, member_size):
+    ''' Writes a BGZF file, returning the compressed and uncompressed offsets of its members. '''
+    offsets = []
+    with open(path, 'wb') as fd:
+        for start in range(0, len(data), member_size):
+            offsets.append((fd.tell(), start))
+            fd.write(_bgzf_member(data[start:start+member_size]))
+        fd.write(_bgzf_member(b''))
+    return offsets
+
+
+def test_slices_across_members(tmp_path):
+    data = bytes(range(256)) * 40
+    path = str(tmp_path / 'data.gz')
+    _write_bgzf(path, data, 1000)
+
+    reader = BgzfReader(path, cache_size=2)
+    try:
+        assert len(reader) == len(data)
+        for start, stop in [ (0, 10), (995, 1005), (500, 3500), (0, len(data)), (len(data) - 3, len(data) + 5) ]:
+            assert reader[start:stop] == data[start:stop]
+        assert reader[1500] == data[1500]
+        assert reader[-1] == data[-1]
+        assert reader[10:5000:7] == data[10:5000:7]
+        assert reader.find(b'\xff\x00\x01', 2000) == data.find(b'\xff\x00\x01', 2000)
+        assert reader.find(b'\x05\x06', 0, 5) == -1
+    finally:
+        reader.close()
+
+
+def test_gzi_index(tmp_path):
+    data = b'ACGT' * 1000
+    path = str(tmp_path / 'data.gz')
+    offsets = _write_bgzf(path, data, 700)
+
+    BgzfReader(path).close()
+    with open(path + GZI_SUFFIX, 'rb') as fd:
+        content = fd.read()
+    # the first member is omitted, as bgzip does
+    count = unpack_from('<Q', content)[0]
+    assert count == len(offsets) - 1
+    assert [ unpack_from('<QQ', content, 8 + i * 16) for i in range(count) ] == offsets[1:]
+
+    reader = BgzfReader(path)
+    try:
+        assert reader[690:1410] == data[690:1410]
+    finally:
+        reader.close()
+
+
+def test_member_cache(tmp_path):
+    data = b'ACGT' * 1000
+    path = str(tmp_path / 'data.gz')
+    _write_bgzf(path, data, 1000)
+
+    reader = BgzfReader(path, save_index=False, cache_size=1)
+    try:
+        reader[0:10]
+        reader[20:30]
+        reader[2000:2010]
+        reader[0:10]
+        assert (reader.cache_hits, reader.cache_misses) == (1, 3)
+    finally:
+        reader.close()
+
+
+def test_plain_gzip_is_rejected(tmp_path):
+    path = str(tmp_path / 'data.gz')
+    with gzip.open(path, 'wb') as fd:
+        fd.write(b'ACGT')
+    with pytest.raises(ValueError):
+        BgzfReader(path)
+
+
+@pytest.mark.parametrize('fai', [False, True])
+def test_fasta_blocks(tmp_path, fai):
+    text = ''.join('>seq%d desc\n%s\n' % (i, '\n'.join(['ACGTTGCA' * 5] * (i + 1)) + '\nAC') for i in range(40))
+    plain_path = str(tmp_path / 'seqs.fa')
+    with open(plain_path, 'w') as fd:
+        fd.write(text)
+    path = str(tmp_path / 'seqs.fa.gz')
+    _write_bgzf(path, text.encode('ascii'), 300)
+
+    index = path + FAI_SUFFIX if fai else None
+    plain_index = plain_path + FAI_SUFFIX if fai else None
+    plain = MultipleBlockReader(plain_path, index=plain_index)
+    reader = BgzfMultipleBlockReader(path, index=index, cache_size=2)
+    try:
+        assert reader.block_list == plain.block_list
+        for label in plain.blocks():
+            expected = plain[label][:]
+            assert reader[label][:] == expected
+            assert reader[label][37:123] == expected[37:123]
+    finally:
+        reader.close()
+        plain.close()
+    assert os.path.exists(path + GZI_SUFFIX)
+
+
+def test_fasta_fetch_many(tmp_path):
+    text = ''.join('>seq%d\n%s\n' % (i, '\n'.join(['ACGTTGCAAT'] * 20)) for i in range(10))
+    plain_path = str(tmp_path / 'seqs.fa')
+    with open(plain_path, 'w') as fd:
+        fd.write(text)
+    path = str(tmp_path / 'seqs.fa.gz')
+    _write_bgzf(path, text.encode('ascii'), 200)
+
+    regions = [ ('seq%d' % (i % 10), i, i + 37, '+-'[i % 2]) for i in range(50) ]
+    plain = MultipleBlockReader(plain_path, save_index=False)
+    reader = BgzfMultipleBlockReader(path, save_index=False, cache_size=1)
+    try:
+        assert reader.fetch_many(regions) == plain.fetch_many(regions)
+    finally:
+        reader.close()
+        plain.close()
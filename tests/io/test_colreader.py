@@ -0,0 +1,176 @@
+import os
+from io import BytesIO, TextIOWrapper
+
+import pytest
+
+colreader = pytest.importorskip('vfork.io.colreader')
+Reader = colreader.Reader
+
+
+_DATA = b'1\t-2\t3.5\tx\n4\t5\n7\t8\t9e1\t\xc3\xa8\tz'
+_ROWS = [ (1, -2, 3.5, 'x', '1\t-2\t3.5\tx\n'), (4, 5, None, None, '4\t5\n'), (7, 8, 90.0, '\xe8', '7\t8\t9e1\t\xe8\tz') ]
+
+def _sources(tmp_path, data):
+    ''' Yields the same content as a file descriptor and as several file objects. '''
+    path = str(tmp_path / 'data.tsv')
+    with open(path, 'wb') as fd:
+        fd.write(data)
+
+    fileno = os.open(path, os.O_RDONLY)
+    try:
+        yield fileno
+    finally:
+        os.close(fileno)
+    yield BytesIO(data)
+    with open(path, 'rb') as fd:
+        yield fd
+    with open(path) as fd:
+        yield fd
+
+
+def test_spec_types(tmp_path):
+    for src in _sources(tmp_path, _DATA):
+        reader = Reader(src, '0u,1i,2f,3s,a')
+        assert list(reader) == _ROWS
+        assert reader.lineno() == 3
+
+
+def test_column_order():
+    assert list(Reader(BytesIO(b'1\t-2\tx\n'), '2s,1i,0u')) == [ ('x', -2, 1) ]
+    assert list(Reader(BytesIO(b'1\t-2\n3\n'), '0u')) == [ (1,), (3,) ]
+
+
+def test_missing_columns():
+    with pytest.raises(IOError) as error:
+        list(Reader(BytesIO(_DATA), '0u,1i,2f', allow_missing=False))
+    assert str(error.value) == 'insufficient token number at line 2'
+
+
+@pytest.mark.parametrize('data, spec, message', [
+    (b'1\n-1\n', '0u', 'invalid unsigned long at line 2, column 1'),
+    (b'1\t2\n3\tx\n', '1i', 'invalid long at line 2, column 2'),
+    (b'\n', '0f', 'invalid float at line 1, column 1'),
+])
+def test_invalid_values(data, spec, message):
+    reader = Reader(BytesIO(data), spec)
+    with pytest.raises(IOError) as error:
+        list(reader)
+    assert str(error.value) == message
+
+
+def test_lineno_offset():
+    reader = Reader(BytesIO(b'1\nx\n'), '0u', lineno=10)
+    assert next(reader) == (1,)
+    assert reader.lineno() == 11
+    with pytest.raises(IOError) as error:
+        next(reader)
+    assert 'at line 12' in str(error.value)
+
+
+@pytest.mark.parametrize('spec', ['', '0', 'x', '-1u', '0u,0s', '0q', '0u,,1s'])
+def test_invalid_spec(spec):
+    with pytest.raises(ValueError):
+        Reader(BytesIO(b''), spec)
+
+
+def test_invalid_source():
+    with pytest.raises(TypeError):
+        Reader('data.tsv', '0u')
+
+
+_BUFFER_SIZE = 1024 * 1024
+
+def _long_lines():
+    lines = []
+    for i, size in enumerate([ 10, _BUFFER_SIZE - 5, 3 * _BUFFER_SIZE + 7, 1, _BUFFER_SIZE, 20 ]):
+        lines.append('%d\t%s\t%d.5\n' % (i, 'ACGTNX'[i] * size, i))
+    return lines
+
+def test_long_lines(tmp_path):
+    lines = _long_lines()
+    expected = [ (i, line.split('\t')[1], i + 0.5, line) for i, line in enumerate(lines) ]
+    for src in _sources(tmp_path, ''.join(lines).encode('ascii')):
+        reader = Reader(src, '0u,1s,2f,a')
+        assert list(reader) == expected
+        assert reader.lineno() == len(lines)
+
+
+def test_many_lines_across_buffers(tmp_path):
+    lines = [ '%d\t%s\n' % (i, 'x' * (i % 100)) for i in range(50000) ]
+    for src in _sources(tmp_path, ''.join(lines).encode('ascii')):
+        assert list(Reader(src, '0u,1s')) == [ (i, 'x' * (i % 100)) for i in range(50000) ]
+
+
+def _check_columns(columns, rows):
+    import numpy as np
+
+    assert len(columns) == len(rows[0])
+    for column, values in zip(columns, zip(*rows)):
+        if type(column) is list:
+            assert column == list(values)
+        elif column.dtype == np.float64:
+            assert [ None if np.isnan(v) else v for v in column.tolist() ] == list(values)
+        else:
+            assert column.dtype == np.int64
+            assert column.tolist() == list(values)
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 10])
+def test_read_batch(size):
+    pytest.importorskip('numpy')
+    reader = Reader(BytesIO(_DATA), '0u,1i,2f,3s,a')
+    rows = []
+    while True:
+        columns = reader.read_batch(size)
+        count = len(columns[0])
+        assert all(len(column) == count for column in columns)
+        if count == 0:
+            break
+        _check_columns(columns, _ROWS[len(rows):len(rows)+count])
+        rows.extend(_ROWS[len(rows):len(rows)+count])
+    assert rows == _ROWS
+    assert reader.lineno() == 3
+
+
+def test_read_batch_mixed_with_iteration():
+    pytest.importorskip('numpy')
+    reader = Reader(BytesIO(_DATA), '0u,1i,2f,3s,a')
+    assert next(reader) == _ROWS[0]
+    _check_columns(reader.read_batch(1), _ROWS[1:2])
+    assert list(reader) == _ROWS[2:]
+
+
+@pytest.mark.parametrize('batch_size', [1, 2, 65536])
+def test_read_all(tmp_path, batch_size):
+    pytest.importorskip('numpy')
+    lines = _long_lines()
+    rows = [ (i, line.split('\t')[1], i + 0.5, line) for i, line in enumerate(lines) ]
+    for src in _sources(tmp_path, ''.join(lines).encode('ascii')):
+        reader = Reader(src, '0u,1s,2f,a')
+        _check_columns(reader.read_all(batch_size), rows)
+        assert reader.lineno() == len(lines)
+
+
+def test_read_all_empty():
+    np = pytest.importorskip('numpy')
+    ints, strings = Reader(BytesIO(b''), '0i,1s').read_all()
+    assert ints.dtype == np.int64 and len(ints) == 0
+    assert strings == []
+
+
+def test_batch_errors():
+    pytest.importorskip('numpy')
+    reader = Reader(BytesIO(b'1\t2\n3\n'), '0u,1i')
+    with pytest.raises(IOError) as error:
+        reader.read_batch(5)
+    assert str(error.value) == 'missing integer at line 2, column 2'
+
+    reader = Reader(BytesIO(b'1\n2\nx\n'), '0u', lineno=5)
+    with pytest.raises(IOError) as error:
+        reader.read_all(2)
+    assert str(error.value) == 'invalid unsigned long at line 8, column 1'
+
+    with pytest.raises(ValueError):
+        Reader(BytesIO(b''), '0u').read_batch(-1)
+    with pytest.raises(ValueError):
+        Reader(BytesIO(b''), '0u').read_all(0)
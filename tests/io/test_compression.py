@@ -0,0 +1,160 @@
+import bz2
+import gzip
+import lzma
+import zlib
+from io import BytesIO, BufferedReader, TextIOWrapper
+from shutil import which
+
+import pytest
+
+from vfork.fasta.reader import MultipleBlockStreamingReader
+from vfork.fastq.reader import FastqStreamingReader
+from vfork.io.bgzf import BgzfReader
+from vfork.io.compression import detect_compression, open_input, BlockCompressedWriter, DECOMPRESSORS
+
+
+_CONTENT = b'>a\nACGT\nAC\n>b\nGGG\n' * 1000
+# an empty BGZF member, as written at the end of BGZF files
+_BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+def _bgzf(data):
+    # a single member, followed by the EOF marker
+    member = gzip.compress(data)
+    payload = member[10:]
+    header = member[:3] + b'\x04' + member[4:10] + b'\x06\x00BC\x02\x00' + (len(payload) + 17).to_bytes(2, 'little')
+    return header + payload + _BGZF_EOF
+
+_COMPRESSORS = {
+    None:   lambda data: data,
+    'gzip': gzip.compress,
+    'bgzf': _bgzf,
+    'bz2':  bz2.compress,
+    'xz':   lzma.compress,
+}
+
+def _write(tmp_path, compression, data=_CONTENT):
+    path = str(tmp_path / ('input.%s' % compression))
+    with open(path, 'wb') as fd:
+        fd.write(_COMPRESSORS[compression](data))
+    return path
+
+
+@pytest.mark.parametrize('compression', list(_COMPRESSORS))
+def test_detect_compression(compression):
+    data = _COMPRESSORS[compression](_CONTENT)
+    assert detect_compression(data[:18]) == compression
+
+
+def test_bgzf_is_not_gzip():
+    assert detect_compression(_BGZF_EOF[:18]) == 'bgzf'
+    assert detect_compression(gzip.compress(b'')[:18]) == 'gzip'
+    # an extra field without the BC subfield
+    header = gzip.compress(b'')[:3] + b'\x04' + b'\0' * 6 + b'\x06\x00XY\x02\x00\x00\x00'
+    assert detect_compression(header) == 'gzip'
+
+
+@pytest.mark.parametrize('external', [False, True])
+@pytest.mark.parametrize('compression', list(_COMPRESSORS))
+def test_open_path(tmp_path, compression, external):
+    if external and compression is not None and \
+       all(which(command[0]) is None for command in DECOMPRESSORS[compression]):
+        pytest.skip('no external decompressor for %s' % compression)
+
+    path = _write(tmp_path, compression)
+    with open_input(path, 'rb', external=external) as fd:
+        assert fd.read() == _CONTENT
+    with open_input(path, external=external) as fd:
+        assert fd.readline() == '>a\n'
+        assert fd.read() == _CONTENT.decode('ascii')[3:]
+
+
+@pytest.mark.parametrize('external', [False, True])
+@pytest.mark.parametrize('compression', [None, 'gzip', 'bgzf'])
+def test_open_stream(compression, external):
+    data = _COMPRESSORS[compression](_CONTENT)
+    # as sys.stdin does, a text stream over a buffered binary one
+    stdin = TextIOWrapper(BufferedReader(BytesIO(data)))
+    with open_input(stdin, external=external) as fd:
+        assert fd.read() == _CONTENT.decode('ascii')
+
+    with open_input(BufferedReader(BytesIO(data)), 'rb', external=external) as fd:
+        assert fd.read() == _CONTENT
+
+
+def test_streams_without_peek():
+    fd = BytesIO(gzip.compress(_CONTENT))
+    assert open_input(fd, 'rb') is fd
+
+
+def test_invalid_mode(tmp_path):
+    with pytest.raises(ValueError):
+        open_input(_write(tmp_path, None), 'w')
+
+
+@pytest.mark.parametrize('compression', list(_COMPRESSORS))
+def test_readers(tmp_path, compression):
+    path = _write(tmp_path, compression)
+    assert list(MultipleBlockStreamingReader(path)) == [ ('a', 'ACGTAC'), ('b', 'GGG') ] * 1000
+
+    path = _write(tmp_path, compression, b'@r1\nACGT\n+\nIIII\n' * 100)
+    assert list(FastqStreamingReader(path)) == [ ('r1', 'ACGT', 'IIII') ] * 100
+
+
+def _members(data):
+    ''' Splits a gzip file into its members, returning their uncompressed content. '''
+    members = []
+    while len(data) > 0:
+        decompressor = zlib.decompressobj(31)
+        members.append(decompressor.decompress(data))
+        assert decompressor.eof
+        data = decompressor.unused_data
+    return members
+
+
+@pytest.mark.parametrize('threads', [1, 4])
+@pytest.mark.parametrize('format', ['gzip', 'bgzf'])
+def test_block_compressed_writer(tmp_path, format, threads):
+    data = bytes(range(256)) * 2000
+    path = str(tmp_path / 'data.gz')
+    with open(path, 'wb') as fd:
+        writer = BlockCompressedWriter(fd, format, threads, block_size=100000)
+        for start in range(0, 300000, 7000):
+            writer.write(data[start:start+7000])
+        writer.flush()
+        writer.write(data[301000:])
+        writer.close()
+        assert not fd.closed
+
+    with open(path, 'rb') as fd:
+        compressed = fd.read()
+    assert gzip.decompress(compressed) == data
+    assert detect_compression(compressed[:18]) == format
+
+    members = _members(compressed)
+    assert b''.join(members) == data
+    if format == 'gzip':
+        # blocks are split at block_size and at each flush
+        assert list(map(len, members)) == [ 100000 ] * 3 + [ 1000, 100000, 100000, 11000 ]
+    else:
+        assert members[-1] == b''
+        assert all(0 < len(member) <= 65280 for member in members[:-1])
+        reader = BgzfReader(path, save_index=False)
+        try:
+            assert reader[123456:234567] == data[123456:234567]
+        finally:
+            reader.close()
+
+
+def test_block_compressed_writer_errors():
+    with pytest.raises(ValueError):
+        BlockCompressedWriter(BytesIO(), 'xz')
+    with pytest.raises(ValueError):
+        BlockCompressedWriter(BytesIO(), level=0)
+
+    fd = BytesIO()
+    writer = BlockCompressedWriter(fd, threads=1, closefd=True)
+    writer.write(b'ACGT')
+    writer.close()
+    assert fd.closed
+    with pytest.raises(ValueError):
+        writer.write(b'ACGT')
@@ -0,0 +1,107 @@
+import pytest
+
+pytest.importorskip('vfork.io.colreader')
+
+from vfork.io.colreader import Reader
+from vfork.io.parallel import ParallelColumnReader
+
+
+_SPEC = '0u,1i,2f,3s,a'
+
+def _write(tmp_path, lines):
+    path = str(tmp_path / 'data.tsv')
+    with open(path, 'w') as fd:
+        fd.writelines(lines)
+    return path
+
+def _lines(count):
+    lines = []
+    for i in range(count):
+        if i % 17 == 3:
+            lines.append('%d\t%d\n' % (i, -i))
+        else:
+            lines.append('%d\t%d\t%d.25\t%s\n' % (i, -i, i, 'x' * (i % 13)))
+    return lines
+
+def _read(path, spec=_SPEC, allow_missing=True):
+    with open(path, 'rb') as fd:
+        return list(Reader(fd, spec, allow_missing))
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+@pytest.mark.parametrize('range_size', [1, 100, 1024 * 1024])
+def test_rows_in_order(tmp_path, processes, range_size):
+    lines = _lines(500)
+    # the last line has no newline
+    lines[-1] = lines[-1].rstrip('\n')
+    path = _write(tmp_path, lines)
+
+    reader = ParallelColumnReader(path, _SPEC, processes=processes, range_size=range_size, queue_depth=3)
+    try:
+        assert list(reader) == _read(path)
+    finally:
+        reader.close()
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_columns(tmp_path, processes):
+    np = pytest.importorskip('numpy')
+    path = _write(tmp_path, _lines(500))
+    with open(path, 'rb') as fd:
+        expected = Reader(fd, _SPEC).read_all()
+
+    reader = ParallelColumnReader(path, _SPEC, processes=processes, range_size=200)
+    try:
+        batches = list(reader.iter_batches(columns=True))
+        assert len(batches) > 1
+        assert sum(len(batch[0]) for batch in batches) == 500
+
+        columns = reader.read_all()
+        for column, expected_column in zip(columns, expected):
+            if type(expected_column) is list:
+                assert column == expected_column
+            else:
+                assert column.dtype == expected_column.dtype
+                np.testing.assert_array_equal(column, expected_column)
+    finally:
+        reader.close()
+
+
+def test_empty_file(tmp_path):
+    pytest.importorskip('numpy')
+    path = _write(tmp_path, [])
+    reader = ParallelColumnReader(path, '0u,1s')
+    try:
+        assert list(reader) == []
+        ints, strings = reader.read_all()
+        assert len(ints) == 0 and strings == []
+    finally:
+        reader.close()
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+@pytest.mark.parametrize('spec, allow_missing, bad_line', [
+    ('0u,1i', True, '7\tx\n'),
+    ('0u,1i,2f', False, '7\t8\n'),
+])
+def test_error_line_numbers(tmp_path, processes, spec, allow_missing, bad_line):
+    lines = [ '%d\t%d\t1.5\n' % (i, i) for i in range(300) ]
+    lines[234] = bad_line
+    path = _write(tmp_path, lines)
+
+    with pytest.raises(IOError) as expected:
+        _read(path, spec, allow_missing)
+    assert 'line 235' in str(expected.value)
+
+    reader = ParallelColumnReader(path, spec, allow_missing, processes=processes, range_size=50)
+    try:
+        with pytest.raises(IOError) as error:
+            list(reader)
+        assert str(error.value) == str(expected.value)
+    finally:
+        reader.close()
+
+
+def test_invalid_spec(tmp_path):
+    with pytest.raises(ValueError):
+        ParallelColumnReader(_write(tmp_path, _lines(3)), '0x')
@@ -0,0 +1,46 @@
+import os
+import random
+from math import ceil, log
+from operator import itemgetter
+
+import pytest
+
+import vfork.io.sort as sort_module
+from vfork.io.sort import external_sort
+
+
+@pytest.mark.parametrize('run_size', [1, 3, 10, 1000])
+def test_external_sort_is_stable(tmp_path, monkeypatch, run_size):
+    monkeypatch.setattr(sort_module, 'MAX_MERGE_WIDTH', 3)
+    rnd = random.Random(run_size)
+    items = [ (rnd.randint(0, 20), i) for i in range(500) ]
+
+    result = list(external_sort(items, itemgetter(0), run_size, str(tmp_path)))
+    assert result == sorted(items, key=itemgetter(0))
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_external_sort_cascades_merges(tmp_path, monkeypatch):
+    width = 4
+    monkeypatch.setattr(sort_module, 'MAX_MERGE_WIDTH', width)
+
+    written = []
+    write_run = sort_module._write_run
+    def counting_write_run(path, items):
+        items = list(items)
+        written.append(len(items))
+        write_run(path, items)
+    monkeypatch.setattr(sort_module, '_write_run', counting_write_run)
+
+    count = 4096
+    items = list(range(count, 0, -1))
+    assert list(external_sort(items, None, 1, str(tmp_path))) == sorted(items)
+    # each item is written once as a run, then once per merge level
+    assert sum(written) <= count * (1 + ceil(log(count, width)))
+
+
+def test_external_sort_early_close(tmp_path):
+    result = external_sort(range(100, 0, -1), None, 10, str(tmp_path))
+    assert next(result) == 1
+    result.close()
+    assert os.listdir(str(tmp_path)) == []